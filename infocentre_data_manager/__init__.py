@@ -1,5 +1,10 @@
+from infocentre_data_manager.dataset import Dataset
 from infocentre_data_manager.plugins.codecs.base import Codec
 from infocentre_data_manager.plugins.data_validators.base import DataValidator
+from infocentre_data_manager.plugins.data_validators.result import \
+    ValidationResult
+from infocentre_data_manager.plugins.data_validators.snapshot import \
+    ValidationSnapshot
 
 __short_version__ = '0.2'
 __version__ = '0.2.0'
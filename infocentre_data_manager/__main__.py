@@ -0,0 +1,4 @@
+import sys
+from infocentre_data_manager.cli import main
+
+sys.exit(main())
@@ -0,0 +1,363 @@
+""" audit.py
+
+This module includes the audit of the consistency across the tables of the
+database: the catalog (info_tables and info_vars), the references
+(ref_*_by tables) and the data tables.
+
+"""
+
+import logging
+import queue
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from infocentre_data_manager.plugins.data_validators.result import \
+    ValidationResult
+
+__all__ = ['AUDIT_CHECKS', 'audit_database', 'audit_metadata',
+           'fetch_metadata', 'load_metadata', 'save_metadata', ]
+
+logger = logging.getLogger(__name__)
+
+# Tables whose rows refer to a data table in their data_table column
+REF_TABLES = ['ref_sources_by', 'ref_notes_by', 'ref_methods_by',
+              'ref_years_by', 'ref_dates_by']
+# Iso values that are not region codes
+MISSING_ISOS = ['', '-9999', '-6666']
+# Tables listed in a message, the rest are only counted
+MAX_N_TABLES_DISPLAYED = 5
+
+
+def fetch_metadata(db_params, workers=4):
+    """
+    Reads everything the audit needs from the database. The catalog and
+    the references are read in bulk, with one query per table, and the
+    distinct isos of the data tables are read by *workers* connections in
+    parallel, so a database with thousands of tables is read in minutes.
+
+    :param dict db_params: Database parameters (host, db, user, password)
+    :param int workers: Number of connections reading the data tables
+    :returns: Dictionary of dataframes: 'tables' (info_tables), 'variables'
+        (info_vars), 'columns' (columns of each table), 'refs' (number of
+        rows of each data table in the ref_*_by tables), 'regions'
+        (dict_regions), 'isos' (number of rows of each iso in each data
+        table) and 'failed' (data tables that couldn't be read)
+    :rtype: dict
+    """
+    import pandas as pd
+
+    start = time.time()
+    conn = _connect(db_params)
+    try:
+        metadata = {
+            'tables': pd.read_sql(
+                'SELECT table_name, module, data_manager FROM info_tables',
+                con=conn),
+            'variables': pd.read_sql(
+                'SELECT data_table, name, semantic_type FROM info_vars',
+                con=conn),
+            'columns': pd.read_sql(
+                'SELECT TABLE_NAME AS table_name, '
+                ' COLUMN_NAME AS column_name '
+                'FROM information_schema.COLUMNS '
+                'WHERE TABLE_SCHEMA = DATABASE() '
+                'ORDER BY TABLE_NAME, ORDINAL_POSITION',
+                con=conn),
+            'refs': pd.read_sql(
+                ' UNION ALL '.join(
+                    'SELECT \'{0}\' AS ref_table, data_table, '
+                    ' COUNT(*) AS n_rows '
+                    'FROM {0} GROUP BY data_table'.format(ref_table)
+                    for ref_table in REF_TABLES),
+                con=conn),
+            'regions': pd.read_sql(
+                'SELECT iso3Code AS iso FROM dict_regions', con=conn),
+        }
+    finally:
+        conn.close()
+
+    columns = metadata['columns']
+    iso_tables = sorted(
+        set(columns.loc[columns['column_name'] == 'iso', 'table_name']) &
+        set(metadata['tables']['table_name']))
+    table_queue = queue.Queue()
+    for table_name in iso_tables:
+        table_queue.put(table_name)
+    workers = max(1, min(workers, len(iso_tables)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_fetch_isos, db_params, table_queue)
+                   for _ in range(workers)]
+        parts = [future.result() for future in futures]
+
+    frames = [frame for frames, _ in parts for frame in frames]
+    metadata['isos'] = pd.concat(frames, ignore_index=True) if frames \
+        else pd.DataFrame(columns=['data_table', 'iso', 'n_rows'])
+    metadata['failed'] = pd.DataFrame(
+        [entry for _, failed in parts for entry in failed],
+        columns=['data_table', 'error'])
+    logger.info('Metadata of {} tables read in {:.1f}s'.format(
+        len(metadata['tables'].index), time.time() - start))
+    return metadata
+
+
+def save_metadata(metadata, path):
+    """
+    Saves the metadata read by *fetch_metadata*, to audit it again without
+    reading the database.
+
+    :param dict metadata: Metadata
+    :param str path: Pickle file
+    """
+    import pandas as pd
+
+    pd.to_pickle(metadata, path)
+
+
+def load_metadata(path):
+    """
+    :param str path: Pickle file written by *save_metadata*
+    :returns: Metadata
+    :rtype: dict
+    """
+    import pandas as pd
+
+    return pd.read_pickle(path)
+
+
+def audit_database(db_params, workers=4, checks=None):
+    """
+    Reads the metadata of the database and audits it (see *fetch_metadata*
+    and *audit_metadata*).
+
+    :param dict db_params: Database parameters (host, db, user, password)
+    :param int workers: Number of connections reading the data tables
+    :param list checks: Names of the checks (all of them by default)
+    :rtype: ValidationResult
+    """
+    return audit_metadata(fetch_metadata(db_params, workers), checks)
+
+
+def audit_metadata(metadata, checks=None):
+    """
+    Runs the consistency checks over the metadata of the database, with
+    vectorized joins:
+
+    * *tables*: Tables in info_tables that don't exist.
+    * *orphaned_rows*: Rows of info_vars and the ref_*_by tables whose
+      data table is not in info_tables.
+    * *variables*: Variables of info_vars that are not columns of their
+      table, columns that are not in info_vars and duplicated variables.
+    * *isos*: Isos written in different ways (e.g. 'ESP' and 'esp') and
+      isos that are not in dict_regions, with the closest valid iso.
+
+    :param dict metadata: Metadata returned by *fetch_metadata*
+    :param list checks: Names of the checks (all of them by default)
+    :returns: Issues found, the *sheet* of each issue is the table where
+        it was found
+    :rtype: ValidationResult
+    """
+    if checks is None:
+        checks = list(AUDIT_CHECKS)
+    unknown = [check for check in checks if check not in AUDIT_CHECKS]
+    if unknown:
+        raise ValueError('Unknown audit checks {}'.format(
+            ', '.join(unknown)))
+
+    result = ValidationResult('Database audit')
+    for row in metadata['failed'].itertuples():
+        result.add('warning',
+                   'The table "{}" could not be read ({}).'.format(
+                       row.data_table, row.error),
+                   code='table_not_read',
+                   sheet=row.data_table)
+    for check in checks:
+        AUDIT_CHECKS[check](metadata, result)
+    if result.count() == 0:
+        result.add('info', 'No problems found.')
+    return result
+
+
+def _check_tables(metadata, result):
+    tables = metadata['tables']
+    missing = tables[~tables['table_name'].isin(
+        metadata['columns']['table_name'])]
+    for table_name in sorted(missing['table_name']):
+        result.add('error',
+                   'The table "{}" is in info_tables but it doesn\'t '
+                   'exist.'.format(table_name),
+                   code='missing_table',
+                   sheet='info_tables',
+                   column='table_name',
+                   value=table_name)
+
+
+def _check_orphaned_rows(metadata, result):
+    import pandas as pd
+
+    variables = metadata['variables'].groupby('data_table').size() \
+        .rename('n_rows').reset_index()
+    variables.insert(0, 'ref_table', 'info_vars')
+    rows = pd.concat([variables, metadata['refs']], ignore_index=True)
+    orphaned = rows[~rows['data_table'].isin(
+        metadata['tables']['table_name'])]
+    for row in orphaned.sort_values(['ref_table', 'data_table']) \
+            .itertuples():
+        result.add('error',
+                   '{} rows of {} refer to the table "{}", which is not '
+                   'in info_tables.'.format(row.n_rows, row.ref_table,
+                                            row.data_table),
+                   code='orphaned_rows',
+                   sheet=row.ref_table,
+                   column='data_table',
+                   value=row.data_table)
+
+
+def _check_variables(metadata, result):
+    tables = metadata['tables']['table_name']
+    columns = metadata['columns']
+    columns = columns[columns['table_name'].isin(tables)] \
+        .rename(columns={'table_name': 'data_table', 'column_name': 'name'})
+    variables = metadata['variables']
+    variables = variables.loc[
+        variables['data_table'].isin(columns['data_table']),
+        ['data_table', 'name']]
+
+    duplicated = variables[variables.duplicated()].drop_duplicates()
+    for row in duplicated.itertuples():
+        result.add('error',
+                   'The variable "{}" of the table "{}" is repeated in '
+                   'info_vars.'.format(row.name, row.data_table),
+                   code='duplicate_variable',
+                   sheet=row.data_table,
+                   column=row.name)
+
+    merged = variables.drop_duplicates().merge(columns, how='outer',
+                                               indicator=True)
+    merged = merged.sort_values(['data_table', 'name'])
+    for row in merged[merged['_merge'] == 'left_only'].itertuples():
+        result.add('error',
+                   'The variable "{}" of info_vars is not a column of the '
+                   'table "{}".'.format(row.name, row.data_table),
+                   code='variable_not_in_table',
+                   sheet=row.data_table,
+                   column=row.name)
+    for row in merged[merged['_merge'] == 'right_only'].itertuples():
+        result.add('error',
+                   'The column "{}" of the table "{}" is not in '
+                   'info_vars.'.format(row.name, row.data_table),
+                   code='column_not_in_variables',
+                   sheet=row.data_table,
+                   column=row.name)
+
+
+def _check_isos(metadata, result):
+    from infocentre_data_manager.plugins.semantic_types.suggestions import \
+        SuggestionIndex
+
+    isos = metadata['isos']
+    isos = isos[isos['iso'].notna()]
+    isos = isos.assign(iso=isos['iso'].astype(str))
+    isos = isos[~isos['iso'].isin(MISSING_ISOS)]
+    isos = isos.merge(
+        metadata['tables'][['table_name', 'module']]
+        .rename(columns={'table_name': 'data_table'}),
+        on='data_table', how='left')
+    # Same normalization as the iso suggestions
+    isos['key'] = isos['iso'].str.replace(r'[\W_]+', '', regex=True) \
+        .str.casefold()
+
+    n_spellings = isos.groupby('key')['iso'].nunique()
+    variants = isos[isos['key'].isin(n_spellings.index[n_spellings > 1])]
+    for key, group in variants.groupby('key'):
+        spellings = ['"{}" ({})'.format(iso, _describe_tables(tables))
+                     for iso, tables in group.groupby('iso')]
+        result.add('warning',
+                   'The iso "{}" is written in different ways: '
+                   '{}.'.format(key.upper(), ', '.join(spellings)),
+                   code='iso_variants',
+                   column='iso',
+                   value=key.upper())
+
+    regions = metadata['regions']['iso'].dropna().astype(str)
+    if len(regions.index) == 0:
+        return
+    index = SuggestionIndex(sorted(set(regions)))
+    unknown = isos[~isos['iso'].isin(regions)]
+    for iso, tables in unknown.groupby('iso'):
+        suggestions = index.suggest(iso)
+        suggestion = suggestions[0] if suggestions else None
+        result.add('error',
+                   'The iso "{}" ({}) is not in dict_regions.{}'.format(
+                       iso,
+                       _describe_tables(tables),
+                       ' Did you mean "{}"?'.format(suggestion)
+                       if suggestion is not None else ''),
+                   code='unknown_iso',
+                   column='iso',
+                   value=iso,
+                   suggestion=suggestion)
+
+
+def _describe_tables(tables):
+    """ Describes the tables (and modules) of a group of iso rows. """
+    names = sorted(set(tables['data_table']))
+    if len(names) <= MAX_N_TABLES_DISPLAYED:
+        description = 'in {}'.format(', '.join(names))
+    else:
+        description = 'in {} tables'.format(len(names))
+    modules = sorted(set(int(module) for module in tables['module'].dropna()))
+    if modules:
+        description += ', module{} {}'.format(
+            's' if len(modules) > 1 else '',
+            ', '.join(str(module) for module in modules))
+    return description
+
+
+def _fetch_isos(db_params, table_queue):
+    """ Reads the isos of the data tables of a queue until it is empty,
+    with a single connection. """
+    import pandas as pd
+
+    frames = []
+    failed = []
+    conn = _connect(db_params)
+    try:
+        while True:
+            try:
+                table_name = table_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                frame = pd.read_sql(
+                    'SELECT iso, COUNT(*) AS n_rows FROM `{}` '
+                    'GROUP BY iso'.format(table_name),
+                    con=conn)
+            except Exception as e:
+                failed.append((table_name,
+                               '{}: {}'.format(e.__class__.__name__, e)))
+                continue
+            frame.insert(0, 'data_table', table_name)
+            frames.append(frame)
+    finally:
+        conn.close()
+    return frames, failed
+
+
+def _connect(db_params):
+    import pymysql.cursors
+
+    return pymysql.connect(host=db_params['host'],
+                           user=db_params['user'],
+                           password=db_params['password'],
+                           db=db_params['db'],
+                           charset='utf8',
+                           cursorclass=pymysql.cursors.DictCursor)
+
+
+# Checks run by audit_metadata, in order
+AUDIT_CHECKS = OrderedDict([
+    ('tables', _check_tables),
+    ('orphaned_rows', _check_orphaned_rows),
+    ('variables', _check_variables),
+    ('isos', _check_isos),
+])
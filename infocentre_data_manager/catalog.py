@@ -0,0 +1,496 @@
+""" catalog.py
+
+This module includes the local catalog of the tables and variables of the
+database (or of a directory of workbooks).
+
+"""
+
+import fnmatch
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from infocentre_data_manager.plugins.semantic_types.suggestions import \
+    normalize_key
+
+__all__ = ['Catalog', 'default_catalog_path', ]
+
+logger = logging.getLogger(__name__)
+
+# Environment variable with the path of the default catalog
+CATALOG_ENV = 'DATA_MANAGER_CATALOG'
+DEFAULT_CATALOG = os.path.join('~', '.infocentre_data_manager',
+                               'catalog.json')
+# Table names per query when only some tables are read
+MAX_N_TABLES_QUERIED = 500
+
+
+def default_catalog_path():
+    """
+    :returns: Path of the catalog given by the DATA_MANAGER_CATALOG
+        environment variable, ~/.infocentre_data_manager/catalog.json by
+        default
+    :rtype: str
+    """
+    return os.path.expanduser(os.environ.get(CATALOG_ENV, DEFAULT_CATALOG))
+
+
+class Catalog(object):
+    """
+    Local index of the tables and their variables, built from the catalog
+    tables of the database (info_tables, info_vars and ref_dates_by) or
+    from a directory of workbooks, and saved as a JSON file.
+
+    Updates are incremental: tables are only read again if their version
+    (increased by *MySQLCodec.store*) or their workbook (modification time
+    and size) changed. Lookups (tables with a variable, a semantic type or
+    a data manager, ...) are answered from dictionaries built once after
+    each update, in microseconds.
+
+    Each table is described by a dictionary with its 'table_name',
+    'module', 'data_manager', 'contents', 'variables' (list of [name,
+    semantic type] in their order), 'last_date' (latest delivery or
+    publication date, 'YYYY-MM-DD') and 'source' (database or workbook).
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path=None):
+        """
+        :param str path: JSON file of the catalog, loaded if it exists
+            (see *save*)
+        """
+        self.path = path
+        # {table name: table description}
+        self._tables = {}
+        # {source: change marker}, a database source has the version of
+        # each of its tables and a workbook its modification time and size
+        self._markers = {}
+        self._index = None
+        if path is not None and os.path.exists(path):
+            with open(path) as catalog_file:
+                content = json.load(catalog_file)
+            if content.get('format_version') == Catalog.FORMAT_VERSION:
+                self._tables = content['tables']
+                self._markers = content['markers']
+            else:
+                logger.warning('Unknown catalog format in {}, it will be '
+                               'built again'.format(path))
+
+    def save(self, path=None):
+        """
+        Writes the catalog, replacing the previous file atomically.
+
+        :param str path: JSON file (the one it was loaded from by default)
+        """
+        path = path or self.path
+        if path is None:
+            raise ValueError('No catalog path provided')
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = '{}.tmp'.format(path)
+        with open(tmp_path, 'w') as catalog_file:
+            json.dump({'format_version': Catalog.FORMAT_VERSION,
+                       'tables': self._tables,
+                       'markers': self._markers},
+                      catalog_file)
+        os.replace(tmp_path, path)
+
+    def update_from_database(self, db_params, full=False):
+        """
+        Updates the tables of a database. info_tables is read as a whole
+        (it is small), but info_vars and ref_dates_by are only read for
+        the new tables and for those whose version changed. Tables without
+        a version (e.g. stored without the MySQL codec) are read again when
+        MySQL reports a new update time of their data table, as in
+        *fetch_marker*, and otherwise only when they are new or with *full*.
+
+        :param dict db_params: Database parameters (host, db, user,
+            password)
+        :param bool full: Read all the tables again
+        :returns: Number of tables read and removed
+        :rtype: tuple
+        """
+        import pandas as pd
+        from infocentre_data_manager.plugins.codecs.mysql_cache import \
+            VERSION_TABLE
+        from pymysql.constants import ER
+        from pymysql.err import ProgrammingError
+
+        source = 'mysql://{}/{}'.format(db_params['host'], db_params['db'])
+        previous = self._markers.get(source, {})
+        conn = _connect(db_params)
+        try:
+            tables = pd.read_sql(
+                'SELECT table_name, module, data_manager, contents '
+                'FROM info_tables',
+                con=conn)
+            try:
+                versions = pd.read_sql(
+                    'SELECT table_name, version FROM {}'.format(
+                        VERSION_TABLE),
+                    con=conn)
+            except Exception as e:
+                cause = getattr(e, '__cause__', None) or e
+                if not isinstance(cause, ProgrammingError) or \
+                        cause.args[0] != ER.NO_SUCH_TABLE:
+                    raise
+                # Nothing has been stored with the codec yet
+                versions = pd.DataFrame(columns=['table_name', 'version'])
+            versions = dict((table_name, int(version))
+                            for table_name, version
+                            in zip(versions['table_name'],
+                                   versions['version']))
+            if any(table_name not in versions
+                   for table_name in tables['table_name']):
+                update_times = _update_times(conn)
+            else:
+                update_times = {}
+            # The version, or the update time (a string) without it
+            markers = dict((table_name,
+                            versions.get(table_name,
+                                         update_times.get(table_name)))
+                           for table_name in tables['table_name'])
+            changed = [table_name for table_name, version in markers.items()
+                       if full or table_name not in previous or
+                       version != previous[table_name] or
+                       self._tables.get(table_name, {}).get('source') !=
+                       source]
+            variables, dates = self._read_database_tables(
+                conn, changed, len(changed) == len(markers))
+        finally:
+            conn.close()
+
+        removed = [table_name for table_name in previous
+                   if table_name not in markers]
+        for table_name in removed:
+            self._remove_table(table_name, source)
+        changed = set(changed)
+        for row in tables.itertuples():
+            if row.table_name in changed:
+                entry = {
+                    'table_name': row.table_name,
+                    'variables': variables.get(row.table_name, []),
+                    'last_date': dates.get(row.table_name),
+                    'source': source,
+                }
+            else:
+                entry = self._tables[row.table_name]
+            # The general information is always up to date
+            entry['module'] = None if pd.isna(row.module) \
+                else int(row.module)
+            entry['data_manager'] = _as_str(row.data_manager)
+            entry['contents'] = _as_str(row.contents)
+            self._tables[row.table_name] = entry
+        self._markers[source] = markers
+        self._index = None
+        logger.info('Catalog of {}: {} tables read, {} removed'.format(
+            source, len(changed), len(removed)))
+        return len(changed), len(removed)
+
+    def update_from_directory(self, directory, pattern='*.xlsx', workers=1):
+        """
+        Updates the tables of a directory of workbooks (excel codec
+        format). Only new and modified workbooks are read, and the tables
+        of deleted workbooks are removed.
+
+        :param str directory: Directory with the workbooks
+        :param str pattern: Pattern of the workbook names
+        :param int workers: Number of processes reading workbooks
+        :returns: Number of workbooks read and removed
+        :rtype: tuple
+        """
+        directory = os.path.abspath(directory)
+        files = {}
+        for entry in os.scandir(directory):
+            if entry.is_file() and fnmatch.fnmatch(entry.name, pattern) \
+                    and not entry.name.startswith('~$'):
+                stat = entry.stat()
+                files[entry.path] = [stat.st_mtime_ns, stat.st_size]
+
+        in_directory = [path for path in self._markers
+                        if os.path.dirname(path) == directory]
+        removed = [path for path in in_directory if path not in files]
+        for path in removed:
+            self._remove_source(path)
+        changed = sorted(path for path, marker in files.items()
+                         if self._markers.get(path) != marker)
+
+        if workers > 1 and len(changed) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                entries = list(executor.map(_read_workbook, changed))
+        else:
+            entries = [_read_workbook(path) for path in changed]
+
+        n_read = 0
+        for path, entry in zip(changed, entries):
+            self._remove_source(path)
+            if isinstance(entry, Exception):
+                logger.warning('{} could not be read ({}: {})'.format(
+                    path, entry.__class__.__name__, entry))
+                continue
+            self._tables[entry['table_name']] = entry
+            self._markers[path] = files[path]
+            n_read += 1
+        self._index = None
+        logger.info('Catalog of {}: {} workbooks read, {} removed'.format(
+            directory, n_read, len(removed)))
+        return n_read, len(removed)
+
+    def table(self, table_name):
+        """
+        :param str table_name: Table name
+        :returns: Description of the table, None if it isn't in the catalog
+        :rtype: dict
+        """
+        return self._tables.get(table_name)
+
+    def table_names(self):
+        """
+        :returns: Names of all the tables
+        :rtype: list
+        """
+        return sorted(self._tables)
+
+    def tables_with_variable(self, name):
+        """
+        :param str name: Variable name
+        :returns: Names of the tables with the variable
+        :rtype: tuple
+        """
+        return self._get_index()['variables'].get(name, ())
+
+    def tables_with_type(self, semantic_type):
+        """
+        :param str semantic_type: Semantic type
+        :returns: Names of the tables with variables of the type
+        :rtype: tuple
+        """
+        return self._get_index()['types'].get(semantic_type, ())
+
+    def tables_of_data_manager(self, data_manager):
+        """
+        :param str data_manager: Data manager (case insensitive)
+        :returns: Names of the tables handled by the data manager, the
+            latest first (see 'last_date')
+        :rtype: tuple
+        """
+        return self._get_index()['data_managers'].get(
+            _as_str(data_manager).strip().casefold(), ())
+
+    def variable_types(self, name):
+        """
+        :param str name: Variable name
+        :returns: Tables of each semantic type of the variable, as
+            {type: tables}
+        :rtype: dict
+        """
+        return self._get_index()['variable_types'].get(name, {})
+
+    def variable_spellings(self, name):
+        """
+        :param str name: Variable name
+        :returns: Tables of each variable written like this one, ignoring
+            case and punctuation (e.g. 'age_group' and 'AgeGroup'), as
+            {variable: tables}
+        :rtype: dict
+        """
+        spellings = self._get_index()['spellings'].get(normalize_key(name),
+                                                       ())
+        variables = self._get_index()['variables']
+        return dict((spelling, variables[spelling])
+                    for spelling in spellings)
+
+    def __len__(self):
+        return len(self._tables)
+
+    def __contains__(self, table_name):
+        return table_name in self._tables
+
+    def _get_index(self):
+        if self._index is None:
+            variables = defaultdict(set)
+            types = defaultdict(set)
+            variable_types = defaultdict(lambda: defaultdict(set))
+            spellings = defaultdict(set)
+            data_managers = defaultdict(list)
+            for table_name, entry in self._tables.items():
+                for name, semantic_type in entry['variables']:
+                    variables[name].add(table_name)
+                    types[semantic_type].add(table_name)
+                    variable_types[name][semantic_type].add(table_name)
+                    spellings[normalize_key(name)].add(name)
+                data_manager = (entry.get('data_manager') or '').strip()
+                if data_manager:
+                    data_managers[data_manager.casefold()].append(
+                        (entry.get('last_date') or '', table_name))
+            self._index = {
+                'variables': _sorted_values(variables),
+                'types': _sorted_values(types),
+                'variable_types': dict(
+                    (name, _sorted_values(tables))
+                    for name, tables in variable_types.items()),
+                'spellings': _sorted_values(spellings),
+                # Latest first, tables without dates at the end
+                'data_managers': dict(
+                    (data_manager,
+                     tuple(table_name for _, table_name in sorted(
+                         sorted(tables, key=lambda x: x[1]),
+                         key=lambda x: x[0], reverse=True)))
+                    for data_manager, tables in data_managers.items()),
+            }
+        return self._index
+
+    def _read_database_tables(self, conn, table_names, all_tables):
+        """
+        :returns: Variables of each table and their last dates
+        :rtype: tuple
+        """
+        import pandas as pd
+
+        variables = defaultdict(list)
+        dates = {}
+        if not table_names:
+            return variables, dates
+        if all_tables:
+            batches = [None]
+        else:
+            batches = [table_names[i:i + MAX_N_TABLES_QUERIED]
+                       for i in range(0, len(table_names),
+                                      MAX_N_TABLES_QUERIED)]
+        for batch in batches:
+            if batch is None:
+                where, params = '', None
+            else:
+                where = 'WHERE data_table IN ({}) '.format(
+                    ', '.join(['%s'] * len(batch)))
+                params = batch
+            table_vars = pd.read_sql(
+                'SELECT data_table, name, semantic_type FROM info_vars '
+                '{}ORDER BY data_table, `order`'.format(where),
+                con=conn, params=params)
+            for row in table_vars.itertuples():
+                variables[row.data_table].append(
+                    [row.name, _as_str(row.semantic_type)])
+            table_dates = pd.read_sql(
+                'SELECT data_table, MAX(date_delivery) AS date_delivery, '
+                ' MAX(date_published) AS date_published '
+                'FROM ref_dates_by {}GROUP BY data_table'.format(where),
+                con=conn, params=params)
+            for row in table_dates.itertuples():
+                dates[row.data_table] = _last_date(
+                    [row.date_delivery, row.date_published])
+        return variables, dates
+
+    def _remove_source(self, source):
+        self._markers.pop(source, None)
+        for table_name in [table_name
+                           for table_name, entry in self._tables.items()
+                           if entry['source'] == source]:
+            del self._tables[table_name]
+        self._index = None
+
+    def _remove_table(self, table_name, source):
+        entry = self._tables.get(table_name)
+        if entry is not None and entry['source'] == source:
+            del self._tables[table_name]
+
+
+def _read_workbook(path):
+    """ Reads the description of the table of a workbook (the exception
+    raised, if it can't be read). """
+    from infocentre_data_manager.plugins.codecs.excel import ExcelCodec
+
+    try:
+        # Only the metadata sheets are read, the workbook is closed after
+        with ExcelCodec().load(file=path) as data:
+            general = data['general'].iloc[0]
+            variables = data['variables']
+            try:
+                dates = data['dates']
+            except ValueError:  # No DATES sheet
+                dates = None
+            last_date = None
+            if dates is not None:
+                last_date = _last_date(
+                    [value for column in ['date_delivery', 'date_published']
+                     if column in dates.columns
+                     for value in dates[column]])
+        # Same as MySQLCodec.store
+        module_strings = re.findall(r'_m([\d]+)_',
+                                    _as_str(general['table_name']))
+        return {
+            'table_name': _as_str(general['table_name']),
+            'module': int(module_strings[0]) if module_strings else None,
+            'data_manager': _as_str(general['data_manager']),
+            'contents': _as_str(general['contents']),
+            'variables': [[_as_str(name), _as_str(semantic_type)]
+                          for name, semantic_type
+                          in zip(variables['variable'], variables['type'])],
+            'last_date': last_date,
+            'source': path,
+        }
+    except Exception as e:
+        return e
+
+
+def _last_date(values):
+    """ Latest of some dates (date objects or 'YYYY-MM-DD' strings). """
+    import pandas as pd
+
+    dates = []
+    for value in values:
+        if _as_str(value) in ['', '-9999', 'NaT']:
+            continue
+        try:
+            dates.append(str(pd.Timestamp(value).date()))
+        except ValueError:
+            continue  # Not a date, reported by the validators
+    return max(dates) if dates else None
+
+
+def _as_str(value):
+    import pandas as pd
+
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ''
+    return str(value)
+
+
+def _sorted_values(sets):
+    return dict((key, tuple(sorted(values))) for key, values in sets.items())
+
+
+def _update_times(conn):
+    """ Update times reported by MySQL of the tables of the database. """
+    import pandas as pd
+    from pymysql.err import OperationalError
+
+    with conn.cursor() as cursor:
+        try:
+            # MySQL 8 caches the table statistics for a day by default
+            cursor.execute('SET SESSION information_schema_stats_expiry = 0')
+        except OperationalError:
+            pass  # Unknown variable before MySQL 8
+    update_times = pd.read_sql(
+        'SELECT TABLE_NAME AS table_name, UPDATE_TIME AS update_time '
+        'FROM information_schema.TABLES '
+        'WHERE TABLE_SCHEMA = DATABASE() AND UPDATE_TIME IS NOT NULL',
+        con=conn)
+    return dict((table_name, str(update_time))
+                for table_name, update_time
+                in zip(update_times['table_name'],
+                       update_times['update_time']))
+
+
+def _connect(db_params):
+    import pymysql.cursors
+
+    return pymysql.connect(host=db_params['host'],
+                           user=db_params['user'],
+                           password=db_params['password'],
+                           db=db_params['db'],
+                           charset='utf8',
+                           cursorclass=pymysql.cursors.DictCursor)
@@ -0,0 +1,386 @@
+""" cli.py
+
+This module includes the command line interface of the data manager.
+
+Heavy dependencies (pandas, database drivers, ...) are only imported by the
+plugins that need them, so commands like *list-plugins* start quickly.
+
+"""
+
+import argparse
+import json
+import sys
+from infocentre_data_manager.plugins.codecs.base import Codec
+from infocentre_data_manager.plugins.data_validators.base import DataValidator
+from infocentre_data_manager.plugins.semantic_types.base import SemanticType
+
+__all__ = ['main', ]
+
+PLUGIN_TYPES = {
+    'codecs': Codec,
+    'data_validators': DataValidator,
+    'semantic_types': SemanticType,
+}
+
+
+def main(argv=None):
+    """
+    Runs a data manager command.
+
+    :param list argv: Command line arguments (defaults to sys.argv)
+    :returns: Exit status
+    :rtype: int
+    """
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    if not hasattr(args, 'command'):
+        parser.print_help()
+        return 2
+    return args.command(args) or 0
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(
+        prog='infocentre-data-manager',
+        description='HPV Information Centre data manager')
+    subparsers = parser.add_subparsers()
+
+    list_parser = subparsers.add_parser(
+        'list-plugins', help='List the available plugins')
+    list_parser.add_argument('type', nargs='?', choices=sorted(PLUGIN_TYPES),
+                             help='Plugin type (all types by default)')
+    list_parser.set_defaults(command=_list_plugins)
+
+    convert_parser = subparsers.add_parser(
+        'convert', help='Convert data from one codec to another')
+    convert_parser.add_argument('src_codec', help='Source codec id')
+    convert_parser.add_argument('dst_codec', help='Destination codec id')
+    convert_parser.add_argument('-s', '--src-param', action='append',
+                                default=[], metavar='KEY=VALUE',
+                                help='Source codec parameter')
+    convert_parser.add_argument('-d', '--dst-param', action='append',
+                                default=[], metavar='KEY=VALUE',
+                                help='Destination codec parameter')
+    convert_parser.set_defaults(command=_convert)
+
+    validate_parser = subparsers.add_parser(
+        'validate', help='Validate data loaded with a codec')
+    validate_parser.add_argument('codec', help='Codec id')
+    validate_parser.add_argument('-p', '--param', action='append',
+                                 default=[], metavar='KEY=VALUE',
+                                 help='Codec parameter')
+    validate_parser.add_argument('-v', '--validators', nargs='+',
+                                 default=['basic'], metavar='VALIDATOR',
+                                 help='Validator ids (default: basic)')
+    validate_parser.add_argument('-a', '--validator-args', default='{}',
+                                 metavar='JSON',
+                                 help='Validator arguments, e.g. '
+                                      '\'{"type": {"HOST": "..."}}\'')
+    validate_parser.add_argument('--json', action='store_true',
+                                 help='Print the results as JSON')
+    validate_parser.add_argument('--fail-fast', action='store_true',
+                                 help='Stop after the first validator '
+                                      'with errors')
+    validate_parser.add_argument('--max-errors', type=int, metavar='N',
+                                 help='Stop each validator after N errors '
+                                      '(if supported)')
+    validate_parser.add_argument('--chunk-size', type=int, metavar='N',
+                                 help='Read the data in chunks of N rows '
+                                      '(excel and mysql codecs)')
+    validate_parser.add_argument('-j', '--jobs', type=int, default=1,
+                                 help='Threads validating chunks in '
+                                      'parallel (with --chunk-size)')
+    validate_parser.set_defaults(command=_validate)
+
+    watch_parser = subparsers.add_parser(
+        'watch', help='Validate (and store) the excel files dropped in a '
+                      'directory')
+    watch_parser.add_argument('directory', help='Watched directory')
+    watch_parser.add_argument('-v', '--validators', nargs='+',
+                              default=['basic'], metavar='VALIDATOR',
+                              help='Validator ids (default: basic)')
+    watch_parser.add_argument('-a', '--validator-args', default='{}',
+                              metavar='JSON', help='Validator arguments')
+    watch_parser.add_argument('-s', '--store-param', action='append',
+                              default=[], metavar='KEY=VALUE',
+                              help='MySQL codec store parameter, valid '
+                                   'files are only stored if given')
+    watch_parser.add_argument('-j', '--journal', metavar='FILE',
+                              help='JSON lines file with the results')
+    watch_parser.add_argument('-w', '--workers', type=int, default=2,
+                              help='Files processed at the same time')
+    watch_parser.add_argument('--settle-seconds', type=float, default=2.0,
+                              help='Time without changes before a file is '
+                                   'processed')
+    watch_parser.add_argument('--skip-existing', action='store_true',
+                              help='Ignore the files already in the '
+                                   'directory')
+    watch_parser.add_argument('--snapshots', type=int, default=16,
+                              metavar='N',
+                              help='Tables whose last validation is kept '
+                                   'to only validate their changed rows '
+                                   'when resubmitted (default: 16, 0 '
+                                   'disables it)')
+    watch_parser.set_defaults(command=_watch)
+
+    serve_parser = subparsers.add_parser(
+        'serve', help='Run the HTTP validation service')
+    serve_parser.add_argument('-v', '--validators', nargs='+',
+                              default=['basic'], metavar='VALIDATOR',
+                              help='Validator ids (default: basic)')
+    serve_parser.add_argument('-a', '--validator-args', default='{}',
+                              metavar='JSON', help='Validator arguments')
+    serve_parser.add_argument('--host', default='127.0.0.1',
+                              help='Listening address (default: 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, default=8700,
+                              help='Listening port (default: 8700)')
+    serve_parser.add_argument('--unix-socket', metavar='PATH',
+                              help='Listen on a Unix socket instead')
+    serve_parser.add_argument('--file-directory', metavar='PATH',
+                              help='Directory whose workbooks can be '
+                                   'validated by path (default: only '
+                                   'uploaded workbooks)')
+    serve_parser.add_argument('-w', '--workers', type=int, default=4,
+                              help='Simultaneous validations')
+    serve_parser.set_defaults(command=_serve)
+
+    audit_parser = subparsers.add_parser(
+        'audit', help='Check the consistency across the tables of the '
+                      'database')
+    audit_parser.add_argument('-p', '--param', action='append', default=[],
+                              metavar='KEY=VALUE',
+                              help='Database parameter (host, db, user, '
+                                   'password)')
+    audit_parser.add_argument('-c', '--checks', nargs='+',
+                              metavar='CHECK',
+                              help='Checks to run (all by default): tables, '
+                                   'orphaned_rows, variables, isos')
+    audit_parser.add_argument('-j', '--jobs', type=int, default=4,
+                              help='Connections reading the data tables in '
+                                   'parallel (default: 4)')
+    audit_parser.add_argument('--save', metavar='FILE',
+                              help='Save the metadata read from the '
+                                   'database')
+    audit_parser.add_argument('--load', metavar='FILE',
+                              help='Audit the metadata saved with --save '
+                                   'instead of the database')
+    audit_parser.add_argument('--json', action='store_true',
+                              help='Print the issues as JSON')
+    audit_parser.set_defaults(command=_audit)
+
+    catalog_parser = subparsers.add_parser(
+        'catalog', help='Update or query the local catalog of tables and '
+                        'variables')
+    catalog_subparsers = catalog_parser.add_subparsers()
+
+    update_parser = catalog_subparsers.add_parser(
+        'update', help='Update the catalog from the database or a '
+                       'directory of workbooks')
+    update_parser.add_argument('-f', '--file', metavar='FILE',
+                               help='Catalog file (default: '
+                                    '$DATA_MANAGER_CATALOG or '
+                                    '~/.infocentre_data_manager/'
+                                    'catalog.json)')
+    update_parser.add_argument('-p', '--param', action='append', default=[],
+                               metavar='KEY=VALUE',
+                               help='Database parameter (host, db, user, '
+                                    'password)')
+    update_parser.add_argument('-d', '--directory',
+                               help='Directory of workbooks, instead of '
+                                    'the database')
+    update_parser.add_argument('--pattern', default='*.xlsx',
+                               help='Workbook names (default: *.xlsx)')
+    update_parser.add_argument('-w', '--workers', type=int, default=1,
+                               help='Processes reading workbooks')
+    update_parser.add_argument('--full', action='store_true',
+                               help='Read all the database tables again')
+    update_parser.set_defaults(command=_catalog_update)
+
+    find_parser = catalog_subparsers.add_parser(
+        'find', help='Find tables in the catalog')
+    find_parser.add_argument('-f', '--file', metavar='FILE',
+                             help='Catalog file')
+    find_group = find_parser.add_mutually_exclusive_group(required=True)
+    find_group.add_argument('--variable', help='Tables with a variable')
+    find_group.add_argument('--type', help='Tables with a semantic type')
+    find_group.add_argument('--data-manager',
+                            help='Tables of a data manager, latest first')
+    find_group.add_argument('--table', help='Description of a table')
+    find_parser.set_defaults(command=_catalog_find)
+
+    return parser
+
+
+def _parse_params(params):
+    """ Parses KEY=VALUE parameters, values are decoded as JSON if
+    possible (e.g. numbers or booleans) and kept as strings otherwise. """
+    parsed = {}
+    for param in params:
+        key, sep, value = param.partition('=')
+        if not sep:
+            raise SystemExit('Invalid parameter "{}", KEY=VALUE '
+                             'expected'.format(param))
+        try:
+            parsed[key] = json.loads(value)
+        except ValueError:
+            parsed[key] = value
+    return parsed
+
+
+def _list_plugins(args):
+    plugin_types = [args.type] if args.type else sorted(PLUGIN_TYPES)
+    for plugin_type in plugin_types:
+        print('{}:'.format(plugin_type))
+        for name in sorted(PLUGIN_TYPES[plugin_type].get_plugin_names()):
+            print('  {}'.format(name))
+
+
+def _convert(args):
+    Codec.convert(args.src_codec,
+                  _parse_params(args.src_param),
+                  args.dst_codec,
+                  _parse_params(args.dst_param))
+
+
+def _validate(args):
+    validator_args = json.loads(args.validator_args)
+    codec = Codec.get(args.codec)
+    params = _parse_params(args.param)
+    data = codec.load(**params)
+    validators = [{'name': name, 'args': validator_args.get(name, {})}
+                  for name in args.validators]
+    if args.chunk_size is None:
+        results = DataValidator.apply(data, validators,
+                                      fail_fast=args.fail_fast,
+                                      max_errors=args.max_errors)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        chunks = codec.load_chunks(args.chunk_size, **params)
+        executor = ThreadPoolExecutor(args.jobs) if args.jobs > 1 else None
+        try:
+            results = DataValidator.apply_chunked(
+                data, chunks, validators,
+                fail_fast=args.fail_fast,
+                max_errors=args.max_errors,
+                executor=executor,
+                max_pending=2 * args.jobs)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print('== {}'.format(result['type']))
+            for level in ['errors', 'warnings', 'info']:
+                for message in result[level]:
+                    print('  [{}] {}'.format(level, message))
+
+    n_errors = sum(len(result['errors']) for result in results)
+    return 1 if n_errors > 0 else 0
+
+
+def _audit(args):
+    import logging
+    from infocentre_data_manager import audit
+
+    logging.basicConfig(level=logging.INFO)
+    if args.load is not None:
+        metadata = audit.load_metadata(args.load)
+    else:
+        metadata = audit.fetch_metadata(_parse_params(args.param),
+                                        workers=args.jobs)
+    if args.save is not None:
+        audit.save_metadata(metadata, args.save)
+    try:
+        result = audit.audit_metadata(metadata, args.checks)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    if args.json:
+        print(result.to_json(indent=2))
+    else:
+        result_dict = result.to_dict()
+        print('== {}'.format(result_dict['type']))
+        for level in ['errors', 'warnings', 'info']:
+            for message in result_dict[level]:
+                print('  [{}] {}'.format(level, message))
+    return 1 if result.has_errors else 0
+
+
+def _catalog_update(args):
+    import logging
+    from infocentre_data_manager.catalog import Catalog, \
+        default_catalog_path
+
+    logging.basicConfig(level=logging.INFO)
+    catalog = Catalog(args.file or default_catalog_path())
+    if args.directory is not None:
+        catalog.update_from_directory(args.directory, pattern=args.pattern,
+                                      workers=args.workers)
+    else:
+        catalog.update_from_database(_parse_params(args.param),
+                                     full=args.full)
+    catalog.save()
+    print('{} tables in {}'.format(len(catalog), catalog.path))
+
+
+def _catalog_find(args):
+    from infocentre_data_manager.catalog import Catalog, \
+        default_catalog_path
+
+    catalog = Catalog(args.file or default_catalog_path())
+    if args.table is not None:
+        table = catalog.table(args.table)
+        if table is None:
+            return 1
+        print(json.dumps(table, indent=2))
+        return 0
+    if args.variable is not None:
+        tables = catalog.tables_with_variable(args.variable)
+    elif args.type is not None:
+        tables = catalog.tables_with_type(args.type)
+    else:
+        tables = catalog.tables_of_data_manager(args.data_manager)
+    for table_name in tables:
+        print(table_name)
+    return 0 if tables else 1
+
+
+def _watch(args):
+    import logging
+    from infocentre_data_manager.watcher import FolderWatcher
+
+    logging.basicConfig(level=logging.INFO)
+    validator_args = json.loads(args.validator_args)
+    watcher = FolderWatcher(
+        args.directory,
+        [{'name': name, 'args': validator_args.get(name, {})}
+         for name in args.validators],
+        store_params=_parse_params(args.store_param) or None,
+        journal=args.journal,
+        workers=args.workers,
+        settle_seconds=args.settle_seconds,
+        process_existing=not args.skip_existing,
+        snapshots=args.snapshots)
+    watcher.run()
+
+
+def _serve(args):
+    import logging
+    from infocentre_data_manager.service import ValidationService, serve
+
+    logging.basicConfig(level=logging.INFO)
+    validator_args = json.loads(args.validator_args)
+    service = ValidationService(
+        [{'name': name, 'args': validator_args.get(name, {})}
+         for name in args.validators],
+        workers=args.workers)
+    serve(service, host=args.host, port=args.port,
+          unix_socket=args.unix_socket, file_directory=args.file_directory)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
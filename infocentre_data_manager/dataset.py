@@ -0,0 +1,131 @@
+""" dataset.py
+
+This module includes the lazy container used by the codecs to return HPV
+Information Centre data.
+
+"""
+
+from collections.abc import MutableMapping
+
+__all__ = ['Dataset', ]
+
+
+class Dataset(MutableMapping):
+    """
+    Mapping with the HPV Information Centre data structure (see
+    :ref:`codecs`) where each dataframe is only loaded the first time it is
+    accessed.
+
+    Codecs build it with a dictionary of loaders, i.e. callables without
+    arguments that return the corresponding dataframe (e.g. a single excel
+    sheet read or a single SQL query). Values can also be set directly, in
+    which case they are never loaded from the source.
+
+    Sources kept open by the loaders (e.g. a workbook) are released with
+    *close*, or at the end of a ``with`` block. Values accessed later are
+    still loaded, opening the source again.
+    """
+
+    def __init__(self, loaders=None, close=None, **frames):
+        """
+        :param dict loaders: Dictionary with elements {key: callable}
+        :param close: Callable without arguments that releases the source
+            of the loaders
+        :param dict frames: Already loaded values
+        """
+        self._loaders = dict(loaders or {})
+        self._frames = dict(frames)
+        self._keys = list(self._loaders) + [key for key in self._frames
+                                            if key not in self._loaders]
+        self._close = close
+
+    def __getitem__(self, key):
+        try:
+            return self._frames[key]
+        except KeyError:
+            pass
+        loader = self._loaders[key]
+        value = loader()
+        self._frames[key] = value
+        del self._loaders[key]
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._keys.append(key)
+        self._loaders.pop(key, None)
+        self._frames[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._frames.pop(key, None)
+        self._loaders.pop(key, None)
+        self._keys.remove(key)
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._frames or key in self._loaders
+
+    def __repr__(self):
+        return '{}(loaded={}, pending={})'.format(
+            self.__class__.__name__,
+            sorted(self._frames),
+            sorted(self._loaders))
+
+    def __getstate__(self):
+        # Loaders are usually closures over files or connections, so the
+        # pickled representation is always the fully loaded one.
+        return {'_loaders': {},
+                '_frames': self.to_dict(),
+                '_keys': list(self._keys),
+                '_close': None}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Releases the source of the pending values, if it is open.
+        """
+        if self._close is not None:
+            self._close()
+
+    def is_loaded(self, key):
+        """
+        Checks whether a value has already been loaded from the source.
+
+        :param str key: Data key (e.g. 'general', 'data', ...)
+        :returns: True if the value is in memory
+        :rtype: bool
+        """
+        return key in self._frames
+
+    def load_all(self):
+        """
+        Loads every pending value from the source.
+
+        :returns: The dataset itself
+        :rtype: Dataset
+        """
+        for key in list(self._loaders):
+            self[key]
+        return self
+
+    def to_dict(self):
+        """
+        Loads every pending value and returns them as a plain dictionary.
+
+        :returns: Dictionary with elements {key: dataframe}
+        :rtype: dict
+        """
+        self.load_all()
+        return {key: self._frames[key] for key in self._keys}
@@ -0,0 +1,77 @@
+""" migration.py
+
+This module includes the batch migration of old excel templates to any
+other codec.
+
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from infocentre_data_manager.plugins.codecs.base import Codec
+from infocentre_data_manager.plugins.codecs.old_excel import OldExcelCodec
+
+__all__ = ['migrate_old_excel', ]
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_old_excel(files, dst_codec, dst_params, db_params,
+                      processes=None):
+    """
+    Converts old excel templates with a pool of processes. The publication
+    dates of all the tables are fetched once from the database instead of
+    once per file.
+
+    String values of *dst_params* can include the *{table_name}* and
+    *{name}* (file name without extension) fields, e.g.
+    ``{'file': 'staging/{table_name}.pkl'}``.
+
+    :param list files: Old excel templates
+    :param str dst_codec: Codec id (will store the data)
+    :param dict dst_params: Parameters passed to the destination codec
+    :param dict db_params: Database parameters (host, db, user, password)
+        to fetch the publication dates
+    :param int processes: Number of worker processes (defaults to the
+        number of CPUs)
+    :returns: One entry per file (in the same order) with the keys *file*,
+        *table_name*, *status* ('ok' or 'failed'), *error* and *seconds*
+    :rtype: list
+    """
+    publication_dates = \
+        OldExcelCodec().prefetch_publication_dates(**db_params)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(_migrate_file,
+                                   excel_file,
+                                   publication_dates,
+                                   dst_codec,
+                                   dst_params)
+                   for excel_file in files]
+        report = [future.result() for future in futures]
+
+    n_failed = sum(1 for entry in report if entry['status'] != 'ok')
+    logger.info('{} files migrated, {} failed'.format(
+        len(report) - n_failed, n_failed))
+    return report
+
+
+def _migrate_file(excel_file, publication_dates, dst_codec, dst_params):
+    start = time.time()
+    entry = {'file': excel_file, 'table_name': None,
+             'status': 'ok', 'error': None}
+    try:
+        data = OldExcelCodec().load(file=excel_file,
+                                    publication_dates=publication_dates)
+        table_name = data['general']['table_name'].iloc[0]
+        entry['table_name'] = table_name
+        name = os.path.splitext(os.path.basename(excel_file))[0]
+        params = {key: value.format(table_name=table_name, name=name)
+                  if isinstance(value, str) else value
+                  for key, value in dst_params.items()}
+        Codec.get(dst_codec).store(data, **params)
+    except Exception as e:
+        entry['status'] = 'failed'
+        entry['error'] = '{}: {}'.format(e.__class__.__name__, e)
+    entry['seconds'] = time.time() - start
+    return entry
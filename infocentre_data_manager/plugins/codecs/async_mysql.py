@@ -0,0 +1,200 @@
+""" async_mysql.py
+
+This module includes an asyncio interface for the MySQL codec.
+
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from infocentre_data_manager.plugins.codecs.mysql import MySQLCodec
+from infocentre_data_manager.plugins.codecs.mysql_loader import \
+    _close_quietly
+
+__all__ = ['AsyncMySQLCodec', ]
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncMySQLCodec(MySQLCodec):
+    """
+    Plugin that implements the HPV Information Centre data loading from and
+    storing to MySQL data sources from asyncio code.
+
+    The blocking MySQL calls are offloaded to a bounded pool of worker
+    threads, so several tables can be loaded or stored at the same time
+    without blocking the event loop. Each worker keeps its connection open
+    between operations (one per database), pinging it before reusing it to
+    reconnect if it was lost; the connections are closed by *close*. The
+    synchronous *load* and *store* methods are still available, and open
+    their own connections.
+    """
+
+    # Maximum number of simultaneous MySQL connections
+    POOL_SIZE = 8
+
+    def __init__(self, pool_size=None):
+        """
+        :param int pool_size: Number of worker threads (and connections)
+        """
+        self.pool_size = pool_size or AsyncMySQLCodec.POOL_SIZE
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._worker = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # Also shared by threads (e.g. the workers of a FolderWatcher)
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.pool_size,
+                    initializer=self._init_worker)
+            return self._executor
+
+    def close(self):
+        """
+        Shuts down the worker threads and closes their connections. The
+        codec can still be used afterwards, a new pool is created when
+        needed.
+        """
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            _close_quietly(conn)
+
+    def _init_worker(self):
+        # {connection parameters: connection} of the worker thread
+        self._worker.connections = {}
+        self._worker.in_use = set()
+
+    def _connect(self, **conn_params):
+        connections = getattr(self._worker, 'connections', None)
+        key = tuple(sorted(conn_params.items()))
+        # Only the worker threads keep their connections, and each one is
+        # used by one operation at a time (the extra connections of e.g. a
+        # resumable store are opened and closed as usual)
+        if connections is None or key in self._worker.in_use:
+            return super()._connect(**conn_params)
+
+        conn = connections.get(key)
+        if conn is not None:
+            try:
+                conn.ping(reconnect=True)
+            except Exception:
+                logger.warning('Reconnecting to {}'.format(conn_params['db']))
+                self._discard(connections, key)
+                conn = None
+        if conn is None:
+            conn = super()._connect(**conn_params)
+            connections[key] = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        self._worker.in_use.add(key)
+        return _WorkerConnection(self, conn, key)
+
+    def _release(self, key):
+        """
+        Called when an operation closes the connection of its worker: any
+        transaction left open is rolled back and the connection is kept
+        for the next operation, or discarded if it is no longer usable.
+        """
+        self._worker.in_use.discard(key)
+        try:
+            self._worker.connections[key].rollback()
+        except Exception:
+            self._discard(self._worker.connections, key)
+
+    def _discard(self, connections, key):
+        conn = connections.pop(key)
+        with self._connections_lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        _close_quietly(conn)
+
+    async def _run(self, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor,
+                                          partial(function, *args, **kwargs))
+
+    async def load_async(self, **kwargs):
+        """
+        Loads a data table without blocking the event loop. Unlike *load*,
+        all the dataframes are fetched (with a single connection) before
+        returning, so accessing them later never blocks.
+
+        :param dict kwargs: Same parameters as *MySQLCodec.load*
+        :returns: Data structure with HPV Information Centre format
+        :rtype: Dataset
+        """
+        kwargs['lazy'] = False
+        return await self._run(self.load, **kwargs)
+
+    async def store_async(self, data, **kwargs):
+        """
+        Stores a data table without blocking the event loop.
+
+        :param data: Data structure with HPV Information Centre format
+        :param dict kwargs: Same parameters as *MySQLCodec.store*
+        """
+        await self._run(self.store, data, **kwargs)
+
+    async def load_many(self, tables, **kwargs):
+        """
+        Loads several data tables concurrently, with at most *pool_size*
+        tables being fetched at the same time.
+
+        :param list tables: Names of the tables to load
+        :param dict kwargs: Connection parameters (as in *MySQLCodec.load*)
+        :returns: Dictionary with elements {table_name: data}
+        :rtype: dict
+        """
+        tables = list(tables)
+        results = await asyncio.gather(*[
+            self.load_async(table=table, **kwargs) for table in tables
+        ])
+        return dict(zip(tables, results))
+
+    async def store_many(self, datasets, **kwargs):
+        """
+        Stores several data tables concurrently, with at most *pool_size*
+        tables being stored at the same time. Each table is stored in its
+        own transaction.
+
+        :param list datasets: Data structures with HPV Information Centre
+            format
+        :param dict kwargs: Same parameters as *MySQLCodec.store*
+        """
+        await asyncio.gather(*[
+            self.store_async(data, **kwargs) for data in datasets
+        ])
+
+
+class _WorkerConnection(object):
+    """
+    Connection of a worker thread handed to an operation: it behaves as the
+    connection itself, but closing it keeps the connection open for the
+    next operation of the worker.
+    """
+
+    def __init__(self, codec, conn, key):
+        self._codec = codec
+        self._conn = conn
+        self._key = key
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._codec._release(self._key)
@@ -0,0 +1,68 @@
+""" duckdb.py
+
+This module includes the codec implementation for DuckDB database files.
+
+"""
+
+import logging
+from infocentre_data_manager.plugins.codecs.sqlite import SQLiteCodec, \
+    _quote
+
+__all__ = ['DuckDBCodec', ]
+
+logger = logging.getLogger(__name__)
+
+
+class DuckDBCodec(SQLiteCodec):
+    """
+    Plugin that implements the HPV Information Centre data loading from and
+    storing to DuckDB database files. It uses the same tables as the
+    *sqlite* codec, but data tables are bulk loaded directly from their
+    dataframes and DuckDB's columnar engine is much faster for analytical
+    queries over many tables (see *query*). Requires the *duckdb* package.
+    """
+
+    def store(self, data, create_indexes=False, **kwargs):
+        """
+        Stores a data table, replacing it (together with its metadata and
+        references) if it already exists. The whole table is stored in a
+        single transaction.
+
+        :param data: Data structure with HPV Information Centre format
+        :param bool create_indexes: Whether the secondary indexes of the
+            data table are created (they slow down the loads and DuckDB
+            rarely needs them)
+        :param kwargs: Database parameters (*file*)
+        """
+        super().store(data, create_indexes=create_indexes, **kwargs)
+
+    def _connect(self, database):
+        import duckdb
+
+        return duckdb.connect(database)
+
+    def _read(self, conn, sql, params):
+        return conn.execute(sql, params).df()
+
+    def _begin(self, conn):
+        conn.begin()
+
+    def _ref_statements(self, ref_type):
+        # DuckDB has no implicit rowid, ids are taken from a sequence
+        return [
+            'CREATE SEQUENCE IF NOT EXISTS ref_{}_id_seq'.format(ref_type),
+            'CREATE TABLE IF NOT EXISTS ref_{0} ('
+            ' id INTEGER PRIMARY KEY DEFAULT nextval(\'ref_{0}_id_seq\'), '
+            ' value TEXT NOT NULL UNIQUE)'.format(ref_type),
+            self._ref_by_statement(ref_type),
+        ]
+
+    def _insert_dataframe(self, conn, table_name, df):
+        conn.register('data_manager_df', df)
+        try:
+            columns = ', '.join(_quote(col) for col in df.columns)
+            conn.execute('INSERT INTO {} ({}) SELECT {} '
+                         'FROM data_manager_df'.format(
+                             _quote(table_name), columns, columns))
+        finally:
+            conn.unregister('data_manager_df')
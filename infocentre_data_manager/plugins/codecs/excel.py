@@ -5,11 +5,11 @@ This module includes the codec implementation for excel data sources.
 """
 
 import logging
-import pandas as pd
+import threading
 import numpy as np
-import xlsxwriter
-import re
-from datetime import datetime
+import pandas as pd
+from functools import partial
+from infocentre_data_manager.dataset import Dataset
 from infocentre_data_manager.plugins.codecs.base import Codec
 from infocentre_data_manager.plugins.semantic_types.base import SemanticType
 
@@ -29,40 +29,139 @@ class ExcelCodec(Codec):
             excel_file = kwargs['file']
         except KeyError:
             raise ValueError('No "file" parameter provided')
-        general = pd.read_excel(excel_file,
-                                sheet_name='GENERAL',
-                                header=None).loc[4:11, [1]].T
+
+        # Each sheet is only read when its data is first requested, so
+        # metadata-only operations don't need to parse the DATA sheet. The
+        # workbook itself is opened once, when the first sheet is read, and
+        # closed with the dataset or once every sheet has been read.
+        loaders = {
+            'general': (self._load_general, ),
+            'variables': (self._load_variables, ),
+            'data': (self._load_data, ),
+            'sources': (self._read_sheet, 'SOURCES'),
+            'notes': (self._read_sheet, 'NOTES'),
+            'methods': (self._read_sheet, 'METHODS'),
+            'years': (self._read_sheet, 'YEARS'),
+            'dates': (self._load_dates, ),
+        }
+        workbook = _LazyWorkbook(excel_file, len(loaders))
+        return Dataset({key: partial(workbook.read, *loader)
+                        for key, loader in loaders.items()},
+                       close=workbook.close)
+
+    def _read_sheet(self, excel_file, sheet_name, **kwargs):
+        if hasattr(excel_file, 'seek'):
+            excel_file.seek(0)
+        kwargs.setdefault('dtype', str)
+        return pd.read_excel(excel_file, sheet_name=sheet_name, **kwargs)
+
+    def _load_general(self, excel_file):
+        general = self._read_sheet(excel_file,
+                                   'GENERAL',
+                                   header=None,
+                                   dtype=None).loc[4:11, [1]].T
         general[pd.isna(general)] = ''
         general.columns = ['table_name',
                            'contents',
                            'data_manager',
                            'comments']
+        return general
 
-        excel_content = pd.read_excel(excel_file, sheet_name=None, dtype=str)
-        variables = excel_content['VARIABLES']
+    def _load_variables(self, excel_file):
+        variables = self._read_sheet(excel_file, 'VARIABLES')
         variables.fillna('', inplace=True)
-        data = excel_content['DATA']
-        data['id'] = data['id'].astype(int)
+        return variables
+
+    def load_chunks(self, chunk_size=10000, **kwargs):
+        """
+        Reads the DATA sheet in chunks of rows, streaming it from the
+        workbook, so it is never in memory as a whole (see
+        *DataValidator.apply_chunked*). Concatenated, the chunks are the
+        same as the 'data' dataframe returned by *load*.
+
+        :param int chunk_size: Number of rows of each chunk
+        :param kwargs: Excel parameters (*file*)
+        :returns: Iterator of dataframes
+        :raises ValueError: If a row has values outside the header columns
+        """
+        from openpyxl import load_workbook
+
+        try:
+            excel_file = kwargs['file']
+        except KeyError:
+            raise ValueError('No "file" parameter provided')
+        if hasattr(excel_file, 'seek'):
+            excel_file.seek(0)
+
+        # Same workbook options and cell conversion as pandas' reader
+        workbook = load_workbook(excel_file, read_only=True, data_only=True,
+                                 keep_links=False)
+        try:
+            sheet = workbook['DATA']
+            sheet.reset_dimensions()
+            header = None
+            rows = []
+            blank_rows = []
+            n_rows = 0
+            for row_number, row in enumerate(sheet.rows, 1):
+                values = [_cell_value(cell) for cell in row]
+                while values and values[-1] == '':
+                    values.pop()
+                if header is None:
+                    header = values
+                    continue
+                if len(values) > len(header):
+                    raise ValueError(
+                        'Row {} of the DATA sheet has values outside the '
+                        'header columns'.format(row_number))
+                # Empty rows are only kept if they aren't the last ones
+                if not values:
+                    blank_rows.append(values)
+                    continue
+                rows.extend(blank_rows)
+                blank_rows = []
+                rows.append(values)
+                if len(rows) >= chunk_size:
+                    yield self._parse_data_rows(header, rows, n_rows)
+                    n_rows += len(rows)
+                    rows = []
+            if rows or n_rows == 0:
+                yield self._parse_data_rows(header or [], rows, n_rows)
+        finally:
+            workbook.close()
+
+    def _parse_data_rows(self, header, rows, start):
+        from pandas.io.parsers import TextParser
+
+        width = len(header)
+        rows = [values + [''] * (width - len(values)) for values in rows]
+        parser = TextParser([header] + rows, header=0, dtype=str,
+                            skip_blank_lines=False)
+        data = self._clean_data(parser.read())
+        data.index = pd.RangeIndex(start, start + len(data.index))
+        return data
+
+    def _load_data(self, excel_file):
+        return self._clean_data(self._read_sheet(excel_file, 'DATA'))
+
+    def _clean_data(self, data):
+        # Invalid ids (e.g. decimal or empty) are left as text, for the
+        # primary key validator to report them, instead of failing here
+        ids = pd.to_numeric(data['id'], errors='coerce')
+        valid = np.isfinite(ids) & (ids == ids.round())
+        if valid.all():
+            data['id'] = ids.astype(int)
+        else:
+            data['id'] = data['id'].astype(object)
+            data.loc[valid, 'id'] = ids[valid].astype(int)
         data = data.replace('nan', '')
-        sources = excel_content['SOURCES']
-        notes = excel_content['NOTES']
-        methods = excel_content['METHODS']
-        years = excel_content['YEARS']
+        return data
 
-        dates = excel_content['DATES']
+    def _load_dates(self, excel_file):
+        dates = self._read_sheet(excel_file, 'DATES')
         dates = dates.replace('nan', '')
         dates = dates.fillna('')
-
-        return {
-            'general': general,
-            'variables': variables,
-            'data': data,
-            'sources': sources,
-            'notes': notes,
-            'methods': methods,
-            'years': years,
-            'dates': dates,
-        }
+        return dates
 
     def store(self, data, **kwargs):
         try:
@@ -70,6 +169,7 @@ class ExcelCodec(Codec):
         except KeyError:
             raise ValueError('No "file" parameter provided')
 
+        import xlsxwriter
         workbook = xlsxwriter.Workbook(excel_file, {'nan_inf_to_errors': True})
 
         self._create_general_sheet(data, workbook)
@@ -156,7 +256,7 @@ class ExcelCodec(Codec):
                         variable_columns,
                         cell_format=header_format)
 
-        available_types = list(SemanticType.get_plugins().keys())
+        available_types = SemanticType.get_plugin_names()
         sheet.data_validation(1, 1, len(data['variables']), 1,
                               {
                                   'validate': 'list',
@@ -298,3 +398,63 @@ class ExcelCodec(Codec):
             sheet.write_column(1, i,
                                sheet_data.loc[:, column],
                                cell_format=cell_format)
+
+
+class _LazyWorkbook(object):
+    """
+    Workbook shared by the lazy loaders of the sheets of a dataset: it is
+    opened (as a *pd.ExcelFile*) when the first sheet is read and closed
+    once all the sheets have been read, or earlier with *close* (it is
+    opened again if more sheets are read). Workbooks that are already a
+    *pd.ExcelFile* are used as they are, and left open.
+    """
+
+    def __init__(self, excel_file, n_sheets):
+        self._excel_file = excel_file
+        self._owned = not isinstance(excel_file, pd.ExcelFile)
+        self._workbook = None if self._owned else excel_file
+        self._n_pending = n_sheets
+        self._lock = threading.Lock()
+
+    def read(self, load_function, *args):
+        """
+        :param load_function: Function that reads a sheet from the workbook
+        :returns: Result of *load_function*
+        """
+        with self._lock:
+            if self._workbook is None:
+                if hasattr(self._excel_file, 'seek'):
+                    self._excel_file.seek(0)
+                self._workbook = pd.ExcelFile(self._excel_file)
+            try:
+                return load_function(self._workbook, *args)
+            finally:
+                self._n_pending -= 1
+                if self._n_pending == 0:
+                    self._close()
+
+    def close(self):
+        """ Closes the workbook if it was opened here. """
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._owned and self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+
+
+def _cell_value(cell):
+    """ Converts an openpyxl cell as pandas' excel reader does. """
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    if cell.value is None:
+        return ''
+    elif cell.data_type == TYPE_ERROR:
+        return float('nan')
+    elif cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        if value == cell.value:
+            return value
+        return float(cell.value)
+    return cell.value
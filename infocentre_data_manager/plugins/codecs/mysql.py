@@ -7,11 +7,22 @@ This module includes the codec implementation for MySQL data sources.
 import logging
 import re
 import datetime
+import threading
+from contextlib import contextmanager
+from functools import partial
 import pandas as pd
 import numpy as np
 import pymysql.cursors
 from pymysql import ProgrammingError
+from infocentre_data_manager.dataset import Dataset
 from infocentre_data_manager.plugins.codecs.base import Codec
+from infocentre_data_manager.plugins.codecs.mysql_cache import \
+    LoadCache, bump_version, fetch_marker
+from infocentre_data_manager.plugins.codecs.mysql_loader import \
+    ParallelLoader, ResumableLoader, set_session
+from infocentre_data_manager.plugins.codecs.mysql_schema import \
+    TEXT_ROW_BYTES, IndexSchema, indexed_columns, infer_indexes, \
+    infer_schema, widen_columns
 
 __all__ = ['MySQLCodec', ]
 
@@ -27,22 +38,145 @@ class MySQLCodec(Codec):
     # When creating a database column, if the current data exceeds this
     # size a TEXT type is assigned instead.
     VARCHAR_SIZE = 200
-
-    def load(self, **kwargs):
-        host = kwargs['host']
-        db = kwargs['db']
-        user = kwargs['user']
-        password = kwargs['password']
+    # Maximum row size of a MySQL table, bigger VARCHAR columns are turned
+    # into TEXT until the planned row fits.
+    MAX_ROW_SIZE = 65535
+    # Tables loaded with use_cache=True, shared by all the codec instances
+    load_cache = LoadCache()
+    # Session variables of the connections that insert rows with fast_load
+    FAST_LOAD_SESSION = {'foreign_key_checks': 0}
+
+    def load(self, lazy=True, use_cache=False, **kwargs):
+        conn_params = self._connection_params(kwargs)
         table_name = kwargs['table']
+        loaders = {
+            'general': (self._load_general_data, table_name),
+            'variables': (self._load_variable_data, table_name),
+            'data': (self._load_raw_data, table_name),
+            'sources': (self._load_ref_data, table_name, 'sources'),
+            'notes': (self._load_ref_data, table_name, 'notes'),
+            'methods': (self._load_ref_data, table_name, 'methods'),
+            'years': (self._load_ref_data, table_name, 'years'),
+            'dates': (self._load_dates_data, table_name),
+        }
 
-        conn = pymysql.connect(host=host,
+        if use_cache:
+            return self._load_cached(conn_params, table_name, loaders)
+
+        if not lazy:
+            frames = self._load_group(conn_params, loaders.items())
+            return Dataset(**frames)
+
+        # The metadata (every dataframe but the data) is fetched with a
+        # single connection the first time any of it is requested, and the
+        # data only if it is requested (e.g. listing variables doesn't need
+        # SELECT *).
+        table_loader = _TableLoader(
+            self, conn_params, loaders,
+            [[key for key in loaders if key != 'data'], ['data']])
+        return Dataset({key: partial(table_loader.load, key)
+                        for key in loaders})
+
+    def _load_cached(self, conn_params, table_name, loaders):
+        """
+        Returns the table from *load_cache* if it hasn't changed since it
+        was cached, which only costs a single query, and loads and caches
+        the whole table otherwise.
+        """
+        key = self._cache_key(conn_params, table_name)
+        conn = self._connect(**conn_params)
+        try:
+            marker = fetch_marker(conn, table_name)
+            if marker is not None:
+                frames = MySQLCodec.load_cache.get(key, marker)
+                if frames is not None:
+                    return Dataset(**frames)
+            frames = dict((name, loader[0](conn, *loader[1:]))
+                          for name, loader in loaders.items())
+        finally:
+            conn.close()
+        if marker is not None:
+            MySQLCodec.load_cache.put(key, marker, frames)
+        return Dataset(**frames)
+
+    def load_chunks(self, chunk_size=10000, **kwargs):
+        """
+        Reads a data table in chunks of rows (see
+        *DataValidator.apply_chunked*). Rows are paginated by id, so every
+        chunk is a short indexed query and the whole table is never in
+        memory.
+
+        :param int chunk_size: Number of rows of each chunk
+        :param kwargs: Database parameters (*host*, *db*, *user*,
+            *password*, *table*)
+        :returns: Iterator of dataframes
+        """
+        conn = self._connect(**self._connection_params(kwargs))
+        try:
+            table_name = kwargs['table']
+            last_id = None
+            n_rows = 0
+            while True:
+                if last_id is None:
+                    chunk = pd.read_sql(
+                        'SELECT * FROM {} ORDER BY id LIMIT %s'.format(
+                            table_name),
+                        conn,
+                        params=[chunk_size])
+                else:
+                    chunk = pd.read_sql(
+                        'SELECT * FROM {} WHERE id > %s '
+                        'ORDER BY id LIMIT %s'.format(table_name),
+                        conn,
+                        params=[last_id, chunk_size])
+                chunk.index = pd.RangeIndex(n_rows, n_rows + len(chunk.index))
+                n_rows += len(chunk.index)
+                if len(chunk.index) > 0 or last_id is None:
+                    yield chunk
+                if len(chunk.index) < chunk_size:
+                    break
+                last_id = int(chunk['id'].iloc[-1])
+        finally:
+            conn.close()
+
+    def _cache_key(self, conn_params, table_name):
+        return (conn_params['host'], conn_params['db'], table_name)
+
+    def _connection_params(self, kwargs):
+        return {
+            'host': kwargs['host'],
+            'db': kwargs['db'],
+            'user': kwargs['user'],
+            'password': kwargs['password'],
+        }
+
+    def _connect(self, host, db, user, password):
+        return pymysql.connect(host=host,
                                user=user,
                                password=password,
                                db=db,
                                charset='utf8',
                                cursorclass=pymysql.cursors.DictCursor)
 
-        general = pd.read_sql(
+    def _load_group(self, conn_params, loaders):
+        """
+        Loads some dataframes of a table with a single connection, all of
+        them from the same version of the table.
+
+        :returns: Dataframes
+        :rtype: dict
+        """
+        conn = self._connect(**conn_params)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('START TRANSACTION WITH CONSISTENT SNAPSHOT')
+            return dict((key, loader[0](conn, *loader[1:]))
+                        for key, loader in loaders)
+        finally:
+            conn.close()
+
+    def _load_general_data(self, conn, table_name):
+        return pd.read_sql(
             'SELECT table_name, contents, data_manager, comments '
             'FROM info_tables '
             'WHERE table_name = %s',
@@ -50,7 +184,8 @@ class MySQLCodec(Codec):
             params=[table_name]
         )
 
-        variables = pd.read_sql(
+    def _load_variable_data(self, conn, table_name):
+        return pd.read_sql(
             'SELECT name AS variable, description, semantic_type AS type '
             'FROM info_vars '
             'WHERE data_table = %s'
@@ -59,27 +194,8 @@ class MySQLCodec(Codec):
             params=[table_name]
         )
 
-        data = pd.read_sql('SELECT * FROM {}'.format(table_name), conn)
-
-        sources = self._load_ref_data(conn, table_name, 'sources')
-        notes = self._load_ref_data(conn, table_name, 'notes')
-        methods = self._load_ref_data(conn, table_name, 'methods')
-        years = self._load_ref_data(conn, table_name, 'years')
-
-        dates = self._load_dates_data(conn, table_name)
-
-        conn.close()
-
-        return {
-            'general': general,
-            'variables': variables,
-            'data': data,
-            'sources': sources,
-            'notes': notes,
-            'methods': methods,
-            'years': years,
-            'dates': dates
-        }
+    def _load_raw_data(self, conn, table_name):
+        return pd.read_sql('SELECT * FROM {}'.format(table_name), conn)
 
     def _load_ref_data(self, conn, table_name, ref_type):
         ref_table = 'ref_{}'.format(ref_type)
@@ -122,97 +238,384 @@ class MySQLCodec(Codec):
               data,
               batch_size=1000,
               use_temporal_db=False,
+              fast_load=False,
+              publish=False,
+              n_connections=1,
+              resumable=False,
               **kwargs):
-        host = kwargs['host']
-        db = kwargs['db']
-        user = kwargs['user']
-        password = kwargs['password']
-        conn = pymysql.connect(host=host,
-                               user=user,
-                               password=password,
-                               db=db,
-                               charset='utf8',
-                               cursorclass=pymysql.cursors.DictCursor)
+        """
+        Stores a data table, replacing its rows, metadata and references.
+
+        :param data: Data structure with HPV Information Centre format
+        :param int batch_size: Number of rows per INSERT statement
+        :param bool use_temporal_db: Whether the data table is (created as)
+            a system-versioned table
+        :param bool fast_load: Whether the rows are loaded into a staging
+            table whose secondary indexes are built after the load (see
+            *_publish*)
+        :param bool publish: Whether the rows are loaded into a staging
+            table that atomically replaces the data table (see *_publish*)
+        :param int n_connections: Number of connections that insert the
+            rows of a published table at the same time
+        :param bool resumable: Whether the rows are loaded into a staging
+            table in committed batches, resuming interrupted loads
+        :param kwargs: Connection parameters (host, db, user and password),
+            *create_table* and *create_indexes*
+        :raises ValueError: If *use_temporal_db* is combined with
+            *publish*, *fast_load* or *resumable*: they replace the data
+            table with a new one, which would delete its version history
+        """
+        if use_temporal_db and (publish or fast_load or resumable):
+            raise ValueError('publish, fast_load and resumable replace the '
+                             'data table, they would delete the history of '
+                             'a temporal table')
+        conn_params = self._connection_params(kwargs)
+        conn = self._connect(**conn_params)
 
         try:
-            if kwargs.get('create_table', False):
-                self._create_table(conn, data, use_temporal_db)
+            try:
+                if kwargs.get('create_table', False):
+                    self._create_table(conn, data, use_temporal_db)
+                    conn.commit()
+                if kwargs.get('create_indexes', False):
+                    self._create_missing_indexes(conn, data)
+                    conn.commit()
+                if resumable:
+                    table_name = data['general']['table_name'].iloc[0]
+                    loader = ResumableLoader(self,
+                                             conn_params,
+                                             table_name,
+                                             batch_size=batch_size)
+                    self._publish(conn, data, batch_size, loader=loader,
+                                  keep_staging=True)
+                    loader.clear_checkpoint(conn)
+                    conn.commit()
+                elif publish or fast_load:
+                    loader = None
+                    if n_connections > 1:
+                        session = MySQLCodec.FAST_LOAD_SESSION \
+                            if fast_load else None
+                        loader = ParallelLoader(self,
+                                                conn_params,
+                                                n_connections=n_connections,
+                                                batch_size=batch_size,
+                                                session=session)
+                    self._publish(conn, data, batch_size, loader=loader,
+                                  fast_load=fast_load)
+                else:
+                    self._store_data(conn, data, batch_size)
+                    conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise e from None
+
+            table_name = data['general']['table_name'].iloc[0]
+            MySQLCodec.load_cache.invalidate(
+                self._cache_key(conn_params, table_name))
+            try:
+                bump_version(conn, table_name)
                 conn.commit()
-            self._store_general_data(conn, data)
-            self._store_variable_data(conn, data)
+            except Exception as e:
+                # The data is already stored, other processes will only notice
+                # the change through the table update time.
+                logger.warning('Could not update the version of {}: {}'.format(
+                    table_name, e))
+        finally:
+            # Also after errors, e.g. to release pooled connections
+            conn.close()
+
+    def _store_data(self, conn, data, batch_size, store_raw_data=True):
+        self._store_general_data(conn, data)
+        self._store_variable_data(conn, data)
+        if store_raw_data:
             self._store_raw_data(conn, data, batch_size)
-            self._store_ref_data(conn, data, 'sources')
-            self._store_ref_data(conn, data, 'notes')
-            self._store_ref_data(conn, data, 'methods')
-            self._store_ref_data(conn, data, 'years')
-            self._store_dates_data(conn, data)
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e from None
-
-        conn.close()
-
-    def _create_table(self,
-                      conn,
-                      data,
-                      use_temporal_db,
-                      default_char_type=None):
-        columns_clause = []
-        if default_char_type is None:
-            default_char_type = 'varchar({})'.format(MySQLCodec.VARCHAR_SIZE)
-        for col in data['variables'].itertuples():
-            if col.variable == 'id':
-                col_clause = 'id INT COMMENT \'{}\''.format(
-                    col.description.replace('\'', '\'\'')
-                )
+        self._store_ref_data(conn, data, 'sources')
+        self._store_ref_data(conn, data, 'notes')
+        self._store_ref_data(conn, data, 'methods')
+        self._store_ref_data(conn, data, 'years')
+        self._store_dates_data(conn, data)
+
+    def _publish(self, conn, data, batch_size, loader=None,
+                 keep_staging=False, fast_load=False):
+        """
+        Replaces the data table without readers ever seeing it empty or
+        partially filled: the rows are loaded into a staging copy of the
+        table (with *loader* if it is provided, e.g. a ParallelLoader), its
+        row count is checked and then it is swapped with the current table
+        with an atomic RENAME TABLE. With *keep_staging* the loader is in
+        charge of creating the staging table, which is kept after failures
+        so that the load can be resumed. With *fast_load* the secondary
+        indexes of the staging table are built once after the load instead
+        of row by row (see *_fast_load_mode*).
+
+        The RENAME commits implicitly, together with the metadata (general
+        info, variables and references) stored just before it.
+        """
+        table_name = data['general']['table_name'].iloc[0]
+        staging_table = self._staging_table_name(table_name)
+
+        def load_rows():
+            if loader is not None:
+                loader.load(staging_table, data['data'])
             else:
-                if data['data'][col.variable].dtype != 'object':
-                    raise ValueError(
-                        '"{}" must have a text type '
-                        '(e.g. VARCHAR, TEXT, ...).'.format(
-                            col.variable
-                        ))
-                max_length_col_data = \
-                    data['data'][col.variable].str.len().max()
-                if max_length_col_data > MySQLCodec.VARCHAR_SIZE:
-                    char_type = 'TEXT'
-                else:
-                    char_type = default_char_type
-                col_clause = '`{}` {} COMMENT \'{}\''.format(
-                    col.variable,
-                    char_type,
-                    col.description.replace('\'', '\'\'')
-                )
-            columns_clause.append(col_clause)
+                with conn.cursor() as cursor:
+                    self._insert_rows(cursor, staging_table, data['data'],
+                                      batch_size)
+                conn.commit()
+
+        if not keep_staging:
+            self._create_staging_table(conn, table_name, staging_table)
+        try:
+            if fast_load:
+                with self._fast_load_mode(conn, staging_table):
+                    load_rows()
+            else:
+                load_rows()
+            self._check_row_count(conn, staging_table, len(data['data']))
+            self._store_data(conn, data, batch_size, store_raw_data=False)
+            self._swap_staging_table(conn, table_name, staging_table)
+        except Exception:
+            conn.rollback()
+            if not keep_staging:
+                with conn.cursor() as cursor:
+                    cursor.execute('DROP TABLE IF EXISTS {}'.format(
+                        staging_table))
+            raise
 
+    def _staging_table_name(self, table_name):
+        return '{}__staging'.format(table_name)
+
+    def _create_staging_table(self, conn, table_name, staging_table):
+        with conn.cursor() as cursor:
+            # Leftovers from previous failed publications
+            cursor.execute('DROP TABLE IF EXISTS {}, {}'.format(
+                staging_table, self._old_table_name(table_name)))
+            cursor.execute('CREATE TABLE {} LIKE {}'.format(staging_table,
+                                                            table_name))
+
+    def _check_row_count(self, conn, table_name, expected_rows):
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) AS n FROM {}'.format(table_name))
+            n_rows = cursor.fetchone()['n']
+        if n_rows != expected_rows:
+            raise EnvironmentError(
+                'Table "{}" has {} rows, {} expected.'.format(
+                    table_name, n_rows, expected_rows))
+
+    def _old_table_name(self, table_name):
+        return '{}__old'.format(table_name)
+
+    def _swap_staging_table(self, conn, table_name, staging_table):
+        old_table = self._old_table_name(table_name)
+        with conn.cursor() as cursor:
+            cursor.execute('RENAME TABLE {} TO {}, {} TO {}'.format(
+                table_name, old_table, staging_table, table_name))
+            cursor.execute('DROP TABLE {}'.format(old_table))
+
+    @contextmanager
+    def _fast_load_mode(self, conn, table_name):
+        """
+        Context for bulk loads into an empty (e.g. staging) table: foreign
+        key checks are disabled for the session (see *FAST_LOAD_SESSION*)
+        and the non-unique secondary indexes of the table are dropped, so
+        they are built once on exit instead of row by row. Unique checks are
+        kept, so rows with duplicated keys are still rejected.
+
+        The session variables only change for *conn*: loaders that insert
+        through other connections (e.g. a ParallelLoader) must set them on
+        each of their connections.
+
+        Index changes are DDL statements (they commit implicitly), so the
+        data must be committed inside this context. If the indexes can't be
+        rebuilt after a failed load, that error is logged and the error of
+        the load is raised.
+        """
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT {}'.format(', '.join(
+                '@@SESSION.{} AS {}'.format(name, name)
+                for name in MySQLCodec.FAST_LOAD_SESSION)))
+            session = cursor.fetchone()
+        indexes = self._secondary_indexes(conn, table_name)
+        if len(indexes) > 0:
+            with conn.cursor() as cursor:
+                cursor.execute('ALTER TABLE {} {}'.format(
+                    table_name,
+                    ', '.join('DROP INDEX `{}`'.format(name)
+                              for name in indexes)))
+
+        try:
+            set_session(conn, MySQLCodec.FAST_LOAD_SESSION)
+            yield
+        except Exception:
+            conn.rollback()
+            try:
+                self._end_fast_load_mode(conn, table_name, session, indexes)
+            except Exception:
+                logger.exception('Could not restore the indexes of {}'.format(
+                    table_name))
+            raise
+        self._end_fast_load_mode(conn, table_name, session, indexes)
+
+    def _end_fast_load_mode(self, conn, table_name, session, indexes):
+        set_session(conn, session)
+        with conn.cursor() as cursor:
+            if len(indexes) > 0:
+                cursor.execute('ALTER TABLE {} {}'.format(
+                    table_name,
+                    ', '.join('ADD ' + clause
+                              for clause in indexes.values())))
+
+    def _secondary_indexes(self, conn, table_name):
+        """
+        :returns: Definitions of the non-unique secondary indexes of a table
+        :rtype: dict
+        """
+        stats = pd.read_sql(
+            'SELECT INDEX_NAME AS name, INDEX_TYPE AS type, '
+            ' COLUMN_NAME AS `column`, SUB_PART AS sub_part '
+            'FROM information_schema.STATISTICS '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s '
+            ' AND NON_UNIQUE = 1 '
+            'ORDER BY INDEX_NAME, SEQ_IN_INDEX',
+            con=conn,
+            params=[table_name]
+        )
+        indexes = {}
+        for name, index_stats in stats.groupby('name', sort=False):
+            index_type = index_stats['type'].iloc[0]
+            columns = ['`{}`'.format(col.column)
+                       if pd.isna(col.sub_part)
+                       else '`{}`({})'.format(col.column, int(col.sub_part))
+                       for col in index_stats.itertuples()]
+            indexes[name] = '{}INDEX `{}` ({})'.format(
+                index_type + ' '
+                if index_type in ['FULLTEXT', 'SPATIAL'] else '',
+                name,
+                ', '.join(columns))
+        return indexes
+
+    def _create_table(self, conn, data, use_temporal_db):
+        """
+        Creates the data table or, if it already exists, widens the columns
+        that are too small for the data (see *mysql_schema.widen_columns*).
+        """
+        schema = infer_schema(data,
+                              varchar_size=MySQLCodec.VARCHAR_SIZE,
+                              max_row_size=MySQLCodec.MAX_ROW_SIZE)
         table_name = data['general']['table_name'].iloc[0]
-        sql_string = ('CREATE TABLE {} '
-                      '({}, CONSTRAINT {}_PK PRIMARY KEY (id)) '
-                      'ENGINE=InnoDB DEFAULT CHARSET=utf8 '
-                      'COLLATE=utf8_general_ci'.format(
-                          table_name,
-                          ','.join(columns_clause),
-                          table_name
-                      ))
-        if use_temporal_db:
-            sql_string += ' WITH SYSTEM VERSIONING'
+
+        def create_table_sql(schema):
+            columns_clause = [col.clause() for col in schema]
+            indexes_clause = [index.clause()
+                              for index in infer_indexes(data, schema)]
+            sql_string = ('CREATE TABLE {} '
+                          '({}, CONSTRAINT {}_PK PRIMARY KEY (id){}) '
+                          'ENGINE=InnoDB DEFAULT CHARSET=utf8 '
+                          'COLLATE=utf8_general_ci'.format(
+                              table_name,
+                              ','.join(columns_clause),
+                              table_name,
+                              ''.join(',' + index
+                                      for index in indexes_clause)
+                          ))
+            if use_temporal_db:
+                sql_string += ' WITH SYSTEM VERSIONING'
+            return sql_string
 
         try:
-            with conn.cursor() as cursor:
-                cursor.execute(sql_string)
-        except pymysql.err.InternalError as e:
+            self._execute_table_ddl(conn, create_table_sql, schema)
+        except pymysql.err.MySQLError as e:
             if e.args[0] == pymysql.constants.ER.TABLE_EXISTS_ERROR:
-                pass  # Table already exists, skipping generation...
-            elif e.args[0] == pymysql.constants.ER.TOO_BIG_ROWSIZE \
-                    and char_type != 'TEXT':
-                self._create_table(conn,
-                                   data,
-                                   use_temporal_db,
-                                   default_char_type='TEXT')
+                self._widen_columns(conn, table_name, schema)
             else:
                 raise e from None
 
+    def _widen_columns(self, conn, table_name, schema):
+        existing = pd.read_sql(
+            'SELECT COLUMN_NAME AS name, DATA_TYPE AS type, '
+            ' CHARACTER_MAXIMUM_LENGTH AS length '
+            'FROM information_schema.COLUMNS '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+            con=conn,
+            params=[table_name])
+        columns = widen_columns(
+            schema,
+            dict((col.name, (col.type, col.length))
+                 for col in existing.itertuples()),
+            varchar_size=MySQLCodec.VARCHAR_SIZE)
+        if len(columns) == 0:
+            return
+        logger.info('Widening columns of {}: {}'.format(
+            table_name, ', '.join('{} {}'.format(col.name, col.sql_type)
+                                  for col in columns)))
+        self._execute_table_ddl(
+            conn,
+            lambda columns: 'ALTER TABLE {} {}'.format(
+                table_name,
+                ', '.join('MODIFY ' + col.clause() for col in columns)),
+            columns)
+
+    def _execute_table_ddl(self, conn, sql_function, schema):
+        """
+        Runs the CREATE or ALTER TABLE statement returned by *sql_function*
+        for some column schemas. If MySQL still finds the row too big (its
+        row size can differ from the one estimated by *infer_schema*, e.g.
+        with other character sets), the VARCHAR columns are turned into
+        TEXT and the statement is run again.
+        """
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql_function(schema))
+        except pymysql.err.MySQLError as e:
+            varchars = [col for col in schema
+                        if col.sql_type.startswith('VARCHAR')]
+            if e.args[0] != pymysql.constants.ER.TOO_BIG_ROWSIZE or \
+                    len(varchars) == 0:
+                raise e from None
+            logger.debug('Row too big, {} will be TEXT'.format(
+                ', '.join(col.name for col in varchars)))
+            for col in varchars:
+                col.sql_type = 'TEXT'
+                col.row_bytes = TEXT_ROW_BYTES
+            with conn.cursor() as cursor:
+                cursor.execute(sql_function(schema))
+
+    def _create_missing_indexes(self, conn, data):
+        """
+        Adds the secondary indexes that a new table would have (see
+        *mysql_schema.indexed_columns*) to an existing table, if there isn't
+        already an index starting with that column.
+        """
+        table_name = data['general']['table_name'].iloc[0]
+        columns = pd.read_sql(
+            'SELECT c.COLUMN_NAME AS name, c.DATA_TYPE AS type, '
+            ' COALESCE(MAX(s.SEQ_IN_INDEX = 1), 0) AS indexed '
+            'FROM information_schema.COLUMNS c '
+            'LEFT JOIN information_schema.STATISTICS s '
+            ' ON s.TABLE_SCHEMA = c.TABLE_SCHEMA '
+            ' AND s.TABLE_NAME = c.TABLE_NAME '
+            ' AND s.COLUMN_NAME = c.COLUMN_NAME '
+            'WHERE c.TABLE_SCHEMA = DATABASE() AND c.TABLE_NAME = %s '
+            'GROUP BY c.COLUMN_NAME, c.DATA_TYPE',
+            con=conn,
+            params=[table_name]
+        ).set_index('name')
+
+        indexes = [IndexSchema(column,
+                               is_text=columns.at[column, 'type'].endswith(
+                                   ('text', 'blob')))
+                   for column in indexed_columns(data)
+                   if column in columns.index and
+                   not columns.at[column, 'indexed']]
+        if len(indexes) == 0:
+            return
+        logger.info('Adding indexes to {}: {}'.format(
+            table_name, ', '.join(index.column for index in indexes)))
+        with conn.cursor() as cursor:
+            cursor.execute('ALTER TABLE {} {}'.format(
+                table_name,
+                ', '.join('ADD ' + index.clause() for index in indexes)))
+
     def _store_general_data(self, conn, data):
         table_name = data['general']['table_name'].iloc[0]
         data_manager = data['general']['data_manager'].iloc[0]
@@ -267,27 +670,7 @@ class MySQLCodec(Codec):
         with conn.cursor() as cursor:
             cursor.execute('TRUNCATE TABLE {}'.format(table_name))
 
-            for i in range(0, len(data['data'].index), batch_size):
-                # TODO: Refactor insert string generation
-                sql = 'INSERT INTO {} ({}) VALUES {}'.format(
-                    table_name,
-                    ','.join(['`{}`'.format(col)
-                              for col in data['data'].columns]),
-                    ','.join(['({})'.format(','.join(
-                                ["'" + v.replace("'", "\\'") + "'"
-                                 if isinstance(v, str) else str(v)
-                                 for v in row[1].values]))
-                              for row
-                              in data['data'].iloc[
-                                 i:min(
-                                    len(data['data'].index),
-                                    i + batch_size
-                                    ), :
-                                ].iterrows()
-                              ]
-                             )
-                )
-                cursor.execute(sql)
+            self._insert_rows(cursor, table_name, data['data'], batch_size)
 
         # FIX: Selective data replacing to work propertly with
         # temporal databases.
@@ -357,6 +740,17 @@ class MySQLCodec(Codec):
         #         )
         #         cursor.execute(sql)
 
+    def _insert_rows(self, cursor, table_name, df, batch_size):
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            table_name,
+            ','.join(['`{}`'.format(col) for col in df.columns]),
+            ','.join(['%s'] * len(df.columns)))
+        rows = df.astype(object).where(pd.notna(df), None).values.tolist()
+        for i in range(0, len(rows), batch_size):
+            # pymysql escapes the values and sends each batch as a single
+            # multi-row INSERT
+            cursor.executemany(sql, rows[i:i + batch_size])
+
     def _store_ref_data(self, conn, data, ref_type):
         table_name = data['general']['table_name'].iloc[0]
         ref_values = set(data[ref_type].loc[:, 'value'])
@@ -426,3 +820,32 @@ class MySQLCodec(Codec):
                     else None
                     ]
                 cursor.execute(sql, query_data)
+
+
+class _TableLoader(object):
+    """
+    Loader of the dataframes of a lazily loaded table, in groups: the
+    first time a dataframe is requested, all the dataframes of its group
+    are loaded together (see *MySQLCodec._load_group*). Each group is read
+    from the version of the table at the time it is requested (load the
+    table with ``lazy=False`` for a consistent copy of a table that can
+    change meanwhile).
+    """
+
+    def __init__(self, codec, conn_params, loaders, groups):
+        self._codec = codec
+        self._conn_params = conn_params
+        self._loaders = loaders
+        self._groups = groups
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        with self._lock:
+            if key not in self._frames:
+                group = next(group for group in self._groups if key in group)
+                self._frames.update(self._codec._load_group(
+                    self._conn_params,
+                    [(name, self._loaders[name]) for name in group]))
+            # The dataset keeps it from now on
+            return self._frames.pop(key)
@@ -0,0 +1,184 @@
+""" mysql_cache.py
+
+This module includes the local cache of tables loaded by the MySQL codec
+and the change markers used to validate it.
+
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from pymysql.constants import ER
+from pymysql.err import OperationalError, ProgrammingError
+
+__all__ = ['LoadCache', 'bump_version', 'fetch_marker', ]
+
+logger = logging.getLogger(__name__)
+
+# Version of each data table, increased by MySQLCodec.store
+VERSION_TABLE = 'data_manager_versions'
+# Tables with the metadata and references of every data table
+METADATA_TABLES = ['info_tables', 'info_vars', 'ref_dates_by',
+                   'ref_sources', 'ref_sources_by', 'ref_notes',
+                   'ref_notes_by', 'ref_methods', 'ref_methods_by',
+                   'ref_years', 'ref_years_by']
+
+
+class LoadCache(object):
+    """
+    Least recently used cache of loaded data dictionaries, bounded by their
+    total memory usage. Each entry is stored with the change marker of its
+    table (see *fetch_marker*) and is only returned while the marker hasn't
+    changed. Entries are copied both when they are stored and when they are
+    returned, so callers can modify their data freely.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        """
+        :param int max_bytes: Maximum memory usage of the cached dataframes
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, marker):
+        """
+        :param tuple key: Table key, e.g. (host, db, table_name)
+        :param tuple marker: Current change marker of the table
+        :returns: Copy of the cached data, or None if it isn't cached or
+            the table has changed since it was cached
+        :rtype: dict
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != marker:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _copy(entry[1])
+
+    def put(self, key, marker, data):
+        """
+        Caches a copy of the data, evicting the least recently used entries
+        if needed. Data bigger than the whole cache is not stored.
+
+        :param tuple key: Table key, e.g. (host, db, table_name)
+        :param tuple marker: Change marker of the table when it was loaded
+        :param dict data: Loaded data
+        """
+        data = _copy(data)
+        size = sum(int(df.memory_usage(deep=True).sum())
+                   for df in data.values())
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (marker, data, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, key=None):
+        """
+        Removes a table from the cache.
+
+        :param tuple key: Table key (all the tables by default)
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._size = 0
+            else:
+                self._remove(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[2]
+
+
+def fetch_marker(conn, table_name):
+    """
+    Fetches the change marker of a data table with a single query: its
+    version (increased by every *MySQLCodec.store*) and the last update
+    times reported by MySQL of the data table and of the metadata tables
+    (which also reflect changes made outside the codec). The metadata
+    tables are shared by all the data tables, so changing the metadata of
+    any table changes the marker of every table.
+
+    :param conn: MySQL connection
+    :param str table_name: Data table
+    :returns: Marker (version, data update time, metadata update time), or
+        None if MySQL reports none of them and the changes of the table
+        can't be tracked
+    :rtype: tuple
+    """
+    with conn.cursor() as cursor:
+        try:
+            # MySQL 8 caches the table statistics for a day by default
+            cursor.execute('SET SESSION information_schema_stats_expiry = 0')
+        except OperationalError:
+            pass  # Unknown variable before MySQL 8
+        update_times_query = (
+            '(SELECT UPDATE_TIME FROM information_schema.TABLES '
+            ' WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s) '
+            ' AS update_time, '
+            '(SELECT MAX(UPDATE_TIME) FROM information_schema.TABLES '
+            ' WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({})) '
+            ' AS metadata_update_time'.format(
+                ', '.join(['%s'] * len(METADATA_TABLES))))
+        params = [table_name] + METADATA_TABLES
+        try:
+            cursor.execute(
+                'SELECT {}, '
+                ' (SELECT version FROM {} WHERE table_name = %s) '
+                ' AS version'.format(update_times_query, VERSION_TABLE),
+                params + [table_name])
+        except ProgrammingError as e:
+            if e.args[0] != ER.NO_SUCH_TABLE:
+                raise
+            # Nothing has been stored with the codec yet
+            cursor.execute('SELECT {}, NULL AS version'.format(
+                update_times_query), params)
+        row = cursor.fetchone()
+    if row['version'] is None and row['update_time'] is None and \
+            row['metadata_update_time'] is None:
+        return None
+    return (row['version'], row['update_time'], row['metadata_update_time'])
+
+
+def bump_version(conn, table_name):
+    """
+    Increases the version of a data table, invalidating the cached copies
+    of every process (the caller commits). The version table is created
+    the first time a table is stored.
+
+    :param conn: MySQL connection
+    :param str table_name: Data table
+    """
+    insert = ('INSERT INTO {} (table_name, version) VALUES (%s, 1) '
+              'ON DUPLICATE KEY UPDATE version = version + 1'.format(
+                  VERSION_TABLE))
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute(insert, [table_name])
+        except ProgrammingError as e:
+            if e.args[0] != ER.NO_SUCH_TABLE:
+                raise
+            cursor.execute(
+                'CREATE TABLE IF NOT EXISTS {} ('
+                ' table_name VARCHAR(64) PRIMARY KEY, '
+                ' version INT NOT NULL'
+                ') ENGINE=InnoDB'.format(VERSION_TABLE))
+            cursor.execute(insert, [table_name])
+
+
+def _copy(data):
+    return {key: df.copy() for key, df in data.items()}
@@ -0,0 +1,322 @@
+""" mysql_loader.py
+
+This module includes the loaders used by the MySQL codec to insert big data
+tables: through several connections or in resumable batches.
+
+"""
+
+import hashlib
+import logging
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from pymysql.constants import CR, ER
+from pymysql.err import OperationalError
+
+__all__ = ['ParallelLoader', 'ResumableLoader', 'is_transient_error',
+           'retry', 'set_session', ]
+
+logger = logging.getLogger(__name__)
+
+# MySQL errors after which retrying the same operation can succeed
+TRANSIENT_ERRORS = [
+    ER.LOCK_DEADLOCK,
+    ER.LOCK_WAIT_TIMEOUT,
+    CR.CR_CONN_HOST_ERROR,
+    CR.CR_SERVER_GONE_ERROR,
+    CR.CR_SERVER_LOST,
+]
+
+
+def is_transient_error(error):
+    """
+    :param Exception error: Error raised by a MySQL operation
+    :returns: Whether the operation can be retried
+    :rtype: bool
+    """
+    return isinstance(error, OperationalError) and \
+        len(error.args) > 0 and error.args[0] in TRANSIENT_ERRORS
+
+
+class ParallelLoader(object):
+    """
+    Inserts the rows of a data table through several MySQL connections at
+    the same time. The rows are split in disjoint id ranges, one per
+    connection, and each range is inserted in its own transaction and
+    retried (with exponential backoff) after transient errors.
+    """
+
+    def __init__(self, codec, conn_params, n_connections=4, batch_size=1000,
+                 max_retries=3, retry_delay=1.0, session=None):
+        """
+        :param MySQLCodec codec: Codec used to connect and insert rows
+        :param dict conn_params: Connection parameters (host, db, user and
+            password)
+        :param int n_connections: Number of simultaneous connections
+        :param int batch_size: Number of rows per INSERT statement
+        :param int max_retries: Retries of each partition after transient
+            errors
+        :param float retry_delay: Seconds before the first retry, doubled
+            on each retry
+        :param dict session: Session variables set on each connection
+            before inserting, e.g. {'foreign_key_checks': 0}
+        """
+        self.codec = codec
+        self.conn_params = conn_params
+        self.n_connections = n_connections
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.session = session
+
+    def load(self, table_name, df):
+        """
+        Inserts all the rows in a table, which should not contain rows with
+        the same ids (e.g. an empty staging table).
+
+        :param str table_name: Destination table
+        :param pandas.DataFrame df: Rows to insert, with an 'id' column
+        :returns: Number of rows inserted
+        :rtype: int
+        """
+        partitions = self._partition(df)
+        with ThreadPoolExecutor(max_workers=self.n_connections) as executor:
+            futures = [executor.submit(self._load_partition,
+                                       table_name,
+                                       partition)
+                       for partition in partitions]
+            return sum(future.result() for future in futures)
+
+    def _partition(self, df):
+        df = df.sort_values('id')
+        bounds = np.linspace(0, len(df.index), self.n_connections + 1,
+                             dtype=int)
+        return [df.iloc[start:end]
+                for start, end in zip(bounds[:-1], bounds[1:])
+                if end > start]
+
+    def _load_partition(self, table_name, partition):
+        first_id = int(partition['id'].iloc[0])
+        last_id = int(partition['id'].iloc[-1])
+
+        def load():
+            conn = self.codec._connect(**self.conn_params)
+            try:
+                if self.session:
+                    set_session(conn, self.session)
+                with conn.cursor() as cursor:
+                    # Rows of a previous attempt whose commit outcome is
+                    # unknown (e.g. the connection was lost)
+                    cursor.execute(
+                        'DELETE FROM {} WHERE id BETWEEN %s AND %s'.format(
+                            table_name),
+                        [first_id, last_id])
+                    self.codec._insert_rows(cursor, table_name, partition,
+                                            self.batch_size)
+                conn.commit()
+            finally:
+                _close_quietly(conn)
+            return len(partition.index)
+
+        return retry(load,
+                     self.max_retries,
+                     self.retry_delay,
+                     'ids {}-{} of {}'.format(first_id, last_id, table_name))
+
+
+class ResumableLoader(object):
+    """
+    Inserts the rows of a data table into its staging table in batches,
+    committing each batch together with a checkpoint (table, content hash
+    and last committed id) in the *data_manager_checkpoints* table.
+
+    If a previous load of the same content was interrupted, its staging
+    table is reused and only the batches after the checkpoint are inserted.
+    Transient errors are retried automatically with exponential backoff,
+    reconnecting if needed.
+    """
+
+    CHECKPOINT_TABLE = 'data_manager_checkpoints'
+
+    def __init__(self, codec, conn_params, table_name, batch_size=1000,
+                 max_retries=5, retry_delay=1.0):
+        """
+        :param MySQLCodec codec: Codec used to connect and insert rows
+        :param dict conn_params: Connection parameters (host, db, user and
+            password)
+        :param str table_name: Data table being replaced
+        :param int batch_size: Number of rows per committed batch
+        :param int max_retries: Consecutive retries after transient errors
+        :param float retry_delay: Seconds before the first retry, doubled
+            on each retry
+        """
+        self.codec = codec
+        self.conn_params = conn_params
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._conn = None
+
+    def load(self, staging_table, df):
+        """
+        Fills the staging table, resuming a previous load if possible.
+
+        :param str staging_table: Staging table of *table_name*
+        :param pandas.DataFrame df: Rows to insert, with an 'id' column
+        :returns: Number of rows inserted by this call
+        :rtype: int
+        """
+        df = df.sort_values('id')
+        content_hash = self._content_hash(df)
+        try:
+            last_id = self._run(self._prepare, staging_table, content_hash)
+            if last_id is not None:
+                logger.info('Resuming {} after id {}'.format(
+                    self.table_name, last_id))
+                df = df[df['id'] > last_id]
+            for i in range(0, len(df.index), self.batch_size):
+                self._run(self._load_batch,
+                          staging_table,
+                          df.iloc[i:i + self.batch_size])
+        finally:
+            _close_quietly(self._conn)
+            self._conn = None
+        return len(df.index)
+
+    def clear_checkpoint(self, conn):
+        """
+        Removes the checkpoint once the staging table has been published.
+
+        :param conn: MySQL connection (the caller commits)
+        """
+        with conn.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {} WHERE table_name = %s'.format(
+                    ResumableLoader.CHECKPOINT_TABLE),
+                [self.table_name])
+
+    def _content_hash(self, df):
+        row_hashes = pd.util.hash_pandas_object(df, index=False)
+        content_hash = hashlib.sha1(row_hashes.values.tobytes())
+        content_hash.update(','.join(map(str, df.columns)).encode('utf-8'))
+        return content_hash.hexdigest()
+
+    def _run(self, function, *args):
+        def run():
+            if self._conn is None:
+                self._conn = self.codec._connect(**self.conn_params)
+            try:
+                result = function(self._conn, *args)
+                self._conn.commit()
+                return result
+            except Exception:
+                _close_quietly(self._conn)
+                self._conn = None
+                raise
+
+        return retry(run, self.max_retries, self.retry_delay, self.table_name)
+
+    def _prepare(self, conn, staging_table, content_hash):
+        """ Returns the last committed id if the previous load can be
+        resumed, otherwise creates an empty staging table. """
+        with conn.cursor() as cursor:
+            cursor.execute(
+                'CREATE TABLE IF NOT EXISTS {} ('
+                ' table_name VARCHAR(64) PRIMARY KEY, '
+                ' content_hash CHAR(40) NOT NULL, '
+                ' last_id INT NULL, '
+                ' updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP '
+                '  ON UPDATE CURRENT_TIMESTAMP'
+                ') ENGINE=InnoDB'.format(ResumableLoader.CHECKPOINT_TABLE))
+            cursor.execute(
+                'SELECT content_hash, last_id FROM {} '
+                'WHERE table_name = %s'.format(
+                    ResumableLoader.CHECKPOINT_TABLE),
+                [self.table_name])
+            checkpoint = cursor.fetchone()
+            cursor.execute('SHOW TABLES LIKE %s', [staging_table])
+            staging_exists = cursor.fetchone() is not None
+
+        if checkpoint is not None and staging_exists and \
+                checkpoint['content_hash'] == content_hash:
+            return checkpoint['last_id']
+
+        self.codec._create_staging_table(conn, self.table_name,
+                                         staging_table)
+        with conn.cursor() as cursor:
+            cursor.execute(
+                'REPLACE INTO {} (table_name, content_hash, last_id) '
+                'VALUES (%s, %s, NULL)'.format(
+                    ResumableLoader.CHECKPOINT_TABLE),
+                [self.table_name, content_hash])
+        return None
+
+    def _load_batch(self, conn, staging_table, batch):
+        with conn.cursor() as cursor:
+            # A retried batch may have been committed before the connection
+            # was lost, the checkpoint tells which rows are already there.
+            cursor.execute(
+                'SELECT last_id FROM {} WHERE table_name = %s '
+                'FOR UPDATE'.format(ResumableLoader.CHECKPOINT_TABLE),
+                [self.table_name])
+            last_id = cursor.fetchone()['last_id']
+            if last_id is not None:
+                batch = batch[batch['id'] > last_id]
+            if len(batch.index) == 0:
+                return
+            self.codec._insert_rows(cursor, staging_table, batch,
+                                    len(batch.index))
+            cursor.execute(
+                'UPDATE {} SET last_id = %s WHERE table_name = %s'.format(
+                    ResumableLoader.CHECKPOINT_TABLE),
+                [int(batch['id'].iloc[-1]), self.table_name])
+
+
+def retry(function, max_retries, retry_delay, description):
+    """
+    Calls a function, calling it again after transient MySQL errors with
+    exponential backoff.
+
+    :param function: Function without parameters
+    :param int max_retries: Maximum number of retries
+    :param float retry_delay: Seconds before the first retry, doubled on
+        each retry
+    :param str description: Description of the operation for the logs
+    :returns: The function result
+    """
+    attempt = 0
+    while True:
+        try:
+            return function()
+        except Exception as e:
+            if not is_transient_error(e) or attempt >= max_retries:
+                raise e from None
+            delay = retry_delay * 2 ** attempt
+            logger.warning('{} failed ({}), retrying in {}s'.format(
+                description, e, delay))
+            time.sleep(delay)
+            attempt += 1
+
+
+def set_session(conn, variables):
+    """
+    Sets session variables of a connection.
+
+    :param conn: MySQL connection
+    :param dict variables: Dictionary with elements {name: value}
+    """
+    with conn.cursor() as cursor:
+        for name, value in variables.items():
+            cursor.execute('SET SESSION {} = %s'.format(name), [value])
+
+
+def _close_quietly(conn):
+    if conn is None or not conn.open:
+        return
+    try:
+        conn.rollback()
+        conn.close()
+    except Exception:
+        pass
@@ -0,0 +1,356 @@
+""" mysql_schema.py
+
+This module includes the schema inference used to create the MySQL data
+tables.
+
+"""
+
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+
+__all__ = ['ColumnSchema', 'IndexSchema', 'infer_schema', 'widen_columns',
+           'indexed_columns', 'infer_indexes', ]
+
+logger = logging.getLogger(__name__)
+
+# Bytes per character reserved by MySQL for the utf8 charset
+UTF8_CHAR_BYTES = 3
+# Bytes counted towards the row size limit for TEXT columns (only the
+# pointer to the off-page data is stored in the row)
+TEXT_ROW_BYTES = 12
+INTEGER_TYPES = [
+    ('SMALLINT', 2, -2 ** 15, 2 ** 15 - 1),
+    ('INT', 4, -2 ** 31, 2 ** 31 - 1),
+    ('BIGINT', 8, -2 ** 63, 2 ** 63 - 1),
+]
+# Bytes of the MySQL integer types, to compare existing columns
+INTEGER_BYTES = {'tinyint': 1, 'smallint': 2, 'mediumint': 3, 'int': 4,
+                 'bigint': 8}
+# Characters of the longest integer (-9223372036854775808)
+INTEGER_MAX_LENGTH = 20
+MIN_VARCHAR_SIZE = 16
+# Semantic types of the variables used to filter the data tables
+INDEXED_TYPES = ['iso', 'hpv_type']
+REF_TYPES = ['sources', 'notes', 'methods', 'years', 'dates']
+# Number of characters indexed for TEXT columns
+TEXT_INDEX_LENGTH = 64
+MAX_IDENTIFIER_LENGTH = 64
+# Hexadecimal characters of the hash appended to truncated index names
+INDEX_HASH_LENGTH = 8
+
+
+class ColumnSchema(object):
+    """
+    Inferred definition of a data table column.
+    """
+
+    def __init__(self, name, sql_type, row_bytes, description='',
+                 max_length=0, n_unique=0):
+        """
+        :param str name: Column name
+        :param str sql_type: MySQL type (e.g. 'INT', 'VARCHAR(64)', ...)
+        :param int row_bytes: Bytes counted towards the row size limit
+        :param str description: Column description (used as comment)
+        :param int max_length: Maximum length of the current values
+        :param int n_unique: Number of distinct values
+        """
+        self.name = name
+        self.sql_type = sql_type
+        self.row_bytes = row_bytes
+        self.description = description
+        self.max_length = max_length
+        self.n_unique = n_unique
+
+    def __repr__(self):
+        return '{}({}, {})'.format(self.__class__.__name__,
+                                   self.name,
+                                   self.sql_type)
+
+    @property
+    def is_text(self):
+        return self.sql_type == 'TEXT'
+
+    def clause(self):
+        """
+        :returns: Column definition for a CREATE TABLE statement
+        :rtype: str
+        """
+        return '`{}` {} COMMENT \'{}\''.format(
+            self.name,
+            self.sql_type,
+            self.description.replace('\'', '\'\'')
+        )
+
+
+class IndexSchema(object):
+    """
+    Definition of a secondary index over a single data table column.
+    """
+
+    def __init__(self, column, is_text=False):
+        """
+        :param str column: Indexed column
+        :param bool is_text: Whether the column is TEXT (only a prefix of the
+            values can be indexed)
+        """
+        self.column = column
+        self.is_text = is_text
+        self.name = '{}_IX'.format(column)
+        if len(self.name) > MAX_IDENTIFIER_LENGTH:
+            # The hash of the whole column name keeps the indexes of long columns
+            # with the same prefix apart
+            digest = hashlib.sha1(column.encode('utf-8')).hexdigest()
+            prefix = column[:MAX_IDENTIFIER_LENGTH - INDEX_HASH_LENGTH - 4]
+            self.name = '{}_{}_IX'.format(prefix,
+                                          digest[:INDEX_HASH_LENGTH])
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.column)
+
+    def clause(self):
+        """
+        :returns: Index definition for CREATE TABLE or ALTER TABLE ... ADD
+        :rtype: str
+        """
+        if self.is_text:
+            column = '`{}`({})'.format(self.column, TEXT_INDEX_LENGTH)
+        else:
+            column = '`{}`'.format(self.column)
+        return 'INDEX `{}` ({})'.format(self.name, column)
+
+
+def infer_schema(data, varchar_size=200, max_row_size=65535):
+    """
+    Infers the MySQL column types of a data table. All the data columns are
+    profiled at once (maximum length, integer values and cardinality) and
+    the semantic types of the variables decide which profiles are relevant:
+
+    * The *id* column is always an INT.
+    * *integer* variables whose values are all integers get the smallest
+      integer type that fits them.
+    * *iso* variables get a CHAR(3).
+    * The rest of variables get a VARCHAR sized after their current values,
+      or TEXT if they are longer than *varchar_size*.
+
+    If the resulting row is bigger than *max_row_size* the biggest VARCHAR
+    columns are turned into TEXT until it fits.
+
+    The data columns must be text, except for *integer* variables, which
+    can also be numbers (e.g. loaded from a database).
+
+    :param data: Data structure with HPV Information Centre format
+    :param int varchar_size: Maximum size of VARCHAR columns
+    :param int max_row_size: Maximum row size in bytes
+    :returns: Schema of each variable, in the same order
+    :rtype: list
+    :raises ValueError: If a column doesn't have a text type
+    """
+    variables = data['variables']
+    data_df = data['data'][list(variables['variable'])]
+    for var in variables.itertuples():
+        if var.variable != 'id' and \
+                not _is_text_column(data_df[var.variable], var.type):
+            raise ValueError(
+                '"{}" must have a text type '
+                '(e.g. VARCHAR, TEXT, ...).'.format(var.variable))
+    profile = _profile_columns(data_df)
+
+    columns = []
+    for var in variables.itertuples():
+        var_profile = profile.loc[var.variable]
+        max_length = int(var_profile['max_length'])
+        n_unique = int(var_profile['n_unique'])
+        integer_type = None
+        if var.type == 'integer' and var_profile['is_integer']:
+            integer_type = _integer_type(var_profile['min'],
+                                         var_profile['max'])
+        if var.variable == 'id':
+            sql_type, row_bytes = 'INT', 4
+        elif integer_type is not None:
+            sql_type, row_bytes = integer_type
+        elif var.type == 'iso' and max_length <= 3:
+            sql_type, row_bytes = 'CHAR(3)', 3 * UTF8_CHAR_BYTES
+        elif max_length > varchar_size:
+            sql_type, row_bytes = 'TEXT', TEXT_ROW_BYTES
+        else:
+            sql_type, row_bytes = _varchar_type(max_length, varchar_size)
+        columns.append(ColumnSchema(var.variable,
+                                    sql_type,
+                                    row_bytes,
+                                    description=var.description,
+                                    max_length=max_length,
+                                    n_unique=n_unique))
+
+    _fit_row_size(columns, max_row_size)
+    return columns
+
+
+def widen_columns(schema, existing, varchar_size=200):
+    """
+    Columns of an existing data table that are too small for new data, so
+    tables created for a first upload (see *infer_schema*) can grow with
+    later ones:
+
+    * Integer columns whose values need a bigger integer type, or that are
+      no longer integers.
+    * CHAR and VARCHAR columns shorter than the new values.
+
+    Columns are never narrowed, and columns of other types (e.g. TEXT) are
+    kept.
+
+    :param list schema: Column schemas of the new data (see *infer_schema*)
+    :param dict existing: Existing columns, {name: (data type, maximum
+        number of characters)} as in *information_schema.COLUMNS*
+    :param int varchar_size: Maximum size of VARCHAR columns
+    :returns: Column schemas of the columns to modify
+    :rtype: list
+    """
+    columns = []
+    for col in schema:
+        if col.name == 'id' or col.name not in existing:
+            continue
+        data_type, length = existing[col.name]
+        data_type = data_type.lower()
+        new_type = col.sql_type.split('(')[0].lower()
+        if data_type in INTEGER_BYTES:
+            if new_type not in INTEGER_BYTES:
+                # The stored integers must fit in the new text column too
+                columns.append(_text_column(
+                    col, max(col.max_length, INTEGER_MAX_LENGTH),
+                    varchar_size))
+            elif INTEGER_BYTES[new_type] > INTEGER_BYTES[data_type]:
+                columns.append(col)
+        elif data_type in ['char', 'varchar'] and col.max_length > length:
+            # Kept as text (e.g. if the new values are integers)
+            columns.append(_text_column(col, col.max_length, varchar_size))
+    return columns
+
+
+def _text_column(col, max_length, varchar_size):
+    if max_length > varchar_size:
+        sql_type, row_bytes = 'TEXT', TEXT_ROW_BYTES
+    else:
+        sql_type, row_bytes = _varchar_type(max_length, varchar_size)
+    return ColumnSchema(col.name,
+                        sql_type,
+                        row_bytes,
+                        description=col.description,
+                        max_length=max_length,
+                        n_unique=col.n_unique)
+
+
+def _is_text_column(col, var_type):
+    if pd.api.types.is_string_dtype(col.dtype):
+        return True
+    if var_type != 'integer':
+        return False
+    if pd.api.types.is_integer_dtype(col):
+        return True
+    # Integer columns with missing values are loaded as floats
+    return pd.api.types.is_float_dtype(col) and \
+        bool((col.dropna() % 1 == 0).all())
+
+
+def _as_text(col):
+    if pd.api.types.is_float_dtype(col):
+        values = col.dropna()
+        if np.isfinite(values).all() and \
+                (values.abs() < 2.0 ** 63).all():
+            return col.round().astype('Int64').astype(str).where(
+                col.notna(), '')
+        # Out of the range of the integers, so never stored as one
+        return col.map(lambda value: '' if pd.isna(value)
+                       else '{:.0f}'.format(value))
+    return col.fillna('').astype(str)
+
+
+def _profile_columns(data_df):
+    values = data_df.apply(_as_text)
+    # Integer values must have a canonical representation (e.g. no '007'
+    # or '1.0'), otherwise storing them as numbers would change them.
+    integral = values.apply(
+        lambda col: col.str.fullmatch(r'-?(0|[1-9][0-9]*)'))
+    numbers = values.where(integral).apply(pd.to_numeric)
+    lengths = values.apply(lambda col: col.str.len())
+    return pd.DataFrame({
+        'max_length': lengths.max().fillna(0),
+        'n_unique': values.nunique(),
+        'is_integer': integral.all() & (len(values.index) > 0),
+        'min': numbers.min(),
+        'max': numbers.max(),
+    })
+
+
+def _integer_type(min_value, max_value):
+    for sql_type, row_bytes, type_min, type_max in INTEGER_TYPES:
+        if min_value >= type_min and max_value <= type_max:
+            return sql_type, row_bytes
+    return None
+
+
+def _varchar_type(max_length, varchar_size):
+    # Some room is left for longer values in future uploads
+    size = MIN_VARCHAR_SIZE
+    while size < max_length:
+        size *= 2
+    size = min(size, varchar_size)
+    max_bytes = size * UTF8_CHAR_BYTES
+    return ('VARCHAR({})'.format(size),
+            max_bytes + (1 if max_bytes < 256 else 2))
+
+
+def _fit_row_size(columns, max_row_size):
+    row_size = sum(col.row_bytes for col in columns)
+    varchars = sorted([col for col in columns
+                       if col.sql_type.startswith('VARCHAR')],
+                      key=lambda col: col.row_bytes,
+                      reverse=True)
+    for col in varchars:
+        if row_size <= max_row_size:
+            break
+        logger.debug('Row too big ({} bytes), "{}" will be TEXT'.format(
+            row_size, col.name))
+        row_size -= col.row_bytes - TEXT_ROW_BYTES
+        col.sql_type = 'TEXT'
+        col.row_bytes = TEXT_ROW_BYTES
+    if row_size > max_row_size:
+        raise ValueError('Row size ({} bytes) exceeds the maximum '
+                         '({} bytes)'.format(row_size, max_row_size))
+
+
+def indexed_columns(data):
+    """
+    Columns of a data table that should have a secondary index: variables
+    with an indexed semantic type (e.g. iso) and variables used to stratify
+    the references.
+
+    :param data: Data structure with HPV Information Centre format
+    :returns: Column names, in the same order as the variables
+    :rtype: list
+    """
+    variables = data['variables']
+    columns = set(variables.loc[variables['type'].isin(INDEXED_TYPES),
+                                'variable'])
+    for ref_type in REF_TYPES:
+        if ref_type in data and \
+                'strata_variable' in data[ref_type].columns:
+            columns.update(
+                data[ref_type]['strata_variable'].astype(str).unique())
+    return [var for var in variables['variable']
+            if var in columns and var != 'id']
+
+
+def infer_indexes(data, schema):
+    """
+    Secondary indexes of a new data table (see *indexed_columns*).
+
+    :param data: Data structure with HPV Information Centre format
+    :param list schema: Column schemas returned by *infer_schema*
+    :returns: Index definitions
+    :rtype: list
+    """
+    text_columns = set(col.name for col in schema if col.is_text)
+    return [IndexSchema(column, is_text=column in text_columns)
+            for column in indexed_columns(data)]
@@ -7,11 +7,7 @@ This module includes the codec implementation for excel data sources.
 import logging
 import re
 import pandas as pd
-import numpy as np
-import xlsxwriter
-import pymysql
 from infocentre_data_manager.plugins.codecs.base import Codec
-from infocentre_data_manager.plugins.semantic_types.base import SemanticType
 
 __all__ = ['OldExcelCodec', ]
 
@@ -23,13 +19,24 @@ class OldExcelCodec(Codec):
     """
 
     def load(self, **kwargs):
+        """
+        Loads an old excel template. The publication date is not part of the
+        template, it is taken from *publication_dates* (a dictionary with
+        elements {table_name: date}, see *prefetch_publication_dates*) if
+        provided, otherwise it is queried from the database (*host*, *db*,
+        *user* and *password* parameters).
+        """
         try:
             excel_file = kwargs['file']
         except KeyError:
             raise ValueError('No "file" parameter provided')
-        general = pd.read_excel(excel_file,
-                                sheet_name='WELCOME',
-                                header=None).loc[4:11, [1]].T
+        # The workbook is parsed only once for all the sheets
+        with pd.ExcelFile(excel_file) as workbook:
+            return self._load_workbook(workbook, **kwargs)
+
+    def _load_workbook(self, workbook, **kwargs):
+        general = workbook.parse(sheet_name='WELCOME',
+                                 header=None).loc[4:11, [1]].T
         general[pd.isna(general)] = ''
         general.columns = ['contents',
                            '__description',
@@ -40,10 +47,10 @@ class OldExcelCodec(Codec):
                            'table_name',
                            '__preffix']
 
-        data = pd.read_excel(excel_file, sheet_name='DATA')
+        data = workbook.parse(sheet_name='DATA')
         data = data.astype(str)
 
-        variables = pd.read_excel(excel_file, sheet_name='VARIABLES')
+        variables = workbook.parse(sheet_name='VARIABLES')
         variables.columns = ['__id', 'variable', 'description',
                              '__short_desc', '__type', '__primary']
         variables['variable'] = [v.variable if not pd.isna(v.variable)
@@ -68,39 +75,36 @@ class OldExcelCodec(Codec):
         new_ref_columns = ['__description', 'iso', 'strata_variable',
                            'strata_value', 'applyto_variable', '__table',
                            '__id', 'value']
-        sources = pd.read_excel(excel_file, sheet_name='SOURCES', dtype=str)
+        sources = workbook.parse(sheet_name='SOURCES', dtype=str)
         sources.columns = new_ref_columns
-        notes = pd.read_excel(excel_file, sheet_name='NOTES', dtype=str)
+        notes = workbook.parse(sheet_name='NOTES', dtype=str)
         notes.columns = new_ref_columns
-        methods = pd.read_excel(excel_file, sheet_name='METHODS', dtype=str)
+        methods = workbook.parse(sheet_name='METHODS', dtype=str)
         methods.columns = new_ref_columns
-        years = pd.read_excel(excel_file, sheet_name='YEARS', dtype=str)
+        years = workbook.parse(sheet_name='YEARS', dtype=str)
         years.columns = new_ref_columns
-        dates = pd.read_excel(excel_file, sheet_name='DATES', dtype=str)
+        dates = workbook.parse(sheet_name='DATES', dtype=str)
         dates.columns = ['__description', 'iso', 'strata_variable',
                          'strata_value', 'applyto_variable', '__table',
                          'date_accessed', 'date_closing', 'date_delivery']
 
-        host = kwargs['host']
-        db = kwargs['db']
-        user = kwargs['user']
-        password = kwargs['password']
         table_name = general.at[1, 'table_name']
-
-        conn = pymysql.connect(host=host,
-                               user=user,
-                               password=password,
-                               db=db,
-                               charset='utf8',
-                               cursorclass=pymysql.cursors.DictCursor)
-        date_published = pd.read_sql(
-            'SELECT datePublicacio '
-            'FROM view_relatedinf_date_by '
-            'WHERE data_tbl = %s',
-            con=conn,
-            params=[table_name]
-        )['datePublicacio']
-        dates['date_published'] = date_published
+        if 'publication_dates' in kwargs:
+            dates['date_published'] = \
+                kwargs['publication_dates'].get(table_name)
+        else:
+            conn = self._connect(kwargs)
+            try:
+                date_published = pd.read_sql(
+                    'SELECT datePublicacio '
+                    'FROM view_relatedinf_date_by '
+                    'WHERE data_tbl = %s',
+                    con=conn,
+                    params=[table_name]
+                )['datePublicacio']
+            finally:
+                conn.close()
+            dates['date_published'] = date_published
         for date in ['date_accessed', 'date_closing',
                      'date_delivery', 'date_published']:
             matches = re.findall('(\d{4})-(\d{2})-(\d{2})',
@@ -129,3 +133,33 @@ class OldExcelCodec(Codec):
     def store(self, data, **kwargs):
         raise NotImplementedError(
             'Storing not implemented for old excel templates')
+
+    def prefetch_publication_dates(self, **kwargs):
+        """
+        Fetches the publication dates of all the tables with a single query,
+        to be passed as *publication_dates* to *load*.
+
+        :param dict kwargs: Database parameters (host, db, user, password)
+        :returns: Dictionary with elements {table_name: date}
+        :rtype: dict
+        """
+        conn = self._connect(kwargs)
+        try:
+            dates = pd.read_sql(
+                'SELECT data_tbl, datePublicacio '
+                'FROM view_relatedinf_date_by',
+                con=conn
+            )
+        finally:
+            conn.close()
+        dates = dates.drop_duplicates('data_tbl')
+        return dict(zip(dates['data_tbl'], dates['datePublicacio']))
+
+    def _connect(self, kwargs):
+        import pymysql.cursors
+        return pymysql.connect(host=kwargs['host'],
+                               user=kwargs['user'],
+                               password=kwargs['password'],
+                               db=kwargs['db'],
+                               charset='utf8',
+                               cursorclass=pymysql.cursors.DictCursor)
@@ -5,12 +5,9 @@ This module includes the codec implementation for excel data sources.
 """
 
 import logging
-import pandas as pd
-import numpy as np
-import pickle
 import joblib
+from infocentre_data_manager.dataset import Dataset
 from infocentre_data_manager.plugins.codecs.base import Codec
-from infocentre_data_manager.plugins.semantic_types.base import SemanticType
 
 __all__ = ['PickleCodec', ]
 
@@ -40,4 +37,7 @@ class PickleCodec(Codec):
         except KeyError:
             raise ValueError('No "file" parameter provided')
 
+        if isinstance(data, Dataset):
+            # Pickles keep the plain dictionary representation
+            data = data.to_dict()
         joblib.dump(data, pickle_file)
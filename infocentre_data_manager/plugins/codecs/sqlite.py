@@ -0,0 +1,354 @@
+""" sqlite.py
+
+This module includes the codec implementation for SQLite database files.
+
+"""
+
+import logging
+import re
+import sqlite3
+from functools import partial
+import numpy as np
+import pandas as pd
+from infocentre_data_manager.dataset import Dataset
+from infocentre_data_manager.plugins.codecs.base import Codec
+from infocentre_data_manager.plugins.codecs.mysql_schema import \
+    infer_indexes, infer_schema
+
+__all__ = ['SQLiteCodec', ]
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteCodec(Codec):
+    """
+    Plugin that implements the HPV Information Centre data loading from and
+    storing to SQLite database files, which need no server (e.g. to stage
+    tables locally or in tests). The database has the same tables as the
+    MySQL one (*info_tables*, *info_vars*, *ref_\\**, *ref_\\*_by*,
+    *ref_dates_by* and one table per data table), so any number of data
+    tables can be stored in the same file and queried together (see
+    *query*).
+    """
+
+    REF_TYPES = ['sources', 'notes', 'methods', 'years']
+    DATE_TYPES = ['date_accessed', 'date_closing',
+                  'date_delivery', 'date_published']
+
+    def load(self, lazy=True, **kwargs):
+        database = self._database(kwargs)
+        try:
+            table_name = kwargs['table']
+        except KeyError:
+            raise ValueError('No "table" parameter provided')
+        loaders = {
+            'general': (self._load_general_data, table_name),
+            'variables': (self._load_variable_data, table_name),
+            'data': (self._load_raw_data, table_name),
+            'sources': (self._load_ref_data, table_name, 'sources'),
+            'notes': (self._load_ref_data, table_name, 'notes'),
+            'methods': (self._load_ref_data, table_name, 'methods'),
+            'years': (self._load_ref_data, table_name, 'years'),
+            'dates': (self._load_dates_data, table_name),
+        }
+
+        if not lazy:
+            conn = self._connect(database)
+            try:
+                frames = [(key, loader[0](conn, *loader[1:]))
+                          for key, loader in loaders.items()]
+            finally:
+                conn.close()
+            return Dataset(**dict(frames))
+
+        return Dataset({
+            key: partial(self._load_lazily, database, *loader)
+            for key, loader in loaders.items()
+        })
+
+    def query(self, sql, params=None, **kwargs):
+        """
+        Runs a query over the database file, e.g. to analyse several data
+        tables at once.
+
+        :param str sql: Query, with ``?`` parameter placeholders
+        :param list params: Query parameters
+        :param kwargs: Database parameters (*file*)
+        :returns: Query results
+        :rtype: pandas.DataFrame
+        """
+        conn = self._connect(self._database(kwargs))
+        try:
+            return self._read(conn, sql, params or [])
+        finally:
+            conn.close()
+
+    def _database(self, kwargs):
+        try:
+            return kwargs['file']
+        except KeyError:
+            raise ValueError('No "file" parameter provided')
+
+    def _connect(self, database):
+        # Transactions are started explicitly (see store)
+        return sqlite3.connect(database, isolation_level=None)
+
+    def _read(self, conn, sql, params):
+        return pd.read_sql(sql, conn, params=params)
+
+    def _load_lazily(self, database, load_function, *args):
+        conn = self._connect(database)
+        try:
+            return load_function(conn, *args)
+        finally:
+            conn.close()
+
+    def _load_general_data(self, conn, table_name):
+        return self._read(
+            conn,
+            'SELECT table_name, contents, data_manager, comments '
+            'FROM info_tables '
+            'WHERE table_name = ?',
+            [table_name])
+
+    def _load_variable_data(self, conn, table_name):
+        return self._read(
+            conn,
+            'SELECT name AS variable, description, semantic_type AS type '
+            'FROM info_vars '
+            'WHERE data_table = ? '
+            'ORDER BY "order" ASC',
+            [table_name])
+
+    def _load_raw_data(self, conn, table_name):
+        return self._read(conn,
+                          'SELECT * FROM {}'.format(_quote(table_name)),
+                          [])
+
+    def _load_ref_data(self, conn, table_name, ref_type):
+        ref_table = 'ref_{}'.format(ref_type)
+        return self._read(
+            conn,
+            'SELECT iso, strata_variable, strata_value, '
+            ' applyto_variable, value '
+            'FROM {}_by b '
+            'JOIN {} a ON b.id_{} = a.id '
+            'WHERE b.data_table = ?'.format(
+                ref_table, ref_table, ref_type[:-1]),
+            [table_name])
+
+    def _load_dates_data(self, conn, table_name):
+        dates = self._read(
+            conn,
+            'SELECT iso, strata_variable, strata_value, '
+            ' applyto_variable, {} '
+            'FROM ref_dates_by '
+            'WHERE data_table = ?'.format(
+                ', '.join(SQLiteCodec.DATE_TYPES)),
+            [table_name])
+        for date_type in SQLiteCodec.DATE_TYPES:
+            dates[date_type] = dates[date_type].map(_format_date)
+        return dates
+
+    def store(self, data, create_indexes=True, **kwargs):
+        """
+        Stores a data table, replacing it (together with its metadata and
+        references) if it already exists. The whole table is stored in a
+        single transaction.
+
+        :param data: Data structure with HPV Information Centre format
+        :param bool create_indexes: Whether the secondary indexes of the
+            data table are created (see *mysql_schema.indexed_columns*)
+        :param kwargs: Database parameters (*file*)
+        """
+        conn = self._connect(self._database(kwargs))
+        try:
+            self._create_metadata_tables(conn)
+            self._begin(conn)
+            self._create_table(conn, data, create_indexes)
+            self._insert_dataframe(conn,
+                                   data['general']['table_name'].iloc[0],
+                                   data['data'])
+            self._store_general_data(conn, data)
+            self._store_variable_data(conn, data)
+            for ref_type in SQLiteCodec.REF_TYPES:
+                self._store_ref_data(conn, data, ref_type)
+            self._store_dates_data(conn, data)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e from None
+        finally:
+            conn.close()
+
+    def _begin(self, conn):
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('BEGIN')
+
+    def _metadata_statements(self):
+        statements = [
+            'CREATE TABLE IF NOT EXISTS info_tables ('
+            ' table_name TEXT PRIMARY KEY, module INTEGER, '
+            ' data_manager TEXT, contents TEXT, comments TEXT)',
+            'CREATE TABLE IF NOT EXISTS info_vars ('
+            ' data_table TEXT NOT NULL, name TEXT NOT NULL, '
+            ' description TEXT, semantic_type TEXT, "order" INTEGER)',
+            'CREATE INDEX IF NOT EXISTS info_vars_data_table_IX '
+            'ON info_vars (data_table)',
+            'CREATE TABLE IF NOT EXISTS ref_dates_by ('
+            ' iso TEXT, strata_variable TEXT, strata_value TEXT, '
+            ' applyto_variable TEXT, data_table TEXT NOT NULL, '
+            ' date_accessed DATE, date_closing DATE, '
+            ' date_delivery DATE, date_published DATE)',
+            'CREATE INDEX IF NOT EXISTS ref_dates_by_data_table_IX '
+            'ON ref_dates_by (data_table)',
+        ]
+        for ref_type in SQLiteCodec.REF_TYPES:
+            statements.extend(self._ref_statements(ref_type))
+        return statements
+
+    def _ref_statements(self, ref_type):
+        return [
+            'CREATE TABLE IF NOT EXISTS ref_{} ('
+            ' id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE)'.format(
+                ref_type),
+            self._ref_by_statement(ref_type),
+            'CREATE INDEX IF NOT EXISTS ref_{0}_by_data_table_IX '
+            'ON ref_{0}_by (data_table)'.format(ref_type),
+        ]
+
+    def _ref_by_statement(self, ref_type):
+        return ('CREATE TABLE IF NOT EXISTS ref_{}_by ('
+                ' iso TEXT, strata_variable TEXT, strata_value TEXT, '
+                ' applyto_variable TEXT, data_table TEXT NOT NULL, '
+                ' id_{} INTEGER NOT NULL)'.format(ref_type, ref_type[:-1]))
+
+    def _create_metadata_tables(self, conn):
+        for statement in self._metadata_statements():
+            conn.execute(statement)
+
+    def _create_table(self, conn, data, create_indexes):
+        """ (Re)creates the data table with the same column types that a
+        new MySQL table would have. """
+        table_name = data['general']['table_name'].iloc[0]
+        schema = infer_schema(data)
+        conn.execute('DROP TABLE IF EXISTS {}'.format(_quote(table_name)))
+        conn.execute('CREATE TABLE {} ({}, PRIMARY KEY ("id"))'.format(
+            _quote(table_name),
+            ', '.join('{} {}'.format(_quote(col.name), col.sql_type)
+                      for col in schema)))
+        if not create_indexes:
+            return
+        for index in infer_indexes(data, schema):
+            # Index names are unique in the whole database
+            conn.execute('CREATE INDEX {} ON {} ({})'.format(
+                _quote('{}_{}'.format(table_name, index.name)),
+                _quote(table_name),
+                _quote(index.column)))
+
+    def _insert_dataframe(self, conn, table_name, df):
+        conn.executemany(
+            'INSERT INTO {} ({}) VALUES ({})'.format(
+                _quote(table_name),
+                ', '.join(_quote(col) for col in df.columns),
+                ', '.join('?' * len(df.columns))),
+            _rows(df))
+
+    def _store_general_data(self, conn, data):
+        general = data['general'].iloc[0]
+        table_name = general['table_name']
+        module_strings = re.findall(r'_m([\d]*)_', table_name)
+        module = int(module_strings[0]) if module_strings else -9
+        conn.execute('DELETE FROM info_tables WHERE table_name = ?',
+                     [table_name])
+        conn.execute(
+            'INSERT INTO info_tables '
+            '(table_name, module, data_manager, contents, comments) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [table_name, module, _text(general['data_manager']),
+             _text(general['contents']), _text(general['comments'])])
+
+    def _store_variable_data(self, conn, data):
+        table_name = data['general']['table_name'].iloc[0]
+        variables = data['variables']
+        conn.execute('DELETE FROM info_vars WHERE data_table = ?',
+                     [table_name])
+        conn.executemany(
+            'INSERT INTO info_vars '
+            '(data_table, name, description, semantic_type, "order") '
+            'VALUES (?, ?, ?, ?, ?)',
+            [(table_name, _text(var.variable), _text(var.description),
+              _text(var.type), i)
+             for i, var in enumerate(variables.itertuples())])
+
+    def _store_ref_data(self, conn, data, ref_type):
+        table_name = data['general']['table_name'].iloc[0]
+        refs = data[ref_type]
+        conn.executemany(
+            'INSERT OR IGNORE INTO ref_{} (value) VALUES (?)'.format(
+                ref_type),
+            [(value, ) for value in refs['value'].astype(str).unique()])
+        conn.execute(
+            'DELETE FROM ref_{}_by WHERE data_table = ?'.format(ref_type),
+            [table_name])
+        conn.executemany(
+            'INSERT INTO ref_{0}_by (iso, strata_variable, strata_value, '
+            ' applyto_variable, data_table, id_{1}) '
+            'VALUES (?, ?, ?, ?, ?, '
+            ' (SELECT id FROM ref_{0} WHERE value = ?))'.format(
+                ref_type, ref_type[:-1]),
+            [(_text(row.iso), _text(row.strata_variable),
+              _text(row.strata_value), _text(row.applyto_variable),
+              table_name, str(row.value))
+             for row in refs.itertuples()])
+
+    def _store_dates_data(self, conn, data):
+        table_name = data['general']['table_name'].iloc[0]
+        conn.execute('DELETE FROM ref_dates_by WHERE data_table = ?',
+                     [table_name])
+        conn.executemany(
+            'INSERT INTO ref_dates_by (iso, strata_variable, strata_value, '
+            ' applyto_variable, data_table, {}) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'.format(
+                ', '.join(SQLiteCodec.DATE_TYPES)),
+            [[_text(row.iso), _text(row.strata_variable),
+              _text(row.strata_value), _text(row.applyto_variable),
+              table_name] +
+             [_date(getattr(row, date_type))
+              for date_type in SQLiteCodec.DATE_TYPES]
+             for row in data['dates'].itertuples()])
+
+
+def _quote(identifier):
+    return '"{}"'.format(str(identifier).replace('"', '""'))
+
+
+def _text(value):
+    """ Metadata values are stored as text, like in the MySQL database. """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return str(value)
+
+
+def _date(value):
+    """ Dates are stored as YYYY-MM-DD, empty dates as NULL. """
+    value = _text(value)
+    if value in [None, '', '-9999']:
+        return None
+    return value[:10]
+
+
+def _rows(df):
+    # Series.tolist converts numpy scalars into python values, which is
+    # what the database drivers can bind.
+    columns = [df[col].astype(object).where(df[col].notna(), None).tolist()
+               for col in df.columns]
+    return list(zip(*columns))
+
+
+def _format_date(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ''
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
@@ -4,12 +4,18 @@ This module includes the base plugin interface for data fetchers.
 
 """
 
+import copy
 import logging
 from abc import abstractmethod
+from collections import deque
+from infocentre_data_manager.plugins.data_validators.result import \
+    ValidationResult
 from infocentre_data_manager.plugins.plugin_module import PluginModule
 
 __all__ = ['DataValidator', ]
 
+logger = logging.getLogger(__name__)
+
 
 class DataValidator(PluginModule):
     """
@@ -19,38 +25,406 @@ class DataValidator(PluginModule):
 
     entry_point_group = 'data_validators'
 
+    # Validators that must not report errors for this one to be applied,
+    # as {validator id: issue codes} (None for any error). Dependencies not
+    # included in the same *apply* call are ignored.
+    depends_on = {}
+    # Whether the validator implements the chunked protocol (*begin*,
+    # *feed*, *merge* and *finish*) used by *apply_chunked*
+    supports_chunks = False
+    # Whether the issues of each row only depend on the row itself (and on
+    # the metadata), so only changed rows have to be validated again (see
+    # *apply_incremental* and *merge_rows*)
+    row_local = False
+
     @abstractmethod
     def validate(self, data_dict, **kwargs):
         raise NotImplementedError(
             'Data validation not implemented for {}'.format(self.__class__))
 
+    def validate_structured(self, data_dict, **kwargs):
+        """
+        Validates the data and returns the issues found as a structured
+        result. Validators that can locate their issues (sheet, column,
+        row, value) override it; by default the messages returned by
+        *validate* are wrapped.
+
+        :param data_dict: Data structure with HPV Information Centre format
+        :rtype: ValidationResult
+        """
+        return ValidationResult.from_dict(self.result_name(),
+                                          self.validate(data_dict, **kwargs))
+
+    def begin(self, data_dict, **kwargs):
+        """
+        Starts a chunked validation of the DATA sheet.
+
+        :param data_dict: Data structure with HPV Information Centre format,
+            without the 'data' dataframe
+        :param kwargs: Validation arguments (e.g. *max_errors*)
+        :returns: State of a validation that hasn't seen any data, it must
+            be picklable so chunks can be fed in other processes
+        """
+        raise NotImplementedError(
+            'Chunked validation not implemented for {}'.format(
+                self.__class__))
+
+    def feed(self, state, chunk):
+        """
+        Updates a state with the next rows of the DATA sheet.
+
+        :param state: State returned by *begin* or *feed*
+        :param pandas.DataFrame chunk: Consecutive rows of the DATA sheet
+        :returns: Updated state (*state* may be modified in place)
+        """
+        raise NotImplementedError(
+            'Chunked validation not implemented for {}'.format(
+                self.__class__))
+
+    def merge(self, state, other):
+        """
+        Merges the states of two consecutive parts of the DATA sheet, e.g.
+        chunks fed by different workers.
+
+        :param state: State of the first part
+        :param other: State of the part that follows it
+        :returns: State of both parts (*state* may be modified in place)
+        """
+        raise NotImplementedError(
+            'Chunked validation not implemented for {}'.format(
+                self.__class__))
+
+    def finish(self, state, data_dict):
+        """
+        :param state: State of the whole DATA sheet
+        :param data_dict: Data structure as in *begin*
+        :returns: The same result as *validate_structured* with the whole
+            DATA sheet
+        :rtype: ValidationResult
+        """
+        raise NotImplementedError(
+            'Chunked validation not implemented for {}'.format(
+                self.__class__))
+
+    def merge_rows(self, previous, changed, data_dict, changed_rows):
+        """
+        Builds the result of a table from the result of its previous
+        version and the result of its changed rows (only called for
+        *row_local* validators).
+
+        :param ValidationResult previous: Result of the previous version
+        :param ValidationResult changed: Result of the changed and added
+            rows
+        :param data_dict: Data structure with HPV Information Centre format
+        :param changed_rows: Boolean array with the changed and added rows
+            of the DATA sheet
+        :returns: The same result as *validate_structured* with the whole
+            table, None if it can't be built (e.g. the result was
+            truncated by an error budget)
+        :rtype: ValidationResult
+        """
+        return None
+
+    def result_name(self):
+        """
+        :returns: Name of the validator in the results
+        :rtype: str
+        """
+        return getattr(self, 'name', self.__class__.__name__)
+
     @staticmethod
-    def apply(data_dict, validators):
+    def apply(data_dict, validators, structured=False, fail_fast=False,
+              max_errors=None):
         """
         Apply list of validators to data and accumulate the results.
 
+        Validators are skipped (with a warning in their result) if one of
+        their dependencies (see *depends_on*) reported errors or, with
+        *fail_fast*, if any previous validator reported errors.
+
         :param data_dict: Data structure with HPV Information Centre format
-        :param validators: List of strings identifying the validators to be
-            applied.
+        :param validators: List of validators to be applied, either
+            dictionaries with their 'name' and 'args' or already
+            instantiated validators (e.g. to reuse them between calls).
+        :param bool structured: Whether to return *ValidationResult*
+            objects instead of dictionaries with the validator name
+            ('type') and the 'info', 'warnings' and 'errors' messages
+        :param bool fail_fast: Whether to stop after the first validator
+            that reports errors
+        :param int max_errors: Error budget of each validator, those that
+            support it stop looking for problems once they have found this
+            many
+        :rtype: list
+        """
+        validators = [DataValidator._instance(validator)
+                      for validator in validators]
+        return DataValidator._collect(
+            validators,
+            lambda validator: validator._apply(data_dict, max_errors),
+            structured, fail_fast)
+
+    @staticmethod
+    def apply_chunked(data_dict, chunks, validators, structured=False,
+                      fail_fast=False, max_errors=None, executor=None,
+                      max_pending=4):
+        """
+        Apply list of validators to data whose DATA sheet is read in chunks
+        (e.g. with the *load_chunks* method of the excel and mysql codecs),
+        with the same results as *apply*.
+
+        The chunks are read once and fed to all the validators that support
+        it (see *supports_chunks*), so only one chunk and the state of each
+        validator are kept in memory. Validators that don't support it are
+        applied to the whole DATA sheet, concatenated from the chunks.
+
+        :param data_dict: Data structure with HPV Information Centre format,
+            its 'data' dataframe (if any) is ignored
+        :param chunks: Iterable with the consecutive chunks of the DATA
+            sheet, as dataframes
+        :param validators: List of validators as in *apply*
+        :param bool structured: As in *apply*
+        :param bool fail_fast: As in *apply*
+        :param int max_errors: As in *apply*
+        :param executor: *concurrent.futures* executor that feeds the chunks
+            in parallel (with a process pool the validators and their states
+            must be picklable), chunks are fed sequentially by default
+        :param int max_pending: Maximum number of chunks being fed by the
+            executor at the same time
+        :rtype: list
+        """
+        import pandas as pd
+
+        validators = [DataValidator._instance(validator)
+                      for validator in validators]
+        metadata = dict((key, data_dict[key]) for key in data_dict
+                        if key != 'data')
+        kwargs = {}
+        if max_errors is not None:
+            kwargs['max_errors'] = max_errors
+
+        chunked = [validator for validator in validators
+                   if validator.supports_chunks]
+        states = []
+        for validator in chunked:
+            try:
+                states.append(validator.begin(metadata, **kwargs))
+            except Exception as e:
+                logger.exception('{} failed'.format(validator.result_name()))
+                states.append(e)
+
+        frames = []
+        keep_frames = len(chunked) < len(validators)
+        if executor is None:
+            for chunk in chunks:
+                states = _feed_chunk(chunked, states, chunk)
+                if keep_frames:
+                    frames.append(chunk)
+        else:
+            initial = states
+            states = None
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(
+                    _feed_chunk, chunked, copy.deepcopy(initial), chunk))
+                if keep_frames:
+                    frames.append(chunk)
+                while len(pending) >= max_pending:
+                    states = _merge_states(chunked, states,
+                                           pending.popleft().result())
+            while pending:
+                states = _merge_states(chunked, states,
+                                       pending.popleft().result())
+            if states is None:
+                states = initial
+
+        states = dict(zip(chunked, states))
+        if keep_frames:
+            full_data = dict(metadata)
+            full_data['data'] = pd.concat(frames, ignore_index=True) \
+                if frames else pd.DataFrame()
+
+        def finish(validator):
+            if not validator.supports_chunks:
+                return validator._apply(full_data, max_errors)
+            state = states[validator]
+            if isinstance(state, Exception):
+                return validator._failed_result(state)
+            try:
+                return validator.finish(state, metadata)
+            except Exception as e:
+                logger.exception('{} failed'.format(validator.result_name()))
+                return validator._failed_result(e)
+
+        return DataValidator._collect(validators, finish, structured,
+                                      fail_fast)
+
+    @staticmethod
+    def apply_incremental(data_dict, snapshot, validators, structured=False,
+                          fail_fast=False):
+        """
+        Apply list of validators to a new version of a table, with the
+        same results as *apply*. The rows are compared with the snapshot of
+        the previous version and *row_local* validators only validate the
+        changed and added rows, their results are merged with the previous
+        ones (see *merge_rows*). The rest of validators (e.g. table-level
+        checks) are applied to the whole table.
+
+        If the rows can't be compared (see *ValidationSnapshot.diff*) or
+        there is no reusable previous result, validators are applied to the
+        whole table.
+
+        :param data_dict: Data structure with HPV Information Centre format
+        :param ValidationSnapshot snapshot: Previous version of the table
+            and its results
+        :param validators: List of validators as in *apply*
+        :param bool structured: As in *apply*
+        :param bool fail_fast: As in *apply*
+        :rtype: list
+        """
+        validators = [DataValidator._instance(validator)
+                      for validator in validators]
+        diff = snapshot.diff(data_dict) if snapshot is not None else None
+        if diff is not None:
+            logger.info('{} changed, {} added and {} deleted rows'.format(
+                diff['n_changed'], diff['n_added'], diff['n_deleted']))
+        changed_data = {}
+
+        def run(validator):
+            previous = None
+            if validator.row_local and diff is not None:
+                previous = snapshot.result(validator.result_name())
+            if previous is not None and _reusable(previous):
+                if not changed_data:
+                    changed_data.update(data_dict)
+                    changed_data['data'] = \
+                        data_dict['data'][diff['changed']]
+                changed = validator._apply(changed_data, None)
+                if not changed.has_issues('error', ['validator_failed']):
+                    result = validator.merge_rows(previous, changed,
+                                                  data_dict,
+                                                  diff['changed'])
+                    if result is not None:
+                        return result
+            return validator._apply(data_dict, None)
+
+        return DataValidator._collect(validators, run, structured,
+                                      fail_fast)
+
+    @staticmethod
+    def _instance(validator):
+        if isinstance(validator, DataValidator):
+            return validator
+        return DataValidator.get(validator['name'], **validator['args'])
+
+    @staticmethod
+    def _collect(validators, run, structured, fail_fast):
+        """
+        Runs the validators in order, skipping those blocked by their
+        dependencies or by *fail_fast*.
+
+        :param list validators: Validator instances
+        :param run: Function that returns the result of a validator
         """
         results = []
+        applied = []
+        failed = False
         for validator in validators:
-            id = validator['name']
-            kwargs = validator['args']
-            validator = DataValidator.get(id, **kwargs)
-            try:
-                result = validator.validate(data_dict)
-            except Exception:
-                result = {
-                            'info': [],
-                            'warnings': [],
-                            'errors': [
-                                'Error on this validator, please '
-                                'fix previous errors and try again.'
-                            ]
-                         }
-            result['type'] = getattr(validator,
-                                     'name',
-                                     validator.__class__.__name__)
-            results.append(result)
+            if fail_fast and failed:
+                reason = 'a previous validator found errors'
+            else:
+                reason = validator._blocking_dependency(applied)
+            if reason is not None:
+                result = ValidationResult(validator.result_name())
+                result.add('warning',
+                           'Not applied because {}.'.format(reason),
+                           code='skipped')
+            else:
+                result = run(validator)
+
+            applied.append((validator, result))
+            failed = failed or result.has_errors
+            results.append(result if structured else result.to_dict())
         return results
+
+    def _apply(self, data_dict, max_errors):
+        kwargs = {}
+        if max_errors is not None:
+            kwargs['max_errors'] = max_errors
+        try:
+            return self.validate_structured(data_dict, **kwargs)
+        except Exception as e:
+            logger.exception('{} failed'.format(self.result_name()))
+            return self._failed_result(e)
+
+    def _failed_result(self, exception):
+        result = ValidationResult(self.result_name())
+        result.add('error',
+                   'Error on this validator ({}: {}), please '
+                   'fix previous errors and try again.'.format(
+                       exception.__class__.__name__, exception),
+                   code='validator_failed')
+        return result
+
+    def _blocking_dependency(self, applied):
+        """
+        :param list applied: Validators already applied and their results
+        :returns: Why this validator can't be applied, None if it can
+        :rtype: str
+        """
+        for id, codes in self.depends_on.items():
+            dependency = DataValidator.get_plugin(id)
+            if dependency is None:
+                continue
+            for validator, result in applied:
+                if not isinstance(validator, dependency):
+                    continue
+                if result.has_issues('warning', ['skipped']):
+                    return '"{}" was not applied'.format(result.validator)
+                blocking_codes = None if codes is None \
+                    else list(codes) + ['validator_failed']
+                if result.has_issues('error', blocking_codes):
+                    return '"{}" found errors'.format(result.validator)
+        return None
+
+
+def _reusable(result):
+    """ Whether a previous result is complete. """
+    return not (result.has_issues('warning',
+                                  ['skipped', 'error_budget_exhausted']) or
+                result.has_issues('error', ['validator_failed']))
+
+
+def _feed_chunk(validators, states, chunk):
+    """
+    Feeds a chunk to each validator, the state of a validator that failed is
+    its exception.
+    """
+    fed = []
+    for validator, state in zip(validators, states):
+        if not isinstance(state, Exception):
+            try:
+                state = validator.feed(state, chunk)
+            except Exception as e:
+                logger.exception('{} failed'.format(validator.result_name()))
+                state = e
+        fed.append(state)
+    return fed
+
+
+def _merge_states(validators, states, following):
+    if states is None:
+        return following
+    merged = []
+    for validator, state, other in zip(validators, states, following):
+        if not isinstance(state, Exception):
+            if isinstance(other, Exception):
+                state = other
+            else:
+                try:
+                    state = validator.merge(state, other)
+                except Exception as e:
+                    logger.exception('{} failed'.format(
+                        validator.result_name()))
+                    state = e
+        merged.append(state)
+    return merged
@@ -8,6 +8,8 @@ import logging
 import re
 from datetime import datetime
 from infocentre_data_manager.plugins.data_validators.base import DataValidator
+from infocentre_data_manager.plugins.data_validators.result import \
+    ValidationResult
 
 __all__ = ['BasicValidator', ]
 
@@ -19,14 +21,16 @@ class BasicValidator(DataValidator):
     """
 
     name = 'Basic validator'
+    supports_chunks = True
 
     def __init__(self, **kwargs):
         pass
 
     def validate(self, data_dict, **kwargs):
-        self.info = []
-        self.warnings = []
-        self.errors = []
+        return self.validate_structured(data_dict, **kwargs).to_dict()
+
+    def validate_structured(self, data_dict, **kwargs):
+        self.result = ValidationResult(self.result_name())
 
         self._check_vars_match(data_dict)
         self._check_general_row(data_dict)
@@ -35,32 +39,56 @@ class BasicValidator(DataValidator):
         self._check_invalid_vars(data_dict)
         self._check_dates(data_dict)
 
-        if len(self.errors) + len(self.warnings) == 0:
-            self.info.append('No problems found.')
+        if self.result.count() == 0:
+            self.result.add('info', 'No problems found.')
+
+        return self.result
+
+    def begin(self, data_dict, **kwargs):
+        # Only the columns of the data are checked
+        return {'columns': None}
+
+    def feed(self, state, chunk):
+        if state['columns'] is None:
+            state['columns'] = list(chunk.columns)
+        return state
 
-        return {
-            'info': self.info,
-            'warnings': self.warnings,
-            'errors': self.errors
-        }
+    def merge(self, state, other):
+        if state['columns'] is None:
+            state['columns'] = other['columns']
+        return state
+
+    def finish(self, state, data_dict):
+        import pandas as pd
+
+        data_dict = dict(data_dict)
+        data_dict['data'] = pd.DataFrame(columns=state['columns'] or [])
+        return self.validate_structured(data_dict)
 
     def _check_vars_match(self, data_dict):
         var_names = data_dict['variables']['variable']
         data_var_names = data_dict['data'].columns
         if list(var_names) != list(data_var_names):
-            self.errors.append(
-               "Variable names don't match the data columns."
-            )
+            self.result.add('error',
+                            "Variable names don't match the data columns.",
+                            code='variables_mismatch',
+                            sheet='VARIABLES')
 
     def _check_general_row(self, data_dict):
         if len(data_dict['general']) == 0:
-            self.errors.append('Data table general info is missing.')
+            self.result.add('error', 'Data table general info is missing.',
+                            code='general_missing', sheet='GENERAL')
         elif len(data_dict['general']) > 1:
-            self.errors.append('More than one row of general info.')
+            self.result.add('error', 'More than one row of general info.',
+                            code='general_rows', sheet='GENERAL')
 
     def _check_table_content_description(self, data_dict):
         if data_dict['general']['contents'].iloc[0] == '':
-            self.warnings.append('Data table content description is empty.')
+            self.result.add('warning',
+                            'Data table content description is empty.',
+                            code='empty_contents',
+                            sheet='GENERAL',
+                            column='contents')
 
     def _check_no_description_vars(self, data_dict):
         no_description_vars = [var.variable
@@ -68,10 +96,14 @@ class BasicValidator(DataValidator):
                                if var.description == '']
 
         if len(no_description_vars) > 0:
-            self.warnings.append(
+            self.result.add(
+                'warning',
                 'The variable(s) {} have no description.'.format(
                     ', '.join(no_description_vars)
-                ))
+                ),
+                code='empty_description',
+                sheet='VARIABLES',
+                column='description')
 
     def _check_invalid_vars(self, data_dict):
         invalid_var_names = [var.variable
@@ -80,12 +112,16 @@ class BasicValidator(DataValidator):
                                          var.variable))]
 
         if len(invalid_var_names) > 0:
-            self.errors.append(
+            self.result.add(
+                'error',
                 'The variable name(s) {} are invalid, only names with '
                 'lowercase and uppercase letters, numbers and '
                 'underscores are allowed.'.format(
                     ', '.join(invalid_var_names)
-                ))
+                ),
+                code='invalid_variable_names',
+                sheet='VARIABLES',
+                column='variable')
 
     def _check_dates(self, data_dict):
         date_types = ['date_accessed',
@@ -94,10 +130,12 @@ class BasicValidator(DataValidator):
                       'date_delivery']
         nrows = len(data_dict['dates'].index)
         if nrows == 0:
-            self.errors.append('No dates defined')
+            self.result.add('error', 'No dates defined',
+                            code='dates_missing', sheet='DATES')
             return
         if nrows > 1:
-            self.errors.append('More than one set of dates defined.')
+            self.result.add('error', 'More than one set of dates defined.',
+                            code='dates_rows', sheet='DATES')
             return
 
         for date_type in date_types:
@@ -105,7 +143,8 @@ class BasicValidator(DataValidator):
             try:
                 d = data_dict['dates'].loc[0, date_type]
             except:
-                self.errors.append('No {} defined'.format(date_type))
+                self._date_error('No {} defined'.format(date_type),
+                                 date_type, None)
                 continue
 
             # Check if its type is 'datetime'
@@ -116,9 +155,9 @@ class BasicValidator(DataValidator):
             try:
                 d_num = int(d)
                 if d_num not in [-9999, -6666]:
-                    self.errors.append('Invalid {}: {}'.format(
+                    self._date_error('Invalid {}: {}'.format(
                         date_type, d_num
-                    ))
+                    ), date_type, d)
                 continue
             except ValueError:
                 pass  # Not a number
@@ -131,12 +170,18 @@ class BasicValidator(DataValidator):
             try:
                 str(d)
             except ValueError:
-                self.errors.append('Invalid {}: {}'.format(date_type, d))
+                self._date_error('Invalid {}: {}'.format(date_type, d),
+                                 date_type, d)
                 continue
             try:
                 datetime.strptime(d, '%Y-%m-%d')
             except ValueError:
-                self.errors.append('{} is not in YYYY-MM-DD format: {}'.format(
-                    date_type, d
-                ))
+                self._date_error(
+                    '{} is not in YYYY-MM-DD format: {}'.format(
+                        date_type, d
+                    ), date_type, d)
                 continue
+
+    def _date_error(self, message, date_type, value):
+        self.result.add('error', message, code='invalid_date',
+                        sheet='DATES', column=date_type, value=value)
@@ -5,7 +5,10 @@ This module includes the validator for detecting missing values.
 """
 
 import logging
+import pandas as pd
 from infocentre_data_manager.plugins.data_validators.base import DataValidator
+from infocentre_data_manager.plugins.data_validators.result import \
+    ValidationResult
 
 __all__ = ['MissingValuesValidator', ]
 
@@ -14,13 +17,170 @@ class MissingValuesValidator(DataValidator):
     """
     Plugin that implements a missing values validator for HPV Information
     Centre data.
+
+    Empty strings, NaN values and the missing value codes (-9999, -6666)
+    are considered missing. Warnings are reported for the variables and the
+    regions whose missing rate exceeds the configured thresholds.
     """
 
     name = 'Missing values validator'
 
+    MISSING_CODES = [-9999, -6666]
+    MAX_N_ISOS_DISPLAYED = 10
+
+    supports_chunks = True
+
     def __init__(self, **kwargs):
-        pass
+        self.max_missing_rate = kwargs.get('max_missing_rate', 0.5)
+        self.max_iso_missing_rate = kwargs.get('max_iso_missing_rate', 0.5)
+        self.missing_codes = kwargs.get('missing_codes',
+                                        MissingValuesValidator.MISSING_CODES)
+        self.iso_variable = kwargs.get('iso_variable', 'iso')
 
     def validate(self, data_dict, **kwargs):
-        raise NotImplementedError(
-            'Data validation not implemented for {}'.format(self.__class__))
+        state = self.feed(self.begin(data_dict), data_dict['data'])
+        return self._report(state)
+
+    def begin(self, data_dict, **kwargs):
+        return {
+            'n_rows': 0,
+            'n_columns': 0,
+            'has_iso': False,
+            # Counts of each kind of missing value of each variable
+            'counts': None,
+            # Missing values and rows of each region
+            'iso_missing': None,
+            'iso_rows': None,
+        }
+
+    def feed(self, state, chunk):
+        missing, counts = self._profile(chunk)
+        state['n_rows'] += len(chunk.index)
+        state['n_columns'] = len(missing.columns)
+        state['counts'] = counts if state['counts'] is None \
+            else state['counts'] + counts
+        if self.iso_variable in chunk.columns:
+            state['has_iso'] = True
+            by_iso = missing.sum(axis=1).groupby(chunk[self.iso_variable])
+            self._add_isos(state, by_iso.sum(), by_iso.size())
+        return state
+
+    def merge(self, state, other):
+        if other['counts'] is None:
+            return state
+        if state['counts'] is None:
+            return other
+        state['n_rows'] += other['n_rows']
+        state['counts'] = state['counts'] + other['counts']
+        if other['has_iso']:
+            state['has_iso'] = True
+            self._add_isos(state, other['iso_missing'], other['iso_rows'])
+        return state
+
+    def finish(self, state, data_dict):
+        return ValidationResult.from_dict(self.result_name(),
+                                          self._report(state))
+
+    def _add_isos(self, state, iso_missing, iso_rows):
+        if state['iso_missing'] is None:
+            state['iso_missing'] = iso_missing
+            state['iso_rows'] = iso_rows
+        else:
+            state['iso_missing'] = state['iso_missing'].add(iso_missing,
+                                                            fill_value=0)
+            state['iso_rows'] = state['iso_rows'].add(iso_rows, fill_value=0)
+
+    def _report(self, state):
+        info = []
+        warnings = []
+        errors = []
+
+        n_rows = state['n_rows']
+        profile = state['counts']
+        if profile is None:
+            profile = pd.DataFrame(columns=['nan', 'empty', 'code',
+                                            'missing'])
+        profile = profile.assign(
+            rate=profile['missing'] / max(n_rows, 1))
+
+        n_values = n_rows * state['n_columns']
+        n_missing = int(profile['missing'].sum())
+        if n_values > 0:
+            info.append(
+                '{} of {} values ({:.1%}) are missing: {} empty, {} NaN and '
+                '{} with missing value codes.'.format(
+                    n_missing,
+                    n_values,
+                    n_missing / n_values,
+                    int(profile['empty'].sum()),
+                    int(profile['nan'].sum()),
+                    int(profile['code'].sum())
+                ))
+
+        high_missing = profile[profile['rate'] > self.max_missing_rate]
+        for var, row in high_missing.iterrows():
+            warnings.append(
+                'Variable "{}" has {:.1%} missing values ({} of {}).'.format(
+                    var, row['rate'], int(row['missing']), n_rows
+                ))
+
+        if state['has_iso'] and state['n_columns'] > 0:
+            # Mean missing rate of the rows of each region, computed from
+            # integer counts so it doesn't depend on how rows are chunked
+            iso_rates = (state['iso_missing'] / state['n_columns'] /
+                         state['iso_rows']).sort_index()
+            high_missing_isos = iso_rates[
+                iso_rates > self.max_iso_missing_rate
+            ].sort_values(ascending=False, kind='mergesort')
+            if len(high_missing_isos) > 0:
+                isos_str = ['{} ({:.1%})'.format(iso, rate)
+                            for iso, rate
+                            in high_missing_isos.iloc[
+                                :MissingValuesValidator.MAX_N_ISOS_DISPLAYED
+                            ].items()]
+                if len(high_missing_isos) > \
+                        MissingValuesValidator.MAX_N_ISOS_DISPLAYED:
+                    isos_str.append('...')
+                warnings.append(
+                    '{} region(s) have more than {:.1%} missing values: '
+                    '{}.'.format(
+                        len(high_missing_isos),
+                        self.max_iso_missing_rate,
+                        ', '.join(isos_str)
+                    ))
+
+        if len(errors) + len(warnings) == 0:
+            info.append('No problems found.')
+
+        return {
+            'info': info,
+            'warnings': warnings,
+            'errors': errors
+        }
+
+    def _profile(self, data_df):
+        """
+        Profiles all the data columns (except the row id) in a single
+        vectorized pass.
+
+        :param pandas.DataFrame data_df: Data values
+        :returns: Boolean dataframe with the missing cells and a dataframe
+            with the counts of each kind of missing value for each variable.
+        :rtype: tuple
+        """
+        values = data_df.drop(columns=['id'], errors='ignore')
+        codes = list(self.missing_codes) + \
+            [str(code) for code in self.missing_codes]
+
+        nan = values.isna()
+        empty = values.isin([''])
+        code = values.isin(codes)
+        missing = nan | empty | code
+
+        counts = pd.DataFrame({
+            'nan': nan.sum(),
+            'empty': empty.sum(),
+            'code': code.sum(),
+            'missing': missing.sum(),
+        })
+        return missing, counts
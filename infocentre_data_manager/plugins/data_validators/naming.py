@@ -0,0 +1,154 @@
+""" naming.py
+
+This module includes the validator for the naming conventions of the
+variables across tables.
+
+"""
+
+import logging
+import re
+from infocentre_data_manager.plugins.data_validators.base import DataValidator
+from infocentre_data_manager.plugins.data_validators.result import \
+    ValidationResult
+
+__all__ = ['NamingValidator', ]
+
+
+class NamingValidator(DataValidator):
+    """
+    Plugin that implements a validator of the variable names of HPV
+    Information Centre data against the rest of tables, looked up in the
+    local catalog (see *Catalog*):
+
+    * Variables written differently in other tables (ignoring case and
+      punctuation, e.g. 'agegroup' and 'age_group') should use the most
+      common name.
+    * Variables with a different semantic type than in the rest of tables.
+    * Optionally, variable names must match a *pattern*.
+
+    The table itself is excluded from the counts, so a new version of a
+    table that is already in the catalog is checked against the others.
+    """
+
+    name = 'Naming validator'
+
+    MAX_N_TABLES_DISPLAYED = 3
+
+    def __init__(self, **kwargs):
+        """
+        :param catalog: *Catalog* or path of its file (the default catalog
+            if it exists, see *default_catalog_path*)
+        :param str pattern: Regular expression that all the variable names
+            must match (e.g. '[a-z][a-z0-9_]*'), not checked by default
+        :param int min_tables: Minimum number of other tables using a name
+            or type for it to be considered the convention
+        """
+        from infocentre_data_manager.catalog import Catalog, \
+            default_catalog_path
+
+        catalog = kwargs.get('catalog')
+        if catalog is None or isinstance(catalog, str):
+            # Loaded once, validators are reused between validations
+            catalog = Catalog(catalog or default_catalog_path())
+        self.catalog = catalog
+        pattern = kwargs.get('pattern')
+        self.pattern = re.compile(pattern) if pattern is not None else None
+        self.min_tables = kwargs.get('min_tables', 2)
+
+    def validate(self, data_dict, **kwargs):
+        return self.validate_structured(data_dict, **kwargs).to_dict()
+
+    def validate_structured(self, data_dict, **kwargs):
+        from infocentre_data_manager.catalog import _as_str
+
+        result = ValidationResult(self.result_name())
+        try:
+            table_name = data_dict['general']['table_name'].iloc[0]
+        except (KeyError, IndexError):
+            table_name = None
+        if len(self.catalog) == 0:
+            result.add('warning',
+                       'The catalog is empty, variable names were only '
+                       'checked against the pattern.',
+                       code='empty_catalog')
+
+        vars_df = data_dict['variables']
+        for name, var_type in zip(vars_df['variable'], vars_df['type']):
+            name = _as_str(name)
+            # Missing types (e.g. NaN in the excel file) mean string
+            var_type = _as_str(var_type) or 'string'
+            if self.pattern is not None and \
+                    self.pattern.fullmatch(name) is None:
+                result.add('error',
+                           'Variable "{}" doesn\'t follow the naming '
+                           'convention ({}).'.format(name,
+                                                     self.pattern.pattern),
+                           code='invalid_name',
+                           sheet='VARIABLES',
+                           column='variable',
+                           value=name)
+            self._check_spelling(result, table_name, name)
+            self._check_type(result, table_name, name, var_type)
+
+        if result.count() == 0:
+            result.add('info', 'No problems found.')
+        return result
+
+    def _check_spelling(self, result, table_name, name):
+        counts = self._other_tables(self.catalog.variable_spellings(name),
+                                    table_name)
+        if not counts:
+            return
+        common, tables = max(counts.items(),
+                             key=lambda x: (len(x[1]), x[0] == name))
+        if common == name or len(tables) < self.min_tables or \
+                len(tables) <= len(counts.get(name, ())):
+            return
+        result.add('warning',
+                   'Variable "{}" is called "{}" in {}.'.format(
+                       name, common, self._describe_tables(tables)),
+                   code='naming_variant',
+                   sheet='VARIABLES',
+                   column='variable',
+                   value=name,
+                   suggestion=common)
+
+    def _check_type(self, result, table_name, name, var_type):
+        counts = self._other_tables(self.catalog.variable_types(name),
+                                    table_name)
+        # Types of the catalog are as stored, empty means string
+        if '' in counts:
+            counts['string'] = tuple(sorted(
+                set(counts.pop('')) | set(counts.get('string', ()))))
+        if not counts:
+            return
+        common, tables = max(counts.items(),
+                             key=lambda x: (len(x[1]), x[0] == var_type))
+        if common == var_type or len(tables) < self.min_tables or \
+                len(tables) <= len(counts.get(var_type, ())):
+            return
+        result.add('warning',
+                   'Variable "{}" has type "{}", but it has type "{}" in '
+                   '{}.'.format(name, var_type, common,
+                                self._describe_tables(tables)),
+                   code='type_variant',
+                   sheet='VARIABLES',
+                   column='type',
+                   value=var_type,
+                   suggestion=common)
+
+    def _other_tables(self, tables_by_key, table_name):
+        """ Removes the validated table from a {key: tables} lookup. """
+        counts = {}
+        for key, tables in tables_by_key.items():
+            others = tuple(table for table in tables if table != table_name)
+            if others:
+                counts[key] = others
+        return counts
+
+    def _describe_tables(self, tables):
+        if len(tables) <= NamingValidator.MAX_N_TABLES_DISPLAYED:
+            return ', '.join(tables)
+        return '{} other tables (e.g. {})'.format(
+            len(tables),
+            ', '.join(tables[:NamingValidator.MAX_N_TABLES_DISPLAYED]))
@@ -0,0 +1,176 @@
+""" primary_key.py
+
+This module includes the validator for the row ids and duplicated rows.
+
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from infocentre_data_manager.plugins.data_validators.base import DataValidator
+from infocentre_data_manager.plugins.data_validators.result import \
+    ValidationResult
+
+__all__ = ['PrimaryKeyValidator', ]
+
+
+class PrimaryKeyValidator(DataValidator):
+    """
+    Plugin that implements a primary key validator for HPV Information
+    Centre data: row ids must be unique integers (they are the primary key
+    of the database tables) and rows shouldn't be duplicated.
+    """
+
+    name = 'Primary key validator'
+
+    MAX_N_ERRORS_DISPLAYED = 10
+
+    supports_chunks = True
+
+    def __init__(self, **kwargs):
+        pass
+
+    def validate(self, data_dict, **kwargs):
+        state = self.feed(self.begin(data_dict), data_dict['data'])
+        return self._report(state)
+
+    def begin(self, data_dict, **kwargs):
+        # Ids and row hashes are kept for the whole table, they are much
+        # smaller than the rows themselves.
+        return {
+            'has_id': None,
+            'n_invalid_ids': 0,
+            'invalid_ids': [],
+            'ids': [],
+            'row_ids': [],
+            'row_hashes': [],
+        }
+
+    def feed(self, state, chunk):
+        if state['has_id'] is None:
+            state['has_id'] = 'id' in chunk.columns
+        if not state['has_id']:
+            return state
+
+        ids = pd.to_numeric(chunk['id'], errors='coerce')
+        # Missing, infinite (e.g. "inf") and decimal ids
+        invalid = ~np.isfinite(ids) | (ids != ids.round())
+        n_invalid = int(invalid.sum())
+        if n_invalid > 0:
+            n_shown = PrimaryKeyValidator.MAX_N_ERRORS_DISPLAYED + 1 - \
+                len(state['invalid_ids'])
+            state['n_invalid_ids'] += n_invalid
+            state['invalid_ids'].extend(
+                chunk.loc[invalid, 'id'].iloc[:max(n_shown, 0)])
+        state['ids'].append(ids[~invalid])
+
+        values = chunk.drop(columns=['id'])
+        if len(values.columns) > 0:
+            state['row_ids'].append(chunk['id'])
+            # Hashed as text, so the same row hashes the same in every
+            # chunk whatever its dtypes (e.g. MySQL pages with missing
+            # values load integer columns as floats)
+            state['row_hashes'].append(pd.util.hash_pandas_object(
+                values.apply(_as_text), index=False))
+        return state
+
+    def merge(self, state, other):
+        if other['has_id'] is None:
+            return state
+        if state['has_id'] is None:
+            return other
+        n_shown = PrimaryKeyValidator.MAX_N_ERRORS_DISPLAYED + 1 - \
+            len(state['invalid_ids'])
+        state['n_invalid_ids'] += other['n_invalid_ids']
+        state['invalid_ids'].extend(other['invalid_ids'][:max(n_shown, 0)])
+        for key in ['ids', 'row_ids', 'row_hashes']:
+            state[key].extend(other[key])
+        return state
+
+    def finish(self, state, data_dict):
+        return ValidationResult.from_dict(self.result_name(),
+                                          self._report(state))
+
+    def _report(self, state):
+        self.info = []
+        self.warnings = []
+        self.errors = []
+
+        if not state['has_id']:
+            self.errors.append('The data has no "id" column.')
+        else:
+            self._check_integer_ids(state)
+            ids = self._concat(state['ids'])
+            self._check_unique_ids(ids)
+            self._check_sorted_ids(ids)
+            self._check_duplicated_rows(state)
+
+        if len(self.errors) + len(self.warnings) == 0:
+            self.info.append('No problems found.')
+
+        return {
+            'info': self.info,
+            'warnings': self.warnings,
+            'errors': self.errors
+        }
+
+    def _check_integer_ids(self, state):
+        """ Reports the non integer ids. """
+        if state['n_invalid_ids'] > 0:
+            invalid_ids = ['"{}"'.format(id) for id in state['invalid_ids']]
+            self.errors.append(
+                '{} row(s) have an id that is not an integer: {}.'.format(
+                    state['n_invalid_ids'],
+                    self._format_values(pd.Series(invalid_ids, dtype=object))
+                ))
+
+    def _check_unique_ids(self, ids):
+        duplicated = ids[ids.duplicated(keep=False)]
+        if len(duplicated) > 0:
+            self.errors.append(
+                '{} row(s) share the same id, duplicated ids: {}.'.format(
+                    len(duplicated),
+                    self._format_values(
+                        duplicated.drop_duplicates().sort_values().astype(
+                            int))
+                ))
+
+    def _check_sorted_ids(self, ids):
+        if not ids.is_monotonic_increasing:
+            self.warnings.append('Row ids are not in increasing order.')
+
+    def _check_duplicated_rows(self, state):
+        if len(state['row_hashes']) == 0:
+            return
+        row_hashes = self._concat(state['row_hashes'])
+        duplicated = row_hashes.duplicated(keep='first')
+        if duplicated.any():
+            self.warnings.append(
+                '{} row(s) duplicate the values of a previous row, '
+                'ids: {}.'.format(
+                    int(duplicated.sum()),
+                    self._format_values(
+                        self._concat(state['row_ids'])[duplicated.values])
+                ))
+
+    def _concat(self, series):
+        return pd.concat(series, ignore_index=True) if len(series) > 1 \
+            else series[0].reset_index(drop=True)
+
+    def _format_values(self, values):
+        values_str = [str(value) for value in values.iloc[
+                          :PrimaryKeyValidator.MAX_N_ERRORS_DISPLAYED
+                      ]]
+        if len(values) > PrimaryKeyValidator.MAX_N_ERRORS_DISPLAYED:
+            values_str.append('...')
+        return ', '.join(values_str)
+
+
+def _as_text(col):
+    if pd.api.types.is_float_dtype(col):
+        # 5.0 is written as 5, as it would be in an integer column
+        integral = np.isfinite(col) & (col % 1 == 0) & (col.abs() < 2 ** 53)
+        text = col.astype(str).where(col.notna(), '')
+        text[integral] = col[integral].astype('int64').astype(str)
+        return text
+    return col.astype(object).where(col.notna(), '').astype(str)
@@ -0,0 +1,171 @@
+""" references.py
+
+This module includes the validator for the consistency of the references
+(sources, notes, methods, years and dates) with the data.
+
+"""
+
+import logging
+import pandas as pd
+from infocentre_data_manager.plugins.data_validators.base import DataValidator
+
+__all__ = ['ReferenceValidator', ]
+
+
+class ReferenceValidator(DataValidator):
+    """
+    Plugin that implements a referential consistency validator for HPV
+    Information Centre data: the variables and values used by the
+    references must exist in the data table.
+
+    The lookup structures over the data are built once and every reference
+    sheet is checked against them with vectorized operations.
+    """
+
+    name = 'Reference validator'
+
+    REF_TYPES = ['sources', 'notes', 'methods', 'years', 'dates']
+    # Codes meaning that the reference applies to all regions / rows
+    ALL_ISOS = '-99'
+    NO_VARIABLE = '-9999'
+    MAX_N_ERRORS_DISPLAYED = 10
+
+    def __init__(self, **kwargs):
+        self.iso_variable = kwargs.get('iso_variable', 'iso')
+
+    def validate(self, data_dict, **kwargs):
+        self.info = []
+        self.warnings = []
+        self.errors = []
+
+        data_df = data_dict['data']
+        ref_dfs = {ref_type: self._normalize(data_dict[ref_type])
+                   for ref_type in ReferenceValidator.REF_TYPES
+                   if ref_type in data_dict}
+
+        variables = set(data_dict['variables']['variable'])
+        if self.iso_variable in data_df.columns:
+            isos = pd.Index(
+                self._as_str(data_df[self.iso_variable]).unique())
+        else:
+            isos = None
+        strata_index = self._build_strata_index(data_df, ref_dfs.values())
+
+        for ref_type, ref_df in ref_dfs.items():
+            if len(ref_df.index) == 0:
+                continue
+            self._check_variables(ref_type, ref_df, variables)
+            self._check_strata_values(ref_type, ref_df, variables,
+                                      strata_index)
+            if isos is not None:
+                self._check_isos(ref_type, ref_df, isos)
+
+        if len(self.errors) + len(self.warnings) == 0:
+            self.info.append('No problems found.')
+
+        return {
+            'info': self.info,
+            'warnings': self.warnings,
+            'errors': self.errors
+        }
+
+    def _as_str(self, series):
+        return series.fillna('').astype(str).str.strip()
+
+    def _normalize(self, ref_df):
+        columns = [col for col in ['iso', 'strata_variable',
+                                   'strata_value', 'applyto_variable']
+                   if col in ref_df.columns]
+        return pd.DataFrame({col: self._as_str(ref_df[col])
+                             for col in columns},
+                            index=ref_df.index)
+
+    def _build_strata_index(self, data_df, ref_dfs):
+        """
+        Builds an index with the distinct (variable, value) pairs of the data
+        columns used as stratification variables by any reference.
+        """
+        strata_vars = set()
+        for ref_df in ref_dfs:
+            if 'strata_variable' in ref_df.columns:
+                strata_vars.update(ref_df['strata_variable'].unique())
+        strata_vars = [var for var in strata_vars if var in data_df.columns]
+
+        pairs = [pd.DataFrame({
+                    'variable': var,
+                    'value': self._as_str(data_df[var]).unique()
+                 })
+                 for var in strata_vars]
+        if len(pairs) == 0:
+            return pd.MultiIndex.from_arrays([[], []])
+        pairs = pd.concat(pairs, ignore_index=True)
+        return pd.MultiIndex.from_frame(pairs)
+
+    def _check_variables(self, ref_type, ref_df, variables):
+        for column in ['strata_variable', 'applyto_variable']:
+            if column not in ref_df.columns:
+                continue
+            values = ref_df[column]
+            invalid = ~(values.isin(variables) |
+                        (values == ReferenceValidator.NO_VARIABLE))
+            if invalid.any():
+                self.errors.append(
+                    '{}: {} row(s) with a "{}" that is not a variable of '
+                    'the table: {}.'.format(
+                        ref_type.upper(),
+                        int(invalid.sum()),
+                        column,
+                        self._format_invalid(values[invalid])
+                    ))
+
+    def _check_strata_values(self, ref_type, ref_df, variables,
+                             strata_index):
+        if not {'strata_variable', 'strata_value'}.issubset(ref_df.columns):
+            return
+        # Only rows with a valid strata variable, the rest are already
+        # reported by _check_variables
+        stratified = ref_df[ref_df['strata_variable'].isin(variables)]
+        if len(stratified.index) == 0:
+            return
+        pairs = pd.MultiIndex.from_arrays([stratified['strata_variable'],
+                                           stratified['strata_value']])
+        invalid = ~pairs.isin(strata_index)
+        if invalid.any():
+            invalid_pairs = stratified.loc[invalid, 'strata_variable'] + \
+                '=' + stratified.loc[invalid, 'strata_value']
+            self.errors.append(
+                '{}: {} row(s) with a strata value that does not occur in '
+                'the data: {}.'.format(
+                    ref_type.upper(),
+                    int(invalid.sum()),
+                    self._format_invalid(invalid_pairs)
+                ))
+
+    def _check_isos(self, ref_type, ref_df, isos):
+        if 'iso' not in ref_df.columns:
+            return
+        values = ref_df['iso']
+        invalid = ~(values.isin(isos) |
+                    (values == ReferenceValidator.ALL_ISOS))
+        if invalid.any():
+            self.warnings.append(
+                '{}: {} row(s) with an iso that does not occur in the '
+                'data: {}.'.format(
+                    ref_type.upper(),
+                    int(invalid.sum()),
+                    self._format_invalid(values[invalid])
+                ))
+
+    def _format_invalid(self, values):
+        """ Formats the distinct invalid values with the (spreadsheet) row
+        numbers where they appear. """
+        rows = pd.Series(values.index + 2, index=values.index)
+        grouped = rows.groupby(values.values, sort=True).apply(list)
+        invalid_str = ['"{}" (rows {})'.format(
+                           value, ', '.join(str(r) for r in value_rows))
+                       for value, value_rows in grouped.iloc[
+                           :ReferenceValidator.MAX_N_ERRORS_DISPLAYED
+                       ].items()]
+        if len(grouped) > ReferenceValidator.MAX_N_ERRORS_DISPLAYED:
+            invalid_str.append('...')
+        return ', '.join(invalid_str)
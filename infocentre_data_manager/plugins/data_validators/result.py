@@ -0,0 +1,225 @@
+""" result.py
+
+This module includes the structured result of a data validation.
+
+"""
+
+import json
+
+__all__ = ['ValidationResult', ]
+
+SEVERITIES = ['error', 'warning', 'info']
+# Keys of each severity in the dictionaries returned by *validate*
+LEGACY_KEYS = {'error': 'errors', 'warning': 'warnings', 'info': 'info'}
+ISSUE_COLUMNS = ['validator', 'severity', 'code', 'sheet', 'column',
+                 'row_id', 'value', 'suggestion', 'message']
+
+
+class ValidationResult(object):
+    """
+    Issues found by a validator, stored as a columnar table with the
+    columns *validator*, *severity* ('error', 'warning' or 'info'),
+    *code*, *sheet*, *column*, *row_id*, *value*, *suggestion* (a valid
+    value close to the offending one, if any) and *message*.
+
+    Issues about single values (e.g. invalid types) are added in blocks
+    with *add_values*, which keeps the arrays of row ids and values as they
+    are. The table is only built when it is requested, and the messages of
+    a block are only formatted when the result is exported to the
+    dictionary format returned by *DataValidator.validate* (see *to_dict*).
+    """
+
+    def __init__(self, validator):
+        """
+        :param str validator: Validator name
+        """
+        self.validator = validator
+        self._blocks = []
+        self._issues = None
+
+    @classmethod
+    def from_dict(cls, validator, result):
+        """
+        Wraps the dictionary returned by *DataValidator.validate*.
+
+        :param str validator: Validator name
+        :param dict result: Dictionary with the 'info', 'warnings' and
+            'errors' messages
+        :rtype: ValidationResult
+        """
+        structured = cls(validator)
+        for severity in SEVERITIES:
+            for message in result.get(LEGACY_KEYS[severity], []):
+                structured.add(severity, message)
+        return structured
+
+    def add(self, severity, message, code=None, sheet=None, column=None,
+            row_id=None, value=None, suggestion=None):
+        """
+        Adds a single issue.
+
+        :param str severity: 'error', 'warning' or 'info'
+        :param str message: Issue description
+        :param str code: Machine readable issue kind
+        :param str sheet: Sheet (e.g. 'DATA', 'VARIABLES', ...)
+        :param str column: Column of the sheet
+        :param row_id: Id of the row
+        :param value: Offending value
+        :param suggestion: Suggested value
+        """
+        self._check_severity(severity)
+        self._blocks.append(
+            (severity, code, sheet, column, [row_id], [value], [suggestion],
+             message))
+        self._issues = None
+
+    def add_values(self, severity, code, sheet, column, row_ids, values,
+                   summary, suggestions=None):
+        """
+        Adds one issue per offending value of a column.
+
+        :param str severity: 'error', 'warning' or 'info'
+        :param str code: Machine readable issue kind
+        :param str sheet: Sheet (e.g. 'DATA')
+        :param str column: Column of the sheet
+        :param row_ids: Array-like with the ids of the rows
+        :param values: Array-like with the offending values
+        :param summary: Function that receives the row ids and values (as
+            lists) and returns the message that summarizes the block in
+            *to_dict*
+        :param suggestions: Array-like with a suggested value for each
+            offending value (None for no suggestion)
+        """
+        self._check_severity(severity)
+        if len(row_ids) == 0:
+            return
+        self._blocks.append(
+            (severity, code, sheet, column, row_ids, values, suggestions,
+             summary))
+        self._issues = None
+
+    @property
+    def issues(self):
+        """
+        :returns: Issue table, messages of value blocks are empty
+        :rtype: pandas.DataFrame
+        """
+        import pandas as pd
+
+        if self._issues is None:
+            frames = []
+            for severity, code, sheet, column, row_ids, values, \
+                    suggestions, message in self._blocks:
+                if suggestions is None:
+                    suggestions = [None] * len(row_ids)
+                frames.append(pd.DataFrame({
+                    'validator': self.validator,
+                    'severity': severity,
+                    'code': code,
+                    'sheet': sheet,
+                    'column': column,
+                    'row_id': pd.Series(row_ids, dtype=object).values,
+                    'value': pd.Series(values, dtype=object).values,
+                    'suggestion': pd.Series(suggestions,
+                                            dtype=object).values,
+                    'message': message if isinstance(message, str) else None,
+                }, columns=ISSUE_COLUMNS))
+            if frames:
+                self._issues = pd.concat(frames, ignore_index=True)
+            else:
+                self._issues = pd.DataFrame(columns=ISSUE_COLUMNS)
+        return self._issues
+
+    def count(self, severity=None):
+        """
+        :param str severity: Severity to count (all by default)
+        :returns: Number of issues
+        :rtype: int
+        """
+        return sum(len(block[4]) for block in self._blocks
+                   if severity is None or block[0] == severity)
+
+    def value_blocks(self, code):
+        """
+        :param str code: Issue code
+        :returns: Column, row ids and values of each block of issues with
+            that code
+        :rtype: list
+        """
+        return [(block[3], block[4], block[5])
+                for block in self._blocks
+                if block[1] == code]
+
+    @property
+    def has_errors(self):
+        return self.has_issues('error')
+
+    def has_issues(self, severity, codes=None):
+        """
+        :param str severity: 'error', 'warning' or 'info'
+        :param list codes: Issue codes to look for (all by default)
+        :returns: Whether there is any issue of that severity and codes
+        :rtype: bool
+        """
+        return any(block[0] == severity and
+                   (codes is None or block[1] in codes)
+                   for block in self._blocks)
+
+    def to_dict(self):
+        """
+        :returns: Dictionary with the validator name ('type') and the
+            'info', 'warnings' and 'errors' messages, as returned by
+            *DataValidator.apply*
+        :rtype: dict
+        """
+        result = {'info': [], 'warnings': [], 'errors': []}
+        for severity, code, sheet, column, row_ids, values, _, message \
+                in self._blocks:
+            if not isinstance(message, str):
+                message = message(list(row_ids), list(values))
+            result[LEGACY_KEYS[severity]].append(message)
+        result['type'] = self.validator
+        return result
+
+    def to_json(self, **kwargs):
+        """
+        :param kwargs: Arguments of *json.dumps*
+        :returns: JSON object with the validator name, the number of
+            issues of each severity and the list of issues
+        :rtype: str
+        """
+        issues = self.issues
+        content = {
+            'validator': self.validator,
+            'counts': {severity: self.count(severity)
+                       for severity in SEVERITIES},
+            'issues': issues.astype(object).where(issues.notna(), None)
+                            .to_dict('records'),
+        }
+        return json.dumps(content, default=str, **kwargs)
+
+    def to_arrow(self):
+        """
+        :returns: Issue table (requires pyarrow), values are converted to
+            strings
+        :rtype: pyarrow.Table
+        """
+        import pyarrow as pa
+
+        issues = self.issues.copy()
+        for column in ['value', 'suggestion']:
+            issues[column] = issues[column].map(
+                lambda value: None if value is None else str(value))
+        return pa.Table.from_pandas(issues, preserve_index=False)
+
+    def _check_severity(self, severity):
+        if severity not in SEVERITIES:
+            raise ValueError('Unknown severity "{}"'.format(severity))
+
+    def __repr__(self):
+        return '{}({}, errors={}, warnings={}, info={})'.format(
+            self.__class__.__name__,
+            self.validator,
+            self.count('error'),
+            self.count('warning'),
+            self.count('info'))
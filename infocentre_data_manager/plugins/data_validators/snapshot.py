@@ -0,0 +1,119 @@
+""" snapshot.py
+
+This module includes the snapshot of a validated table used to validate
+its later versions incrementally.
+
+"""
+
+import hashlib
+
+__all__ = ['ValidationSnapshot', ]
+
+
+class ValidationSnapshot(object):
+    """
+    Row hashes of a validated data table, together with its structured
+    results (see *DataValidator.apply_incremental*). Only the hashes are
+    kept, not the rows, so a snapshot of a 300k-row table takes a few
+    megabytes.
+
+    Rows are identified by their id: a row whose values changed is a
+    changed row, and a row whose id changed is a deleted and an added row.
+    """
+
+    def __init__(self, row_hashes, columns, variables_hash, results):
+        """
+        :param pandas.Series row_hashes: Hash of the values of each row,
+            indexed by row id
+        :param list columns: Data columns
+        :param str variables_hash: Hash of the variables sheet
+        :param list results: *ValidationResult* of each validator
+        """
+        self.row_hashes = row_hashes
+        self.columns = list(columns)
+        self.variables_hash = variables_hash
+        self.results = dict((result.validator, result) for result in results)
+
+    @classmethod
+    def from_data(cls, data_dict, results):
+        """
+        :param data_dict: Data structure with HPV Information Centre format,
+            e.g. loaded from the local cache or the database
+        :param list results: Its results, as returned by
+            *DataValidator.apply* with ``structured=True``
+        :rtype: ValidationSnapshot
+        """
+        data_df = data_dict['data']
+        return cls(_row_hashes(data_df),
+                   data_df.columns,
+                   _frame_hash(data_dict['variables']),
+                   results)
+
+    def result(self, validator):
+        """
+        :param str validator: Validator name in the results
+        :returns: Previous result of the validator, None if it has none
+        :rtype: ValidationResult
+        """
+        return self.results.get(validator)
+
+    def diff(self, data_dict):
+        """
+        Compares a new version of the table with the snapshot.
+
+        :param data_dict: Data structure with HPV Information Centre format
+        :returns: None if the rows can't be compared (the columns or the
+            variables changed, or the ids aren't unique), and otherwise a
+            dictionary with a boolean array of the *changed* rows (including
+            the added ones) and the number of 'n_changed', 'n_added' and
+            'n_deleted' rows
+        :rtype: dict
+        """
+        data_df = data_dict['data']
+        if list(data_df.columns) != self.columns or \
+                _frame_hash(data_dict['variables']) != self.variables_hash:
+            return None
+        if 'id' not in data_df.columns or \
+                not data_df['id'].is_unique or \
+                not self.row_hashes.index.is_unique:
+            return None
+
+        row_hashes = _row_hashes(data_df)
+        # Positions in the snapshot (-1 for added rows), hashes are compared
+        # as integers (reindexing would turn them into floats)
+        positions = self.row_hashes.index.get_indexer(row_hashes.index)
+        added = positions < 0
+        changed = added.copy()
+        # Only the rows in the snapshot are compared (it may have no rows)
+        changed[~added] = self.row_hashes.values[positions[~added]] != \
+            row_hashes.values[~added]
+        n_added = int(added.sum())
+        return {
+            'changed': changed,
+            'n_changed': int(changed.sum()) - n_added,
+            'n_added': n_added,
+            'n_deleted': len(self.row_hashes.index) -
+            (len(row_hashes.index) - n_added),
+        }
+
+
+def _row_hashes(data_df):
+    import pandas as pd
+
+    values = data_df.drop(columns=['id'], errors='ignore')
+    if len(values.columns) > 0:
+        row_hashes = pd.util.hash_pandas_object(values, index=False)
+    else:
+        row_hashes = pd.Series(0, index=values.index, dtype='uint64')
+    if 'id' in data_df.columns:
+        row_hashes.index = data_df['id'].values
+    return row_hashes
+
+
+def _frame_hash(df):
+    import pandas as pd
+
+    content = pd.util.hash_pandas_object(df, index=False).values
+    return hashlib.sha1(
+        content.tobytes() + repr(list(df.columns)).encode('utf-8')
+    ).hexdigest()
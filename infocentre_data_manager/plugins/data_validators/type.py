@@ -5,7 +5,11 @@ This module includes the validator for variable typing.
 """
 
 import logging
+from functools import partial
+import numpy as np
 from infocentre_data_manager.plugins.data_validators.base import DataValidator
+from infocentre_data_manager.plugins.data_validators.result import \
+    ValidationResult
 from infocentre_data_manager.plugins.semantic_types.base import SemanticType
 
 __all__ = ['TypeValidator', ]
@@ -20,58 +24,340 @@ class TypeValidator(DataValidator):
     name = 'Semantic type validator'
 
     MAX_N_ERRORS_DISPLAYED = 10
+    # Distinct invalid values of a variable that get suggestions
+    MAX_N_SUGGESTED = 1000
+    # Rows checked at once when there is an error budget
+    CHUNK_SIZE = 10000
+
+    depends_on = {'basic': ['variables_mismatch']}
+    supports_chunks = True
+    row_local = True
 
     def __init__(self, **kwargs):
+        """
+        :param int max_errors: Stop after finding this many invalid values
+        :param int max_errors_per_column: Stop checking a variable after
+            finding this many invalid values
+        :param kwargs: Arguments of the semantic types (e.g. database
+            credentials)
+        """
+        self.max_errors = kwargs.pop('max_errors', None)
+        self.max_errors_per_column = kwargs.pop('max_errors_per_column', None)
         self.type_validator_args = kwargs
+        # Semantic types are reused between validations, some of them load
+        # their valid values from the database.
+        self._semantic_types = {}
 
     def validate(self, data_dict, **kwargs):
-        info = []
-        warnings = []
-        errors = []
+        return self.validate_structured(data_dict, **kwargs).to_dict()
+
+    def validate_structured(self, data_dict, max_errors=None, **kwargs):
+        result = ValidationResult(self.result_name())
+        if max_errors is None:
+            max_errors = self.max_errors
 
         vars_df = data_dict['variables']
         data_df = data_dict['data']
+        var_types = dict(zip(vars_df['variable'][::-1],
+                             vars_df['type'][::-1]))
+
+        n_errors = 0
+        for i, var in enumerate(data_df):
+            budget = self.max_errors_per_column
+            if max_errors is not None:
+                if n_errors >= max_errors:
+                    result.add(
+                        'warning',
+                        'Stopped after {} invalid values, the variable(s) '
+                        '{} were not checked.'.format(
+                            n_errors, ', '.join(data_df.columns[i:])),
+                        code='error_budget_exhausted')
+                    break
+                budget = max_errors - n_errors if budget is None \
+                    else min(budget, max_errors - n_errors)
+
+            var_type = var_types[var]
+            if var_type == '':
+                var_type = 'string'
+            type_validator = self._get_semantic_type(var_type)
+            invalid, complete = self._find_invalid(type_validator,
+                                                   data_df[var],
+                                                   budget)
+            if len(invalid) > 0:
+                n_errors += len(invalid)
+                self._add_invalid(result, var, var_type,
+                                  data_df['id'].values[invalid],
+                                  data_df[var].values[invalid],
+                                  complete)
+
+        if not result.has_errors:
+            result.add('info', 'No invalid values found.')
+        return result
+
+    def merge_rows(self, previous, changed, data_dict, changed_rows):
+        import pandas as pd
+
+        # Truncated results can't be merged
+        if self.max_errors is not None or \
+                self.max_errors_per_column is not None:
+            return None
+
+        result = ValidationResult(self.result_name())
+        vars_df = data_dict['variables']
+        data_df = data_dict['data']
+        var_types = dict(zip(vars_df['variable'][::-1],
+                             vars_df['type'][::-1]))
+        ids = pd.Index(data_df['id'].values)
+        kept_ids = ids[~changed_rows]
+        previous_blocks = dict((var, (row_ids, values))
+                               for var, row_ids, values
+                               in previous.value_blocks('invalid_type'))
+        changed_blocks = dict((var, (row_ids, values))
+                              for var, row_ids, values
+                              in changed.value_blocks('invalid_type'))
 
         for var in data_df:
-            n_errors = 0
-            invalid_ids = []
-            var_type = vars_df.loc[vars_df['variable'] == var, :]
-            var_type = var_type.iloc[0]['type']
+            row_ids = []
+            values = []
+            if var in previous_blocks:
+                previous_ids = np.asarray(previous_blocks[var][0])
+                kept = np.isin(previous_ids, kept_ids)
+                row_ids.append(previous_ids[kept])
+                values.append(np.asarray(previous_blocks[var][1],
+                                         dtype=object)[kept])
+            if var in changed_blocks:
+                row_ids.append(np.asarray(changed_blocks[var][0]))
+                values.append(np.asarray(changed_blocks[var][1],
+                                         dtype=object))
+            if len(row_ids) == 0:
+                continue
+            row_ids = np.concatenate(row_ids)
+            values = np.concatenate(values)
+            # Same order as in the table
+            order = np.argsort(ids.get_indexer(row_ids), kind='stable')
+            var_type = var_types[var]
             if var_type == '':
                 var_type = 'string'
-            type_validator = SemanticType.get(var_type,
-                                              **self.type_validator_args)
-            for i, value in enumerate(data_df[var]):
-                is_valid = type_validator.check(value)
-                if not is_valid:
-                    n_errors += 1
-                    invalid_ids.append(
-                        (data_df.iloc[i]['id'],
-                         data_df.iloc[i][var])
-                    )
-            if n_errors > 0:
-                invalid_ids = sorted(invalid_ids, key=lambda x: x[0])
-                invalid_ids_str = ['{} ("{}")'.format(id, value)
-                                   for id, value
-                                   in invalid_ids[
-                                       :TypeValidator.MAX_N_ERRORS_DISPLAYED
-                                   ]]
-                if len(invalid_ids) > TypeValidator.MAX_N_ERRORS_DISPLAYED:
-                    invalid_ids_str.append('...')
-                errors.append(
-                    'Variable "{}" (type "{}") has {} invalid values '
-                    'in rows {}.'.format(
-                        var,
-                        var_type,
-                        n_errors,
-                        ', '.join(invalid_ids_str)
-                    ))
-
-        if len(errors) == 0:
-            info.append('No invalid values found.')
+            self._add_invalid(result, var, var_type,
+                              row_ids[order], values[order], True)
 
+        if not result.has_errors:
+            result.add('info', 'No invalid values found.')
+        return result
+
+    def begin(self, data_dict, max_errors=None, **kwargs):
+        if max_errors is None:
+            max_errors = self.max_errors
+        vars_df = data_dict['variables']
+        # Invalid values kept for each variable, the rest are only counted
+        limits = [limit for limit in [max_errors, self.max_errors_per_column]
+                  if limit is not None]
         return {
-            'info': info,
-            'warnings': warnings,
-            'errors': errors
+            'var_types': dict(zip(vars_df['variable'][::-1],
+                                  vars_df['type'][::-1])),
+            'max_errors': max_errors,
+            'limit': min(limits) if limits else None,
+            'columns': None,
+            'n_rows': 0,
+            # {variable: [number of invalid values, positions, ids, values]}
+            'invalid': {},
+            # {variable: exception raised when checking it}
+            'failed': {},
         }
+
+    def feed(self, state, chunk):
+        if state['columns'] is None:
+            state['columns'] = list(chunk.columns)
+        for var in chunk:
+            if var in state['failed']:
+                continue
+            try:
+                var_type = state['var_types'][var]
+                if var_type == '':
+                    var_type = 'string'
+                invalid = np.flatnonzero(
+                    ~self._get_semantic_type(var_type).check_series(
+                        chunk[var]).values)
+                if len(invalid) > 0:
+                    self._keep_invalid(state, var, len(invalid),
+                                       invalid + state['n_rows'],
+                                       chunk['id'].values[invalid],
+                                       chunk[var].values[invalid])
+            except Exception as e:
+                # Only raised by finish if the variable would be checked
+                state['failed'][var] = e
+        state['n_rows'] += len(chunk.index)
+        return state
+
+    def merge(self, state, other):
+        if state['columns'] is None:
+            state['columns'] = other['columns']
+        for var, e in other['failed'].items():
+            state['failed'].setdefault(var, e)
+        for var, (n_invalid, positions, ids, values) \
+                in other['invalid'].items():
+            self._keep_invalid(state, var, n_invalid,
+                               positions + state['n_rows'], ids, values)
+        state['n_rows'] += other['n_rows']
+        return state
+
+    def finish(self, state, data_dict):
+        result = ValidationResult(self.result_name())
+        max_errors = state['max_errors']
+        columns = state['columns'] or []
+        # Last chunk of the in-memory search (see _find_invalid)
+        last_chunk = (state['n_rows'] - 1) // TypeValidator.CHUNK_SIZE
+
+        n_errors = 0
+        for i, var in enumerate(columns):
+            budget = self.max_errors_per_column
+            if max_errors is not None:
+                if n_errors >= max_errors:
+                    result.add(
+                        'warning',
+                        'Stopped after {} invalid values, the variable(s) '
+                        '{} were not checked.'.format(
+                            n_errors, ', '.join(columns[i:])),
+                        code='error_budget_exhausted')
+                    break
+                budget = max_errors - n_errors if budget is None \
+                    else min(budget, max_errors - n_errors)
+
+            if var in state['failed']:
+                raise state['failed'][var]
+            var_type = state['var_types'][var]
+            if var_type == '':
+                var_type = 'string'
+            n_invalid, positions, ids, values = state['invalid'].get(
+                var, (0, [], [], []))
+            complete = True
+            if budget is not None and n_invalid >= budget:
+                complete = 0 < n_invalid == budget and \
+                    positions[budget - 1] // TypeValidator.CHUNK_SIZE == \
+                    last_chunk
+                ids = ids[:budget]
+                values = values[:budget]
+            if len(ids) > 0:
+                n_errors += len(ids)
+                self._add_invalid(result, var, var_type, ids, values,
+                                  complete)
+
+        if not result.has_errors:
+            result.add('info', 'No invalid values found.')
+        return result
+
+    def _add_invalid(self, result, var, var_type, row_ids, values,
+                     complete):
+        """ Adds the invalid values of a variable to a result, with the
+        suggestions of its semantic type. """
+        suggestions, suggested = self._suggest(
+            self._get_semantic_type(var_type), values)
+        result.add_values('error',
+                          'invalid_type',
+                          'DATA',
+                          var,
+                          row_ids,
+                          values,
+                          partial(self._summary, var, var_type, complete,
+                                  suggested),
+                          suggestions=suggestions)
+
+    def _suggest(self, type_validator, values):
+        """
+        Suggestions are only looked up once per distinct invalid value (up
+        to MAX_N_SUGGESTED of them), so they are cheap even if there are
+        many invalid values.
+
+        :returns: Suggestion of each value (None if the type has no
+            suggestions) and the suggestions as {value: suggestion}
+        :rtype: tuple
+        """
+        import pandas as pd
+
+        if type(type_validator).suggest is SemanticType.suggest:
+            return None, {}
+        suggested = {}
+        distinct = pd.unique(np.asarray(values, dtype=object))
+        for value in distinct[:TypeValidator.MAX_N_SUGGESTED]:
+            if pd.isna(value) or value == '':
+                continue
+            suggestions = type_validator.suggest(value)
+            if suggestions:
+                suggested[value] = suggestions[0]
+        if not suggested:
+            return None, suggested
+        return np.array([suggested.get(value) for value in values],
+                        dtype=object), suggested
+
+    def _keep_invalid(self, state, var, n_invalid, positions, ids, values):
+        """ Adds invalid values of a variable to a chunked validation
+        state, up to its limit. """
+        if var not in state['invalid']:
+            state['invalid'][var] = [0, positions[:0], ids[:0], values[:0]]
+        kept = state['invalid'][var]
+        kept[0] += n_invalid
+        n_new = len(positions)
+        if state['limit'] is not None:
+            n_new = min(n_new, max(state['limit'] - len(kept[1]), 0))
+        if n_new > 0:
+            kept[1] = np.concatenate([kept[1], positions[:n_new]])
+            kept[2] = np.concatenate([kept[2], ids[:n_new]])
+            kept[3] = np.concatenate([kept[3], values[:n_new]])
+
+    def _find_invalid(self, type_validator, series, budget):
+        """
+        :returns: Positions of the invalid values (at most *budget*) and
+            whether all of them were found
+        :rtype: tuple
+        """
+        if budget is None:
+            return np.flatnonzero(~type_validator.check_series(series)
+                                  .values), True
+        positions = []
+        n_found = 0
+        for start in range(0, len(series.index), TypeValidator.CHUNK_SIZE):
+            chunk = series.iloc[start:start + TypeValidator.CHUNK_SIZE]
+            chunk_positions = np.flatnonzero(
+                ~type_validator.check_series(chunk).values) + start
+            positions.append(chunk_positions)
+            n_found += len(chunk_positions)
+            if n_found >= budget:
+                positions = np.concatenate(positions)
+                complete = n_found == budget and \
+                    start + TypeValidator.CHUNK_SIZE >= len(series.index)
+                return positions[:budget], complete
+        if len(positions) == 0:
+            return np.array([], dtype=int), True
+        return np.concatenate(positions), True
+
+    def _summary(self, var, var_type, complete, suggested, row_ids,
+                 values):
+        invalid_ids = sorted(zip(row_ids, values), key=lambda x: x[0])
+        displayed = invalid_ids[:TypeValidator.MAX_N_ERRORS_DISPLAYED]
+        invalid_ids_str = ['{} ("{}")'.format(id, value)
+                           for id, value in displayed]
+        if len(invalid_ids) > TypeValidator.MAX_N_ERRORS_DISPLAYED:
+            invalid_ids_str.append('...')
+        summary = ('Variable "{}" (type "{}") has {}{} invalid values '
+                   'in rows {}.'.format(var,
+                                        var_type,
+                                        '' if complete else 'at least ',
+                                        len(invalid_ids),
+                                        ', '.join(invalid_ids_str)))
+        suggestions_str = []
+        for _, value in displayed:
+            suggestion = '"{}" instead of "{}"'.format(suggested[value],
+                                                       value) \
+                if value in suggested else None
+            if suggestion is not None and \
+                    suggestion not in suggestions_str:
+                suggestions_str.append(suggestion)
+        if suggestions_str:
+            summary += ' Did you mean {}?'.format(', '.join(suggestions_str))
+        return summary
+
+    def _get_semantic_type(self, type_name):
+        if type_name not in self._semantic_types:
+            self._semantic_types[type_name] = SemanticType.get(
+                type_name, **self.type_validator_args)
+        return self._semantic_types[type_name]
@@ -5,10 +5,39 @@ the rest of the plugin classes are derived.
 
 """
 
-from pkg_resources import iter_entry_points
-
 __all__ = ['PluginModule', ]
 
+# Entry points of each group, scanning the installed packages is slow
+_entry_points_cache = {}
+
+
+def iter_entry_points(group):
+    """
+    Returns the entry points of a group without loading them.
+
+    :param str group: Entry point group (e.g. 'data_manager.codecs')
+    :returns: Entry points, with *name* attributes and *load* methods
+    :rtype: list
+    """
+    if group not in _entry_points_cache:
+        # Imported here, importlib.metadata is slow to import
+        try:
+            from importlib.metadata import entry_points
+        except ImportError:  # Python < 3.8
+            entry_points = None
+        if entry_points is None:
+            import pkg_resources
+            group_entry_points = list(pkg_resources.iter_entry_points(group))
+        else:
+            all_entry_points = entry_points()
+            if hasattr(all_entry_points, 'select'):
+                group_entry_points = list(
+                    all_entry_points.select(group=group))
+            else:
+                group_entry_points = list(all_entry_points.get(group, []))
+        _entry_points_cache[group] = group_entry_points
+    return _entry_points_cache[group]
+
 
 class PluginModuleMeta(type):
     """ Base metaclass to make subclasses inherit docstrings from their
@@ -57,7 +86,6 @@ class PluginModule(object, metaclass=PluginModuleMeta):
         :returns: Plugin
         :rtype: PluginModule
         """
-        class_dict = cls.get_plugins()
         if id:
             fetcher_id = None
             try:
@@ -72,14 +100,14 @@ class PluginModule(object, metaclass=PluginModuleMeta):
             except KeyError:
                 pass  # If type is not defined we try the default plugin
 
-            try:
-                return class_dict[fetcher_id](**kwargs)
-            except KeyError:
+            plugin_class = cls.get_plugin(fetcher_id)
+            if plugin_class is None:
                 raise NotImplementedError(
                     'Plugin "{}" is not available. Check if the plugin '
                     '(or its dependencies) are installed.'.format(
                         fetcher_id
                     ))
+            return plugin_class(**kwargs)
         try:
             return cls._get_default_handler(**kwargs)
         except NotImplementedError:
@@ -87,6 +115,44 @@ class PluginModule(object, metaclass=PluginModuleMeta):
                 'There is no default {} for {}'.format(
                     cls.__name__, id))
 
+    @classmethod
+    def get_plugin_names(cls):
+        """
+        Returns the names of the plugins of cls without importing them.
+
+        :returns: Plugin names (e.g. ['excel', 'mysql', ...])
+        :rtype: list
+        """
+        entry_point_group = 'data_manager.' + cls.entry_point_group
+        names = []
+        for entry_point in iter_entry_points(entry_point_group):
+            if entry_point.name not in names:
+                names.append(entry_point.name)
+        return names
+
+    @classmethod
+    def get_plugin(cls, name):
+        """
+        Returns the class of a single plugin, only importing its module (and
+        therefore its dependencies).
+
+        :param str name: plugin id (e.g. 'excel', 'mysql', ...)
+        :returns: Plugin class, None if it is not available
+        :rtype: type
+        """
+        entry_point_group = 'data_manager.' + cls.entry_point_group
+        for entry_point in iter_entry_points(entry_point_group):
+            if entry_point.name != name:
+                continue
+            try:
+                return entry_point.load()
+            except Exception as e:
+                print("'{}' from '{}' not loaded:\n  {}".format(
+                    entry_point.name,
+                    entry_point_group,
+                    str(e)))
+        return None
+
     @classmethod
     def get_plugins(cls):
         """
@@ -24,6 +24,82 @@ class SemanticType(PluginModule):
         raise NotImplementedError(
             'Type validation not implemented for {}'.format(self.__class__))
 
+    def check_series(self, series, **kwargs):
+        """
+        Checks all the values of a column at once. Types should override
+        it with a vectorized implementation, by default *check* is called
+        for each value.
+
+        :param pandas.Series series: Values to check
+        :returns: Boolean series, True for the valid values
+        :rtype: pandas.Series
+        """
+        return series.map(lambda value: bool(self.check(value, **kwargs)))
+
+    def suggest(self, value, n=1, **kwargs):
+        """
+        Suggests valid values for an invalid one ("did you mean ...?").
+        Types with a dictionary of valid values override it, usually with a
+        *SuggestionIndex*.
+
+        :param value: Invalid value
+        :param int n: Maximum number of suggestions
+        :returns: Closest valid values, the best first (none by default)
+        :rtype: list
+        """
+        return []
+
+    @classmethod
+    def get_plugin_names(cls):
+        """
+        Returns the names of the plugins and of the declarative types (see
+        *DeclarativeType*) without importing them.
+
+        :returns: Type names (e.g. ['integer', 'iso', 'year', ...])
+        :rtype: list
+        """
+        from infocentre_data_manager.plugins.semantic_types.declarative \
+            import declarative_types
+
+        names = super().get_plugin_names()
+        return names + [name for name in declarative_types()
+                        if name not in names]
+
+    @classmethod
+    def get_plugin(cls, name):
+        """
+        Returns the class of a single plugin or, if there is no plugin with
+        that name, of a declarative type (see *DeclarativeType*).
+
+        :param str name: Type name (e.g. 'integer', 'year', ...)
+        :returns: Type class, None if it is not available
+        :rtype: type
+        """
+        from infocentre_data_manager.plugins.semantic_types.declarative \
+            import declarative_type
+
+        plugin = super().get_plugin(name)
+        if plugin is None:
+            plugin = declarative_type(name)
+        return plugin
+
+    @classmethod
+    def get_plugins(cls):
+        """
+        Returns the plugins and the declarative types.
+
+        :returns: Dictionary with elements {type_name: type_class}
+        :rtype: dict
+        """
+        from infocentre_data_manager.plugins.semantic_types.declarative \
+            import declarative_type, declarative_types
+
+        plugins = super().get_plugins()
+        for name in declarative_types():
+            if name not in plugins:
+                plugins[name] = declarative_type(name)
+        return plugins
+
     @property
     @abstractmethod
     def help_info(self, **kwargs):
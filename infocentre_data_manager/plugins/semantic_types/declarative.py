@@ -0,0 +1,252 @@
+""" declarative.py
+
+This module includes the semantic types defined declaratively, with rules
+in a JSON (or YAML) file instead of a python class.
+
+"""
+
+import json
+import logging
+import os
+import re
+from infocentre_data_manager.plugins.semantic_types.base import SemanticType
+
+__all__ = ['DeclarativeType', 'declarative_type', 'declarative_types',
+           'register_types', ]
+
+# Definitions included in the package
+DEFAULT_DEFINITIONS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    'data', 'semantic_types.json')
+# Environment variable with more definition files, separated by os.pathsep
+DEFINITIONS_ENV = 'DATA_MANAGER_SEMANTIC_TYPES'
+# Numbers in decimal or scientific notation
+NUMBER_PATTERN = r'\s*[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?\s*'
+RULES = ['help', 'pattern', 'values', 'minimum', 'maximum', 'integer',
+         'numeric', 'nullable', 'missing_values']
+
+# {type name: definition}, loaded when first needed
+_definitions = None
+# {type name: class} of the types already requested
+_classes = {}
+
+
+class DeclarativeType(SemanticType):
+    """
+    Semantic type defined by a dictionary of rules, all of them optional:
+
+    * *pattern*: Regular expression that the whole value must match.
+    * *values*: List with the valid values (an enumeration).
+    * *minimum*, *maximum*: Range of valid numbers (inclusive).
+    * *integer*: Whether values must be integer numbers.
+    * *numeric*: Whether values must be numbers, in decimal or scientific
+      notation (implied by the three rules above).
+    * *nullable*: Whether empty values (empty strings and NaN) are valid,
+      False by default.
+    * *missing_values*: Values that are always valid (e.g. the missing value
+      codes "-9999" and "-6666").
+    * *help*: Description of the type.
+
+    Values are compared as strings with *pattern*, *values* and
+    *missing_values*. The rules are compiled once into vectorized checks
+    over whole columns (see *check_series*).
+
+    Types are usually defined in a definitions file (see *register_types*),
+    which creates a subclass for each of them with its *definition*.
+    """
+
+    definition = {}
+
+    def __init__(self, definition=None, **kwargs):
+        """
+        :param dict definition: Rules of the type, the class *definition*
+            by default
+        :param kwargs: Other semantic type arguments (ignored)
+        """
+        if definition is None:
+            definition = self.definition
+        _check_definition(definition)
+        self.definition = definition
+        self.pattern = re.compile(definition['pattern']) \
+            if 'pattern' in definition else None
+        self.values = [str(value) for value in definition['values']] \
+            if 'values' in definition else None
+        self.minimum = definition.get('minimum')
+        self.maximum = definition.get('maximum')
+        self.integer = bool(definition.get('integer', False))
+        self.numeric = bool(definition.get('numeric', False)) or \
+            self.integer or \
+            self.minimum is not None or \
+            self.maximum is not None
+        self.nullable = bool(definition.get('nullable', False))
+        self.missing_values = [str(value) for value
+                               in definition.get('missing_values', [])]
+        self._suggestion_index = None
+
+    def check(self, value, **kwargs):
+        import pandas as pd
+
+        return bool(self.check_series(
+            pd.Series([value], dtype=object)).iloc[0])
+
+    def check_series(self, series, **kwargs):
+        import numpy as np
+        import pandas as pd
+
+        missing = series.isna().values
+        text = series.astype(object).where(~missing, '').astype(str)
+        null = missing | (text == '').values
+
+        valid = ~null
+        if self.pattern is not None:
+            valid &= text.str.fullmatch(self.pattern).fillna(False) \
+                .astype(bool).values
+        if self.values is not None:
+            valid &= text.isin(self.values).values
+        if self.numeric:
+            # Much faster than pd.to_numeric, only numbers are converted
+            is_number = ~null & text.str.fullmatch(NUMBER_PATTERN) \
+                .fillna(False).astype(bool).values
+            numbers = np.full(len(text.index), np.nan)
+            numbers[is_number] = text[is_number].str.strip().astype(float)
+            valid &= is_number
+            if self.integer:
+                valid &= numbers == np.round(numbers)
+            if self.minimum is not None:
+                valid &= numbers >= self.minimum
+            if self.maximum is not None:
+                valid &= numbers <= self.maximum
+        if self.nullable:
+            valid |= null
+        if self.missing_values:
+            valid |= text.isin(self.missing_values).values
+        return pd.Series(valid, index=series.index)
+
+    def suggest(self, value, n=1, **kwargs):
+        # Only enumerations have a dictionary to suggest from
+        if self.values is None:
+            return []
+        if self._suggestion_index is None:
+            from infocentre_data_manager.plugins.semantic_types.suggestions \
+                import SuggestionIndex
+
+            self._suggestion_index = SuggestionIndex(self.values)
+        return self._suggestion_index.suggest(value, n)
+
+    def help_info(self, **kwargs):
+        if 'help' in self.definition:
+            return self.definition['help']
+        return ', '.join('{}: {}'.format(rule, self.definition[rule])
+                         for rule in RULES if rule in self.definition)
+
+
+def declarative_types():
+    """
+    :returns: Definitions of the declarative types, as {name: definition}
+    :rtype: dict
+    """
+    global _definitions
+
+    if _definitions is None:
+        definitions = _load_definitions(DEFAULT_DEFINITIONS)
+        for path in os.environ.get(DEFINITIONS_ENV, '').split(os.pathsep):
+            if path:
+                definitions.update(_load_definitions(path))
+        _definitions = definitions
+    return _definitions
+
+
+def declarative_type(name):
+    """
+    :param str name: Type name
+    :returns: Class of a declarative type, None if it isn't defined
+    :rtype: type
+    """
+    if name not in _classes:
+        definition = declarative_types().get(name)
+        if definition is None:
+            return None
+        cls_dict = {'definition': definition}
+        if 'help' in definition:
+            cls_dict['__doc__'] = definition['help']
+        _classes[name] = type(
+            '{}Type'.format(''.join(part.capitalize()
+                                    for part in name.split('_'))),
+            (DeclarativeType, ),
+            cls_dict)
+    return _classes[name]
+
+
+def register_types(definitions):
+    """
+    Adds (or replaces) declarative types. Definitions can also be added
+    without code with the environment variable DATA_MANAGER_SEMANTIC_TYPES,
+    a list of definition files (separated by ':' in Unix, ';' in Windows).
+
+    A definitions file is a JSON (or YAML, if *pyyaml* is installed) object
+    with the rules of each type in 'types', and optionally the rules shared
+    by all of them in 'defaults', e.g.:
+
+    .. code-block:: json
+
+        {"defaults": {"missing_values": ["-9999", "-6666"]},
+         "types": {"year": {"pattern": "[0-9]{4}", "minimum": 1900}}}
+
+    :param definitions: Path of a definitions file, or its content as a
+        dictionary
+    """
+    if isinstance(definitions, str):
+        new_definitions = _load_definitions(definitions)
+    else:
+        new_definitions = _parse_definitions(definitions)
+    declarative_types().update(new_definitions)
+    for name in new_definitions:
+        _classes.pop(name, None)
+
+
+def _load_definitions(path):
+    with open(path) as definitions_file:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+
+            content = yaml.safe_load(definitions_file)
+        else:
+            content = json.load(definitions_file)
+    try:
+        return _parse_definitions(content)
+    except ValueError as e:
+        raise ValueError('{}: {}'.format(path, e)) from None
+
+
+def _parse_definitions(content):
+    defaults = content.get('defaults', {})
+    definitions = {}
+    for name, rules in content.get('types', {}).items():
+        definition = dict(defaults)
+        definition.update(rules)
+        try:
+            _check_definition(definition)
+        except ValueError as e:
+            raise ValueError('Semantic type "{}": {}'.format(name, e)) \
+                from None
+        definitions[name] = definition
+    return definitions
+
+
+def _check_definition(definition):
+    unknown = set(definition) - set(RULES)
+    if unknown:
+        raise ValueError('Unknown rules {}'.format(
+            ', '.join(sorted(unknown))))
+    if 'pattern' in definition:
+        try:
+            re.compile(definition['pattern'])
+        except re.error as e:
+            raise ValueError('Invalid pattern ({})'.format(e)) from None
+    for rule in ['minimum', 'maximum']:
+        if rule in definition and \
+                not isinstance(definition[rule], (int, float)):
+            raise ValueError('"{}" must be a number'.format(rule))
+    if 'values' in definition and \
+            not isinstance(definition['values'], list):
+        raise ValueError('"values" must be a list')
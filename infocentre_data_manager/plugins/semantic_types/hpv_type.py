@@ -8,6 +8,8 @@ import logging
 import pymysql
 import pandas as pd
 from infocentre_data_manager.plugins.semantic_types.base import SemanticType
+from infocentre_data_manager.plugins.semantic_types.suggestions import \
+    SuggestionIndex, normalize_key
 
 __all__ = ['HPVType', ]
 
@@ -27,9 +29,28 @@ class HPVType(SemanticType):
         self.available_types = \
             set(pd.read_sql('SELECT hpvtype '
                             'FROM dict_hpv_types', conn)['hpvtype'])
+        self._suggestion_index = None
 
     def check(self, value, **kwargs):
         return value in self.available_types
 
+    def check_series(self, series, **kwargs):
+        return series.isin(self.available_types)
+
+    def suggest(self, value, n=1, **kwargs):
+        # The index is built once, the first time it is needed
+        if self._suggestion_index is None:
+            self._suggestion_index = SuggestionIndex(
+                sorted(self.available_types),
+                normalize=_normalize_hpv_type)
+        return self._suggestion_index.suggest(value, n)
+
     def help_info(self, **kwargs):
         return 'HPV types'
+
+
+def _normalize_hpv_type(value):
+    """ HPV types are compared without the 'HPV' prefix (e.g. 'HPV-16',
+    'hpv16' and '16' are the same). """
+    key = normalize_key(value)
+    return key[3:] if key.startswith('hpv') else key
@@ -9,6 +9,9 @@ from infocentre_data_manager.plugins.semantic_types.base import SemanticType
 
 __all__ = ['IntegerType', ]
 
+# Strings accepted by int()
+INTEGER_PATTERN = r'\s*[+-]?\d+(?:_\d+)*\s*'
+
 
 class IntegerType(SemanticType):
     """
@@ -25,5 +28,15 @@ class IntegerType(SemanticType):
         except Exception:
             return False
 
+    def check_series(self, series, **kwargs):
+        from pandas.api.types import is_integer_dtype, is_string_dtype
+
+        if is_integer_dtype(series):
+            return series.notna()
+        if is_string_dtype(series):
+            return series.str.fullmatch(INTEGER_PATTERN).fillna(False) \
+                .astype(bool)
+        return super().check_series(series, **kwargs)
+
     def help_info(self, **kwargs):
         return 'Integer'
@@ -8,6 +8,8 @@ import logging
 import pymysql
 import pandas as pd
 from infocentre_data_manager.plugins.semantic_types.base import SemanticType
+from infocentre_data_manager.plugins.semantic_types.suggestions import \
+    SuggestionIndex
 
 __all__ = ['IsoType', ]
 
@@ -27,9 +29,20 @@ class IsoType(SemanticType):
         self.available_isos = \
             set(pd.read_sql('SELECT iso3Code '
                             'FROM dict_regions', conn)['iso3Code'])
+        self._suggestion_index = None
 
     def check(self, value, **kwargs):
         return value in self.available_isos
 
+    def check_series(self, series, **kwargs):
+        return series.isin(self.available_isos)
+
+    def suggest(self, value, n=1, **kwargs):
+        # The index is built once, the first time it is needed
+        if self._suggestion_index is None:
+            self._suggestion_index = SuggestionIndex(
+                sorted(self.available_isos))
+        return self._suggestion_index.suggest(value, n)
+
     def help_info(self, **kwargs):
         return 'ISO3 codes'
@@ -21,5 +21,8 @@ class StringType(SemanticType):
     def check(self, value, **kwargs):
         return True
 
+    def check_series(self, series, **kwargs):
+        return series.isna() | series.notna()
+
     def help_info(self, **kwargs):
         return 'String'
@@ -0,0 +1,128 @@
+""" suggestions.py
+
+This module includes the index used by the semantic types to suggest valid
+values for invalid ones ("did you mean ...?").
+
+"""
+
+import re
+from collections import defaultdict
+
+__all__ = ['SuggestionIndex', 'normalize_key', ]
+
+
+def normalize_key(value):
+    """
+    Default normalization of values: case insensitive and ignoring
+    everything but letters and digits (e.g. 'esp', ' ESP' and 'E.S.P.'
+    are all 'esp').
+
+    :param value: Value
+    :rtype: str
+    """
+    return re.sub(r'[\W_]+', '', str(value)).casefold()
+
+
+class SuggestionIndex(object):
+    """
+    Index of the valid values of a type, built once, that finds the closest
+    valid values of an invalid one:
+
+    * Values with the same normalized key (e.g. a different case or
+      format) are suggested first.
+    * Otherwise, the candidates are the valid values that share at least a
+      trigram with it (looked up in an inverted index) and they are ranked
+      by their edit distance (insertions, deletions, substitutions and
+      transpositions), up to *max_distance* (1 for keys of up to 4
+      characters, 2 otherwise, by default).
+    """
+
+    def __init__(self, values, normalize=normalize_key, max_distance=None):
+        """
+        :param values: Valid values
+        :param normalize: Function that returns the normalized key of a
+            value
+        :param int max_distance: Maximum edit distance of the suggestions
+        """
+        self.normalize = normalize
+        self.max_distance = max_distance
+        # {normalized key: valid values}
+        self._keys = defaultdict(list)
+        # {trigram: normalized keys}
+        self._trigrams = defaultdict(set)
+        for value in values:
+            key = normalize(value)
+            if not key:
+                continue
+            if key not in self._keys:
+                for trigram in _trigrams(key):
+                    self._trigrams[trigram].add(key)
+            self._keys[key].append(value)
+
+    def suggest(self, value, n=1):
+        """
+        :param value: Invalid value
+        :param int n: Maximum number of suggestions
+        :returns: Closest valid values, the best first
+        :rtype: list
+        """
+        key = self.normalize(value)
+        if not key:
+            return []
+        if key in self._keys:
+            return self._keys[key][:n]
+
+        shared = defaultdict(int)
+        for trigram in _trigrams(key):
+            for candidate in self._trigrams.get(trigram, ()):
+                shared[candidate] += 1
+        max_distance = self.max_distance
+        if max_distance is None:
+            max_distance = 1 if len(key) <= 4 else 2
+
+        scored = []
+        for candidate, n_shared in shared.items():
+            if abs(len(candidate) - len(key)) > max_distance:
+                continue
+            distance = _edit_distance(key, candidate, max_distance)
+            if distance <= max_distance:
+                scored.append((distance, -n_shared, candidate))
+        scored.sort()
+
+        suggestions = []
+        for _, _, candidate in scored:
+            suggestions.extend(self._keys[candidate])
+            if len(suggestions) >= n:
+                break
+        return suggestions[:n]
+
+    def __len__(self):
+        return sum(len(values) for values in self._keys.values())
+
+
+def _trigrams(key):
+    padded = '\x00\x00{}\x00'.format(key)
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _edit_distance(a, b, max_distance):
+    """
+    Optimal string alignment distance, stops once it exceeds
+    *max_distance*.
+    """
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1,
+                             current[j - 1] + 1,
+                             previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and \
+                    a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
@@ -0,0 +1,284 @@
+""" service.py
+
+This module includes a long-running validation service that keeps the
+plugins, validators and semantic types loaded between validations, and a
+small HTTP interface to it.
+
+"""
+
+import io
+import json
+import logging
+import os
+import queue
+import socketserver
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+from infocentre_data_manager.plugins.codecs.base import Codec
+from infocentre_data_manager.plugins.data_validators.base import DataValidator
+from infocentre_data_manager.plugins.semantic_types.base import SemanticType
+
+__all__ = ['ValidationService', 'ServiceBusy', 'serve', ]
+
+logger = logging.getLogger(__name__)
+
+_LOOPBACK_HOSTS = ['127.0.0.1', 'localhost', '::1']
+
+
+class ServiceBusy(Exception):
+    """ Raised when no worker becomes available in time. """
+
+
+class ValidationService(object):
+    """
+    Validates datasets with a bounded pool of workers. Each worker owns a
+    set of validator instances, created once when the service starts
+    (validators keep state while validating, so they are not shared between
+    threads), so validations don't pay again for the plugin lookup or for
+    the semantic types that load their values from the database.
+    """
+
+    def __init__(self, validators, workers=4, timeout=30.0):
+        """
+        :param list validators: Validators as in *DataValidator.apply*,
+            dictionaries with their 'name' and 'args'
+        :param int workers: Number of simultaneous validations
+        :param float timeout: Seconds a validation waits for a free worker
+        """
+        self.validator_names = [validator['name'] for validator in validators]
+        self.workers = workers
+        self.timeout = timeout
+        self.codec = Codec.get('excel')
+        self._pool = queue.Queue()
+        for _ in range(workers):
+            self._pool.put([DataValidator.get(validator['name'],
+                                              **validator.get('args', {}))
+                            for validator in validators])
+
+    def validate(self, data, names=None, fail_fast=False, max_errors=None,
+                 snapshot=None, structured=False):
+        """
+        Validates a dataset with a free worker.
+
+        :param data: Data structure with HPV Information Centre format
+        :param list names: Validators to apply (all by default)
+        :param bool fail_fast: Stop after the first validator with errors
+        :param int max_errors: Error budget of each validator
+        :param ValidationSnapshot snapshot: Previous version of the table,
+            only its changed rows are validated again (see
+            *DataValidator.apply_incremental*), ignored with *max_errors*
+        :param bool structured: Whether to return *ValidationResult*
+            objects
+        :returns: Results as in *DataValidator.apply*
+        :rtype: list
+        :raises ServiceBusy: If no worker is free after *timeout* seconds
+        """
+        if names is not None:
+            unknown = set(names) - set(self.validator_names)
+            if unknown:
+                raise ValueError('Unknown validators: {}'.format(
+                    ', '.join(sorted(unknown))))
+        try:
+            validators = self._pool.get(timeout=self.timeout)
+        except queue.Empty:
+            raise ServiceBusy('No worker available') from None
+        try:
+            selected = [validator
+                        for name, validator
+                        in zip(self.validator_names, validators)
+                        if names is None or name in names]
+            if snapshot is not None and max_errors is None:
+                return DataValidator.apply_incremental(
+                    data, snapshot, selected, structured=structured,
+                    fail_fast=fail_fast)
+            return DataValidator.apply(data, selected,
+                                       structured=structured,
+                                       fail_fast=fail_fast,
+                                       max_errors=max_errors)
+        finally:
+            self._pool.put(validators)
+
+    def validate_excel(self, excel_file, names=None, **kwargs):
+        """
+        Loads and validates an excel workbook.
+
+        :param excel_file: Path or file-like object with the workbook
+        :param list names: Validators to apply (all by default)
+        :param kwargs: Other arguments of *validate*
+        :returns: Results as in *DataValidator.apply*
+        :rtype: list
+        """
+        import pandas as pd
+
+        # The workbook is opened once instead of once per sheet
+        with pd.ExcelFile(excel_file) as workbook:
+            data = self.codec.load(file=workbook)
+            return self.validate(data, names, **kwargs)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /plugins: Available plugins and the validators of the service.
+    POST /validate: Validates a workbook, either uploaded as the request
+        body (options in the query string, e.g.
+        ?validators=basic,type&fail_fast=1&max_errors=100) or given as a
+        JSON body {"file": "table.xlsx", "validators": [...],
+        "fail_fast": true, "max_errors": 100}. Files are only read from the
+        *file_directory* of the server, relative paths are relative to it.
+    """
+
+    MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/plugins':
+            self._send_json(404, {'error': 'Not found'})
+            return
+        self._send_json(200, {
+            'codecs': sorted(Codec.get_plugin_names()),
+            'data_validators': sorted(DataValidator.get_plugin_names()),
+            'semantic_types': sorted(SemanticType.get_plugin_names()),
+            'service_validators': self.server.service.validator_names,
+        })
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/validate':
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        if length > _RequestHandler.MAX_UPLOAD_SIZE:
+            self._send_json(413, {'error': 'Workbook too large'})
+            return
+        body = self.rfile.read(length)
+
+        start = time.time()
+        try:
+            if self.headers.get_content_type() == 'application/json':
+                request = json.loads(body.decode('utf-8'))
+                excel_file = _resolve_file(self.server.file_directory,
+                                           request['file'])
+                names = request.get('validators')
+                fail_fast = bool(request.get('fail_fast', False))
+                max_errors = request.get('max_errors')
+            else:
+                excel_file = io.BytesIO(body)
+                query = parse_qs(url.query)
+                names = query.get('validators')
+                if names is not None:
+                    names = ','.join(names).split(',')
+                fail_fast = query.get('fail_fast', ['0'])[-1] in \
+                    ['1', 'true']
+                max_errors = query.get('max_errors', [None])[-1]
+            if max_errors is not None:
+                max_errors = int(max_errors)
+            results = self.server.service.validate_excel(
+                excel_file, names, fail_fast=fail_fast,
+                max_errors=max_errors)
+        except ServiceBusy as e:
+            self._send_json(503, {'error': str(e)})
+            return
+        except PermissionError as e:
+            self._send_json(403, {'error': str(e)})
+            return
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {'error': '{}: {}'.format(
+                e.__class__.__name__, e)})
+            return
+        except Exception as e:
+            logger.exception('Error validating workbook')
+            self._send_json(500, {'error': '{}: {}'.format(
+                e.__class__.__name__, e)})
+            return
+
+        self._send_json(200, {
+            'results': results,
+            'errors': sum(len(result['errors']) for result in results),
+            'seconds': time.time() - start,
+        })
+
+    def _send_json(self, status, content):
+        body = json.dumps(content, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logger.info('{} {}'.format(self.address_string(), format % args))
+
+
+def _resolve_file(directory, path):
+    """
+    :param str directory: Directory the files can be read from, None if
+        only uploaded workbooks are accepted
+    :param str path: Path of the file, absolute or relative to *directory*
+    :returns: Real path of the file
+    :rtype: str
+    :raises PermissionError: If the file is not inside *directory*
+    """
+    if directory is None:
+        raise PermissionError('The service does not read files, upload the '
+                              'workbook instead')
+    directory = os.path.realpath(directory)
+    # Symbolic links are followed, so they can't point outside either
+    real_path = os.path.realpath(os.path.join(directory, path))
+    if os.path.commonpath([directory, real_path]) != directory:
+        raise PermissionError('The file is not in the directory of the '
+                              'service')
+    return real_path
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn,
+                      socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(service, host='127.0.0.1', port=8700, unix_socket=None,
+          file_directory=None):
+    """
+    Serves the validation service over HTTP until interrupted. Requests are
+    handled in their own threads, but only *service.workers* validations
+    run at the same time.
+
+    :param ValidationService service: Validation service
+    :param str host: Listening address
+    :param int port: Listening port
+    :param str unix_socket: Path of a Unix socket to listen on instead of
+        *host* and *port*
+    :param str file_directory: Directory whose workbooks can be validated
+        by path (JSON requests), by default only uploaded workbooks are
+        accepted
+    """
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = _UnixHTTPServer(unix_socket, _RequestHandler)
+        address = unix_socket
+    else:
+        server = _HTTPServer((host, port), _RequestHandler)
+        address = 'http://{}:{}'.format(host, port)
+    server.service = service
+    server.file_directory = file_directory
+    if unix_socket is None and host not in _LOOPBACK_HOSTS:
+        logger.warning('The validation service has no authentication and '
+                       'is listening on {}'.format(host))
+    logger.info('Validation service listening on {}'.format(address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix_socket is not None and os.path.exists(unix_socket):
+            os.remove(unix_socket)
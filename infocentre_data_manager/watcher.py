@@ -0,0 +1,295 @@
+""" watcher.py
+
+This module includes the folder watcher that validates (and optionally
+stores) the excel submissions dropped in a directory.
+
+"""
+
+import datetime
+import fnmatch
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from infocentre_data_manager.plugins.codecs.base import Codec
+from infocentre_data_manager.plugins.data_validators.snapshot import \
+    ValidationSnapshot
+from infocentre_data_manager.service import ValidationService
+
+__all__ = ['FolderWatcher', ]
+
+logger = logging.getLogger(__name__)
+
+
+class FolderWatcher(object):
+    """
+    Long-running service that watches a directory for excel submissions.
+    Each new or modified file is processed by a bounded pool of worker
+    threads: it is loaded with the excel codec, validated and, if there
+    are no validation errors and *store_params* are provided, stored with
+    the MySQL codec. The result and timings of each file are appended to a
+    JSON lines journal.
+
+    New files are detected with inotify if the *inotify_simple* package is
+    installed, or by polling the directory otherwise. Files are only
+    processed once their size and modification time haven't changed for
+    *settle_seconds*, so files still being copied are not read.
+
+    The codecs and validators (including the semantic types and the values
+    they load from the database) are created once per worker and reused for
+    all the files. Files are stored by the worker threads of an
+    *AsyncMySQLCodec*, each of which keeps its MySQL connection open
+    between files (reconnecting if it was lost).
+
+    The row hashes and results of the last validation of each table are
+    kept (see *ValidationSnapshot*), so when a table is submitted again
+    only its changed rows are validated by the validators that check each
+    row independently.
+    """
+
+    def __init__(self, directory, validators, store_params=None,
+                 journal=None, patterns=('*.xlsx', ), workers=2,
+                 queue_size=100, settle_seconds=2.0, poll_interval=1.0,
+                 process_existing=True, snapshots=16):
+        """
+        :param str directory: Watched directory
+        :param list validators: Validators as in *DataValidator.apply*,
+            dictionaries with their 'name' and 'args'
+        :param dict store_params: Parameters of *MySQLCodec.store*, files
+            are only validated if not provided
+        :param str journal: JSON lines file where results are appended
+        :param tuple patterns: File name patterns to process
+        :param int workers: Number of files processed at the same time
+        :param int queue_size: Maximum number of files waiting to be
+            processed
+        :param float settle_seconds: Time without changes before a file is
+            processed
+        :param float poll_interval: Seconds between directory checks
+        :param bool process_existing: Whether files already in the
+            directory are processed
+        :param int snapshots: Number of tables whose last validation is
+            kept for incremental validation (0 disables it)
+        """
+        self.directory = os.path.abspath(directory)
+        self.store_params = store_params
+        self.journal = journal
+        self.patterns = patterns
+        self.workers = workers
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.snapshots = snapshots
+
+        self.codec = Codec.get('excel')
+        self.db_codec = None
+        if store_params:
+            self.db_codec = Codec.get('async_mysql', pool_size=workers)
+        self.service = ValidationService(validators, workers=workers,
+                                         timeout=None)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._journal_lock = threading.Lock()
+        # {table name: ValidationSnapshot}, least recently used first
+        self._snapshots = OrderedDict()
+        self._snapshots_lock = threading.Lock()
+        # {path: (signature, time since the signature is stable)}
+        self._pending = {}
+        # {path: signature} of the files already queued (while they are in
+        # the directory)
+        self._processed = {}
+        if not process_existing:
+            for path in self._scan():
+                self._processed[path] = self._signature(path)
+
+    def run(self):
+        """
+        Watches the directory until *stop* is called (or the process is
+        interrupted).
+        """
+        threads = [threading.Thread(target=self._work,
+                                    name='watcher-worker-{}'.format(i),
+                                    daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        inotify = self._create_inotify()
+        logger.info('Watching {} ({})'.format(
+            self.directory, 'inotify' if inotify else 'polling'))
+        try:
+            for path in self._scan():
+                self._pending.setdefault(path, (None, None))
+            while not self._stop.is_set():
+                if inotify is not None:
+                    events = inotify.read(
+                        timeout=int(self.poll_interval * 1000))
+                    for event in events:
+                        path = os.path.join(self.directory, event.name)
+                        if self._matches(path):
+                            self._pending.setdefault(path, (None, None))
+                else:
+                    self._stop.wait(self.poll_interval)
+                    paths = self._scan()
+                    # Deleted files are forgotten by _check_pending
+                    paths.extend(set(self._processed).difference(paths))
+                    for path in paths:
+                        self._pending.setdefault(path, (None, None))
+                self._check_pending()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop.set()
+            for _ in threads:
+                self._queue.put(None)
+            for thread in threads:
+                thread.join()
+            if inotify is not None:
+                inotify.close()
+            if self.db_codec is not None:
+                self.db_codec.close()
+
+    def stop(self):
+        """ Stops watching, files being processed are finished first. """
+        self._stop.set()
+
+    def process(self, path):
+        """
+        Loads, validates and optionally stores a file, and writes its
+        journal entry.
+
+        :param str path: Excel file
+        :returns: Journal entry
+        :rtype: dict
+        """
+        entry = {
+            'file': path,
+            'time': datetime.datetime.now().isoformat(),
+            'status': None,
+            'timings': {},
+        }
+        step_start = time.time()
+        step = 'load'
+        try:
+            import pandas as pd
+
+            # The workbook is opened once instead of once per sheet
+            with pd.ExcelFile(path) as workbook:
+                data = self.codec.load(file=workbook)
+                data.load_all()
+            entry['table_name'] = data['general']['table_name'].iloc[0]
+            entry['timings']['load'] = time.time() - step_start
+
+            step_start = time.time()
+            step = 'validate'
+            table_name = entry['table_name']
+            results = self.service.validate(
+                data, snapshot=self._get_snapshot(table_name),
+                structured=True)
+            self._put_snapshot(table_name, data, results)
+            results = [result.to_dict() for result in results]
+            entry['timings']['validate'] = time.time() - step_start
+            entry['errors'] = sum(len(r['errors']) for r in results)
+            entry['warnings'] = sum(len(r['warnings']) for r in results)
+            entry['results'] = results
+            entry['status'] = 'invalid' if entry['errors'] > 0 else 'valid'
+
+            if self.db_codec is not None and entry['status'] == 'valid':
+                step_start = time.time()
+                step = 'store'
+                self._store(data)
+                entry['timings']['store'] = time.time() - step_start
+                entry['status'] = 'stored'
+        except Exception as e:
+            logger.exception('Error processing {}'.format(path))
+            entry['status'] = 'failed'
+            entry['error'] = '{} ({}): {}'.format(
+                e.__class__.__name__, step, e)
+        self._write_journal(entry)
+        return entry
+
+    def _store(self, data):
+        # Run by the codec's worker threads, which keep their connections
+        future = self.db_codec.executor.submit(self.db_codec.store, data,
+                                               **self.store_params)
+        return future.result()
+
+    def _get_snapshot(self, table_name):
+        with self._snapshots_lock:
+            snapshot = self._snapshots.get(table_name)
+            if snapshot is not None:
+                self._snapshots.move_to_end(table_name)
+            return snapshot
+
+    def _put_snapshot(self, table_name, data, results):
+        if self.snapshots <= 0:
+            return
+        snapshot = ValidationSnapshot.from_data(data, results)
+        with self._snapshots_lock:
+            self._snapshots[table_name] = snapshot
+            self._snapshots.move_to_end(table_name)
+            while len(self._snapshots) > self.snapshots:
+                self._snapshots.popitem(last=False)
+
+    def _work(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                break
+            self.process(path)
+
+    def _check_pending(self):
+        now = time.time()
+        for path, (signature, stable_since) in list(self._pending.items()):
+            current = self._signature(path)
+            if current is None:
+                # Deleted or moved away, processed again if it comes back
+                del self._pending[path]
+                self._processed.pop(path, None)
+            elif current != signature:
+                self._pending[path] = (current, now)
+            elif now - stable_since >= self.settle_seconds:
+                del self._pending[path]
+                if self._processed.get(path) != current:
+                    self._processed[path] = current
+                    self._queue.put(path)
+
+    def _scan(self):
+        return [entry.path for entry in os.scandir(self.directory)
+                if entry.is_file() and self._matches(entry.path)]
+
+    def _matches(self, path):
+        name = os.path.basename(path)
+        # Lock files of open workbooks (e.g. ~$file.xlsx)
+        if name.startswith(('~$', '.')):
+            return False
+        return any(fnmatch.fnmatch(name, pattern)
+                   for pattern in self.patterns)
+
+    def _signature(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime)
+
+    def _create_inotify(self):
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            return None
+        inotify = INotify()
+        inotify.add_watch(self.directory,
+                          flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE |
+                          flags.DELETE | flags.MOVED_FROM)
+        return inotify
+
+    def _write_journal(self, entry):
+        logger.info('{}: {}'.format(entry['file'], entry['status']))
+        if self.journal is None:
+            return
+        with self._journal_lock:
+            with open(self.journal, 'a') as journal:
+                journal.write(json.dumps(entry, default=str) + '\n')
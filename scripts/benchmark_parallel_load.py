@@ -0,0 +1,84 @@
+""" benchmark_parallel_load.py
+
+Measures the insert throughput of the MySQL parallel loader with different
+numbers of connections, using a synthetic table on a local (test) server.
+
+    python scripts/benchmark_parallel_load.py --host localhost --db test \
+        --user root --password secret --rows 200000 --connections 1 2 4 8
+
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from infocentre_data_manager.plugins.codecs.mysql import MySQLCodec
+from infocentre_data_manager.plugins.codecs.mysql_loader import \
+    ParallelLoader
+
+TABLE_NAME = 'benchmark_parallel_load'
+
+
+def synthetic_data(n_rows, n_columns):
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame({
+        'c{}'.format(i): rng.randint(0, 10 ** 6, n_rows).astype(str)
+        for i in range(n_columns)
+    })
+    df.insert(0, 'id', np.arange(1, n_rows + 1))
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--password', default='')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--columns', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--connections', type=int, nargs='+',
+                        default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    codec = MySQLCodec()
+    conn_params = {'host': args.host, 'db': args.db,
+                   'user': args.user, 'password': args.password}
+    df = synthetic_data(args.rows, args.columns)
+    conn = codec._connect(**conn_params)
+    with conn.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS {}'.format(TABLE_NAME))
+        cursor.execute('CREATE TABLE {} (id INT PRIMARY KEY, {}) '
+                       'ENGINE=InnoDB DEFAULT CHARSET=utf8'.format(
+                           TABLE_NAME,
+                           ', '.join('`{}` VARCHAR(16)'.format(col)
+                                     for col in df.columns[1:])))
+
+    print('{} rows x {} columns'.format(args.rows, args.columns))
+    baseline = None
+    for n_connections in args.connections:
+        with conn.cursor() as cursor:
+            cursor.execute('TRUNCATE TABLE {}'.format(TABLE_NAME))
+        loader = ParallelLoader(codec, conn_params,
+                                n_connections=n_connections,
+                                batch_size=args.batch_size)
+        start = time.perf_counter()
+        loader.load(TABLE_NAME, df)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print('{:>3} connection(s): {:8.2f}s {:>10.0f} rows/s '
+              '(x{:.2f})'.format(n_connections, elapsed,
+                                 args.rows / elapsed, baseline / elapsed))
+
+    with conn.cursor() as cursor:
+        cursor.execute('DROP TABLE {}'.format(TABLE_NAME))
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+""" check_import_time.py
+
+Startup time regression check: runs a trivial command line command with
+``python -X importtime`` and fails if it imports any heavy dependency or if
+the total import time exceeds the budget.
+
+    python scripts/check_import_time.py --budget-ms 150
+
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Modules that only the plugins that need them should import
+HEAVY_MODULES = ['pandas', 'numpy', 'pymysql', 'xlsxwriter', 'joblib',
+                 'openpyxl', 'pkg_resources']
+DEFAULT_COMMAND = ['-m', 'infocentre_data_manager', 'list-plugins']
+
+
+def import_times(command):
+    """
+    :returns: Dictionary with elements {module: cumulative microseconds} for
+        the top level imports of the command
+    :rtype: dict
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + command,
+                             cwd=BASE_DIR,
+                             stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE,
+                             universal_newlines=True,
+                             check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        times[module.strip()] = (int(cumulative),
+                                 len(module) - len(module.lstrip()))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--budget-ms', type=float, default=150,
+                        help='Maximum import time of the package and the '
+                             'command line interface')
+    args = parser.parse_args()
+
+    times = import_times(DEFAULT_COMMAND)
+    failed = False
+
+    heavy = sorted(module for module in times
+                   if module.split('.')[0] in HEAVY_MODULES)
+    if heavy:
+        failed = True
+        print('Heavy modules imported at startup: {}'.format(
+            ', '.join(heavy)))
+
+    package_us = sum(cumulative
+                     for module, (cumulative, indent) in times.items()
+                     if module.startswith('infocentre_data_manager') and
+                     indent == 1)
+    print('infocentre_data_manager import time: {:.1f}ms '
+          '(budget {:.1f}ms)'.format(package_us / 1000, args.budget_ms))
+    if package_us / 1000 > args.budget_ms:
+        failed = True
+        print('Import time budget exceeded')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -45,17 +45,26 @@ setup(
         'sphinxcontrib-websupport>=1.0.1'
     ],
     entry_points={
+        'console_scripts': [
+            'infocentre-data-manager=infocentre_data_manager.cli:main',
+        ],
         'data_manager.codecs': [
             'excel=infocentre_data_manager.plugins.codecs.excel:ExcelCodec',
             'old_excel=infocentre_data_manager.plugins.codecs.old_excel:OldExcelCodec',
             'mysql=infocentre_data_manager.plugins.codecs.mysql:MySQLCodec',
+            'async_mysql=infocentre_data_manager.plugins.codecs.async_mysql:AsyncMySQLCodec',
             'pickle=infocentre_data_manager.plugins.codecs.pickle:PickleCodec',
+            'sqlite=infocentre_data_manager.plugins.codecs.sqlite:SQLiteCodec',
+            'duckdb=infocentre_data_manager.plugins.codecs.duckdb:DuckDBCodec',
         ],
         'data_manager.data_validators': [
             'null=infocentre_data_manager.plugins.data_validators.null:NullValidator',
             'basic=infocentre_data_manager.plugins.data_validators.basic:BasicValidator',
             'type=infocentre_data_manager.plugins.data_validators.type:TypeValidator',
             'missing_values=infocentre_data_manager.plugins.data_validators.missing_values:MissingValuesValidator',
+            'references=infocentre_data_manager.plugins.data_validators.references:ReferenceValidator',
+            'primary_key=infocentre_data_manager.plugins.data_validators.primary_key:PrimaryKeyValidator',
+            'naming=infocentre_data_manager.plugins.data_validators.naming:NamingValidator',
         ],
         'data_manager.semantic_types': [
             'integer=infocentre_data_manager.plugins.semantic_types.integer:IntegerType',
@@ -0,0 +1,84 @@
+""" data.py
+
+This module includes the sample data tables used by the tests.
+
+"""
+
+import pandas as pd
+from infocentre_data_manager.plugins.data_validators.base import \
+    DataValidator
+from infocentre_data_manager.plugins.semantic_types.iso import IsoType
+
+__all__ = ['make_data', 'make_validators', ]
+
+ISO_CODES = ['ESP', 'FRA', 'ITA', 'PRT']
+
+
+def make_data(n_rows=20, table_name='hpv_m1_test'):
+    """
+    :param int n_rows: Number of rows of the data
+    :param str table_name: Name of the table
+    :returns: Data structure with HPV Information Centre format
+    :rtype: dict
+    """
+    def references(value):
+        return pd.DataFrame({
+            'iso': ['ESP', 'FRA'],
+            'strata_variable': ['-9999', 'sex'],
+            'strata_value': ['-9999', 'F'],
+            'applyto_variable': ['-9999', 'value'],
+            'value': ['{} a'.format(value), '{} b'.format(value)],
+        })
+
+    return {
+        'general': pd.DataFrame({
+            'table_name': [table_name],
+            'contents': ['Test table'],
+            'data_manager': ['Test'],
+            'comments': [''],
+        }),
+        'variables': pd.DataFrame({
+            'variable': ['id', 'iso', 'sex', 'value'],
+            'type': ['integer', 'iso', 'string', 'integer'],
+            'description': ['Row id', 'Country', 'Sex', 'Value'],
+        }),
+        'data': pd.DataFrame({
+            'id': list(range(1, n_rows + 1)),
+            'iso': [['ESP', 'FRA'][i % 2] for i in range(n_rows)],
+            'sex': [['F', 'M'][i % 2] for i in range(n_rows)],
+            'value': [str(i) for i in range(n_rows)],
+        }),
+        'sources': references('Source'),
+        'notes': references('Note'),
+        'methods': references('Method'),
+        'years': references('Year'),
+        'dates': pd.DataFrame({
+            'iso': ['-99'],
+            'strata_variable': ['-9999'],
+            'strata_value': ['-9999'],
+            'applyto_variable': ['-9999'],
+            'date_accessed': ['2018-01-01'],
+            'date_closing': ['2018-01-01'],
+            'date_published': ['-9999'],
+            'date_delivery': ['2018-02-01'],
+        }),
+    }
+
+
+def make_validators(names=('basic', 'type', 'missing_values',
+                           'primary_key')):
+    """
+    :param tuple names: Names of the validators
+    :returns: Validators, with the ISO codes of the semantic type validator
+        set instead of loaded from the database
+    :rtype: list
+    """
+    iso_type = IsoType.__new__(IsoType)
+    iso_type.available_isos = set(ISO_CODES)
+    iso_type._suggestion_index = None
+
+    validators = [DataValidator.get(name) for name in names]
+    for validator in validators:
+        if hasattr(validator, '_semantic_types'):
+            validator._semantic_types['iso'] = iso_type
+    return validators
@@ -0,0 +1,254 @@
+""" test_async_mysql.py
+
+This module includes the tests of the asyncio interface for the MySQL codec,
+with SQLite standing in for the MySQL server.
+
+"""
+
+import asyncio
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from infocentre_data_manager.plugins.codecs.async_mysql import \
+    AsyncMySQLCodec
+from infocentre_data_manager.plugins.codecs.mysql import MySQLCodec
+from infocentre_data_manager.plugins.codecs.sqlite import SQLiteCodec
+from test.data import make_data
+
+CONN_PARAMS = {'host': 'localhost', 'db': 'test', 'user': 'test',
+               'password': 'test'}
+
+
+class SQLiteCursor(object):
+    """
+    Cursor with the pymysql interface used by the codec and its loaders
+    (dictionary rows, %s placeholders), translating the MySQL statements
+    that SQLite doesn't understand.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursor = conn._conn.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+
+    def execute(self, sql, params=()):
+        match = re.match(r'SET SESSION (\w+) = %s', sql)
+        if match is not None:
+            self._conn.session[match.group(1)] = params[0]
+            return
+        self._cursor.execute(self._translate(sql), params)
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(self._translate(sql), rows)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in self._cursor.description],
+                        row))
+
+    def _translate(self, sql):
+        sql = sql.replace('%s', '?')
+        sql = sql.replace('SHOW TABLES LIKE',
+                          "SELECT name FROM sqlite_master "
+                          "WHERE type = 'table' AND name LIKE")
+        for clause in [' ENGINE=InnoDB', ' FOR UPDATE',
+                       ' ON UPDATE CURRENT_TIMESTAMP']:
+            sql = sql.replace(clause, '')
+        return sql
+
+
+class SQLiteConnection(object):
+    """ SQLite connection with the pymysql methods used by the codec. """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self.open = True
+        self.n_pings = 0
+        # Session variables that have been set
+        self.session = {}
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def ping(self, reconnect=True):
+        self.n_pings += 1
+        if not self.open:
+            raise sqlite3.ProgrammingError('Connection closed')
+
+    def execute(self, sql):
+        return self._conn.execute(sql).fetchall()
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self.open = False
+        self._conn.close()
+
+
+class SQLiteAsyncCodec(AsyncMySQLCodec):
+    """
+    Asynchronous codec that loads and stores tables with SQLite, one
+    database file per table (SQLite allows a single writer per file).
+    """
+
+    def __init__(self, directory, pool_size=None):
+        super().__init__(pool_size)
+        self.directory = directory
+        self.sqlite = SQLiteCodec()
+
+    def load(self, lazy=True, **kwargs):
+        return self.sqlite.load(file=self._path(kwargs['table']),
+                                table=kwargs['table'], lazy=lazy)
+
+    def store(self, data, **kwargs):
+        table_name = data['general']['table_name'].iloc[0]
+        self.sqlite.store(data, file=self._path(table_name))
+
+    def _path(self, table_name):
+        return os.path.join(self.directory, table_name + '.sqlite')
+
+
+class AsyncMySQLCodecTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.sqlite')
+        self.connections = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def connect(self, **conn_params):
+        conn = SQLiteConnection(self.path)
+        self.connections.append(conn)
+        return conn
+
+    def test_store_and_load_many(self):
+        codec = SQLiteAsyncCodec(self.directory, pool_size=2)
+        datasets = [make_data(10, 'hpv_m1_test{}'.format(i))
+                    for i in range(4)]
+        try:
+            asyncio.run(codec.store_many(datasets))
+            tables = asyncio.run(codec.load_many(
+                ['hpv_m1_test{}'.format(i) for i in range(4)]))
+        finally:
+            codec.close()
+        self.assertEqual(sorted(tables), ['hpv_m1_test{}'.format(i)
+                                          for i in range(4)])
+        for i, data in enumerate(datasets):
+            loaded = tables['hpv_m1_test{}'.format(i)]
+            self.assertEqual(loaded['general']['table_name'].iloc[0],
+                             'hpv_m1_test{}'.format(i))
+            self.assertEqual(list(loaded['data']['id']),
+                             list(data['data']['id']))
+
+    def test_worker_connections_are_reused(self):
+        codec = AsyncMySQLCodec(pool_size=2)
+        used = []
+
+        def operation():
+            conn = codec._connect(**CONN_PARAMS)
+            try:
+                used.append((threading.get_ident(), conn._conn))
+                conn.execute('SELECT 1')
+            finally:
+                conn.close()
+
+        async def run_many():
+            await asyncio.gather(*[codec._run(operation)
+                                   for _ in range(20)])
+
+        with mock.patch.object(MySQLCodec, '_connect', self.connect):
+            asyncio.run(run_many())
+            # One connection per worker thread
+            self.assertLessEqual(len(self.connections), 2)
+            for thread, conn in used:
+                self.assertIs(conn, dict(used)[thread])
+            self.assertTrue(all(conn.open for conn in self.connections))
+            codec.close()
+        self.assertFalse(any(conn.open for conn in self.connections))
+
+    def test_lost_connections_are_replaced(self):
+        codec = AsyncMySQLCodec(pool_size=1)
+
+        def operation():
+            conn = codec._connect(**CONN_PARAMS)
+            conn.close()
+            return conn._conn
+
+        with mock.patch.object(MySQLCodec, '_connect', self.connect):
+            first = asyncio.run(codec._run(operation))
+            first.close()  # e.g. the server closed it
+            second = asyncio.run(codec._run(operation))
+            codec.close()
+        self.assertIsNot(first, second)
+        self.assertEqual(len(self.connections), 2)
+
+    def test_nested_connections_are_not_shared(self):
+        codec = AsyncMySQLCodec(pool_size=1)
+
+        def operation():
+            conn = codec._connect(**CONN_PARAMS)
+            nested = codec._connect(**CONN_PARAMS)
+            try:
+                return conn._conn is not nested
+            finally:
+                nested.close()
+                conn.close()
+
+        with mock.patch.object(MySQLCodec, '_connect', self.connect):
+            self.assertTrue(asyncio.run(codec._run(operation)))
+            codec.close()
+        # The nested connection was opened and closed as usual
+        self.assertEqual(len(self.connections), 2)
+        self.assertFalse(any(conn.open for conn in self.connections))
+
+    def test_failed_stores_release_their_connections(self):
+        codec = AsyncMySQLCodec(pool_size=1)
+        data = make_data(10)
+        store_data = mock.Mock(side_effect=[RuntimeError('Lost row'), None])
+
+        with mock.patch.object(MySQLCodec, '_connect', self.connect), \
+                mock.patch.object(MySQLCodec, '_store_data', store_data), \
+                mock.patch('infocentre_data_manager.plugins.codecs.mysql.'
+                           'bump_version'):
+            with self.assertRaises(RuntimeError):
+                asyncio.run(codec._run(codec.store, data, **CONN_PARAMS))
+            asyncio.run(codec._run(codec.store, data, **CONN_PARAMS))
+            codec.close()
+        self.assertEqual(store_data.call_count, 2)
+        # The second store reused the connection of the failed one
+        self.assertEqual(len(self.connections), 1)
+        self.assertIs(store_data.call_args_list[0][0][0]._conn,
+                      store_data.call_args_list[1][0][0]._conn)
+
+    def test_synchronous_calls_use_their_own_connections(self):
+        codec = AsyncMySQLCodec()
+        with mock.patch.object(MySQLCodec, '_connect', self.connect):
+            conn = codec._connect(**CONN_PARAMS)
+        self.assertIsInstance(conn, SQLiteConnection)
+        conn.close()
+
+    def test_unknown_parameters(self):
+        with self.assertRaises(TypeError):
+            AsyncMySQLCodec(pool_sise=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
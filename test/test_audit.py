@@ -0,0 +1,199 @@
+""" test_audit.py
+
+This module includes the tests of the consistency checks of the database
+audit, run over hand-built metadata.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from infocentre_data_manager.audit import AUDIT_CHECKS, audit_metadata, \
+    load_metadata, save_metadata
+
+
+def make_metadata():
+    """ Metadata of a consistent database with two data tables. """
+    tables = ['hpv_m1_a', 'hpv_m2_b']
+    return {
+        'tables': pd.DataFrame({'table_name': tables,
+                                'module': [1, 2],
+                                'data_manager': ['Ann', 'Bob']}),
+        'variables': pd.DataFrame({
+            'data_table': ['hpv_m1_a'] * 3 + ['hpv_m2_b'] * 2,
+            'name': ['id', 'iso', 'value', 'id', 'iso'],
+            'semantic_type': ['integer', 'iso', 'integer', 'integer',
+                              'iso'],
+        }),
+        'columns': pd.DataFrame({
+            'table_name': ['hpv_m1_a'] * 3 + ['hpv_m2_b'] * 2 +
+                          ['info_tables'],
+            'column_name': ['id', 'iso', 'value', 'id', 'iso',
+                            'table_name'],
+        }),
+        'refs': pd.DataFrame({
+            'ref_table': ['ref_sources_by', 'ref_notes_by'],
+            'data_table': tables,
+            'n_rows': [2, 1],
+        }),
+        'regions': pd.DataFrame({'iso': ['ESP', 'FRA', 'ITA', 'PRT']}),
+        'isos': pd.DataFrame({
+            'data_table': ['hpv_m1_a', 'hpv_m1_a', 'hpv_m2_b', 'hpv_m2_b'],
+            'iso': ['ESP', 'FRA', 'ESP', '-9999'],
+            'n_rows': [10, 10, 5, 1],
+        }),
+        'failed': pd.DataFrame(columns=['data_table', 'error']),
+    }
+
+
+def add_rows(metadata, key, **columns):
+    metadata[key] = pd.concat([metadata[key], pd.DataFrame(columns)],
+                              ignore_index=True)
+
+
+class AuditTest(unittest.TestCase):
+
+    def setUp(self):
+        self.metadata = make_metadata()
+
+    def audit(self, checks=None):
+        return audit_metadata(self.metadata, checks)
+
+    def issues(self, result, code=None):
+        issues = result.issues
+        if code is not None:
+            issues = issues[issues['code'] == code]
+        return issues
+
+    def test_consistent_database(self):
+        result = self.audit()
+        self.assertEqual(result.count('error'), 0)
+        self.assertEqual(result.count('warning'), 0)
+        self.assertEqual(result.to_dict()['info'], ['No problems found.'])
+
+    def test_missing_tables(self):
+        add_rows(self.metadata, 'tables', table_name=['hpv_m3_c'],
+                 module=[3], data_manager=['Ann'])
+        missing = self.issues(self.audit(['tables']), 'missing_table')
+        self.assertEqual(list(missing['value']), ['hpv_m3_c'])
+        self.assertEqual(list(missing['sheet']), ['info_tables'])
+
+    def test_orphaned_rows(self):
+        add_rows(self.metadata, 'variables', data_table=['hpv_old'] * 2,
+                 name=['id', 'iso'], semantic_type=['integer', 'iso'])
+        add_rows(self.metadata, 'refs', ref_table=['ref_dates_by'],
+                 data_table=['hpv_old'], n_rows=[3])
+        orphaned = self.issues(self.audit(['orphaned_rows']),
+                               'orphaned_rows')
+        self.assertEqual(list(orphaned['sheet']),
+                         ['info_vars', 'ref_dates_by'])
+        self.assertEqual(list(orphaned['message']), [
+            '2 rows of info_vars refer to the table "hpv_old", which is '
+            'not in info_tables.',
+            '3 rows of ref_dates_by refer to the table "hpv_old", which is '
+            'not in info_tables.',
+        ])
+
+    def test_variables_not_in_the_table(self):
+        add_rows(self.metadata, 'variables', data_table=['hpv_m2_b'],
+                 name=['sex'], semantic_type=['string'])
+        result = self.audit(['variables'])
+        issues = self.issues(result, 'variable_not_in_table')
+        self.assertEqual(list(zip(issues['sheet'], issues['column'])),
+                         [('hpv_m2_b', 'sex')])
+        self.assertEqual(len(self.issues(result)), 1)
+
+    def test_columns_not_in_variables(self):
+        add_rows(self.metadata, 'columns', table_name=['hpv_m1_a'],
+                 column_name=['sex'])
+        # Columns of tables that are not data tables are ignored
+        add_rows(self.metadata, 'columns', table_name=['dict_regions'],
+                 column_name=['iso3Code'])
+        result = self.audit(['variables'])
+        issues = self.issues(result, 'column_not_in_variables')
+        self.assertEqual(list(zip(issues['sheet'], issues['column'])),
+                         [('hpv_m1_a', 'sex')])
+        self.assertEqual(len(self.issues(result)), 1)
+
+    def test_duplicated_variables(self):
+        add_rows(self.metadata, 'variables', data_table=['hpv_m1_a'] * 2,
+                 name=['iso'] * 2, semantic_type=['iso'] * 2)
+        result = self.audit(['variables'])
+        issues = self.issues(result, 'duplicate_variable')
+        self.assertEqual(list(zip(issues['sheet'], issues['column'])),
+                         [('hpv_m1_a', 'iso')])
+        # The repeated rows are not reported as missing columns too
+        self.assertEqual(len(self.issues(result)), 1)
+
+    def test_variables_of_missing_tables_are_not_compared(self):
+        add_rows(self.metadata, 'tables', table_name=['hpv_m3_c'],
+                 module=[3], data_manager=['Ann'])
+        add_rows(self.metadata, 'variables', data_table=['hpv_m3_c'],
+                 name=['id'], semantic_type=['integer'])
+        result = self.audit(['tables', 'variables'])
+        self.assertEqual(list(self.issues(result)['code']),
+                         ['missing_table'])
+
+    def test_iso_variants(self):
+        add_rows(self.metadata, 'isos', data_table=['hpv_m2_b'],
+                 iso=['esp'], n_rows=[2])
+        variants = self.issues(self.audit(['isos']), 'iso_variants')
+        self.assertEqual(list(variants['value']), ['ESP'])
+        self.assertEqual(
+            variants['message'].iloc[0],
+            'The iso "ESP" is written in different ways: "ESP" (in '
+            'hpv_m1_a, hpv_m2_b, modules 1, 2), "esp" (in hpv_m2_b, '
+            'module 2).')
+
+    def test_unknown_isos_with_suggestions(self):
+        add_rows(self.metadata, 'isos', data_table=['hpv_m1_a'] * 2,
+                 iso=['ESQ', 'XYZW'], n_rows=[1, 1])
+        unknown = self.issues(self.audit(['isos']), 'unknown_iso')
+        self.assertEqual(list(unknown['value']), ['ESQ', 'XYZW'])
+        self.assertEqual(list(unknown['suggestion']), ['ESP', None])
+        self.assertEqual(unknown['message'].iloc[0],
+                         'The iso "ESQ" (in hpv_m1_a, module 1) is not in '
+                         'dict_regions. Did you mean "ESP"?')
+
+    def test_missing_isos_are_ignored(self):
+        add_rows(self.metadata, 'isos', data_table=['hpv_m1_a'] * 3,
+                 iso=['', '-6666', None], n_rows=[1, 1, 1])
+        self.assertEqual(self.audit(['isos']).count(), 1)  # No problems
+
+    def test_many_tables_are_counted(self):
+        for i in range(6):
+            add_rows(self.metadata, 'isos',
+                     data_table=['hpv_m1_t{}'.format(i)], iso=['XXX'],
+                     n_rows=[1])
+        unknown = self.issues(self.audit(['isos']), 'unknown_iso')
+        self.assertIn('(in 6 tables)', unknown['message'].iloc[0])
+
+    def test_tables_not_read(self):
+        add_rows(self.metadata, 'failed', data_table=['hpv_m1_a'],
+                 error=['OperationalError: Lost connection'])
+        issues = self.issues(self.audit([]), 'table_not_read')
+        self.assertEqual(list(issues['sheet']), ['hpv_m1_a'])
+
+    def test_checks(self):
+        self.assertEqual(list(AUDIT_CHECKS),
+                         ['tables', 'orphaned_rows', 'variables', 'isos'])
+        with self.assertRaises(ValueError):
+            self.audit(['tables', 'regions'])
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'metadata.pkl')
+            save_metadata(self.metadata, path)
+            loaded = load_metadata(path)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(sorted(loaded), sorted(self.metadata))
+        self.assertEqual(audit_metadata(loaded).to_dict(),
+                         self.audit().to_dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+""" test_catalog.py
+
+This module includes the tests of the local catalog of tables and
+variables.
+
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+from infocentre_data_manager.catalog import Catalog
+from infocentre_data_manager.plugins.codecs.base import Codec
+from test.data import make_data
+
+DB_PARAMS = {'host': 'localhost', 'db': 'test', 'user': 'test',
+             'password': 'test'}
+
+
+def make_table(table_name, variables, data_manager='Test'):
+    """ Table with an id and the variables of *variables*, a list of
+    (name, type). """
+    data = make_data(5, table_name)
+    names = ['id'] + [name for name, _ in variables]
+    data['variables'] = pd.DataFrame({
+        'variable': names,
+        'type': ['integer'] + [t for _, t in variables],
+        'description': names,
+    })
+    data['data'] = data['data'].iloc[:, :len(names)]
+    data['data'].columns = names
+    data['general']['data_manager'] = data_manager
+    return data
+
+
+class FakeDatabase(object):
+    """ Answers the catalog queries from dataframes. """
+
+    def __init__(self):
+        self.tables = pd.DataFrame({
+            'table_name': ['hpv_m1_a', 'hpv_m2_b'],
+            'module': [1, 2],
+            'data_manager': ['Ann', 'Bob'],
+            'contents': ['A', 'B'],
+        })
+        self.versions = pd.DataFrame({'table_name': ['hpv_m1_a'],
+                                      'version': [1]})
+        self.update_times = pd.DataFrame({
+            'table_name': ['hpv_m1_a', 'hpv_m2_b'],
+            'update_time': [datetime.datetime(2024, 1, 1)] * 2,
+        })
+        self.variables = pd.DataFrame({
+            'data_table': ['hpv_m1_a', 'hpv_m1_a', 'hpv_m2_b'],
+            'name': ['iso', 'age_group', 'iso'],
+            'semantic_type': ['iso', 'string', 'iso'],
+        })
+        self.queried = []
+
+    def read_sql(self, sql, con=None, params=None):
+        if 'FROM info_tables' in sql:
+            return self.tables
+        if 'data_manager_versions' in sql:
+            return self.versions
+        if 'information_schema' in sql:
+            return self.update_times
+        tables = params or list(self.tables['table_name'])
+        self.queried.extend(tables)
+        if 'FROM info_vars' in sql:
+            return self.variables[self.variables['data_table'].isin(tables)]
+        return pd.DataFrame({'data_table': tables,
+                             'date_delivery': ['2024-01-01'] * len(tables),
+                             'date_published': [None] * len(tables)})
+
+
+class CatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.codec = Codec.get('excel')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def store(self, data):
+        path = os.path.join(
+            self.directory,
+            data['general']['table_name'].iloc[0] + '.xlsx')
+        self.codec.store(data, file=path)
+        return path
+
+    def test_update_from_directory(self):
+        self.store(make_table('hpv_m1_a', [('iso', 'iso'),
+                                           ('age_group', 'string')]))
+        self.store(make_table('hpv_m2_b', [('iso', 'iso'),
+                                           ('AgeGroup', 'integer')],
+                              data_manager='Other'))
+        catalog = Catalog()
+        self.assertEqual(catalog.update_from_directory(self.directory),
+                         (2, 0))
+        self.assertEqual(catalog.table_names(), ['hpv_m1_a', 'hpv_m2_b'])
+        self.assertEqual(catalog.table('hpv_m2_b')['module'], 2)
+        self.assertEqual(catalog.table('hpv_m1_a')['last_date'],
+                         '2018-02-01')
+        self.assertEqual(catalog.tables_with_variable('iso'),
+                         ('hpv_m1_a', 'hpv_m2_b'))
+        self.assertEqual(catalog.tables_with_type('integer'),
+                         ('hpv_m1_a', 'hpv_m2_b'))
+        self.assertEqual(catalog.tables_of_data_manager(' other'),
+                         ('hpv_m2_b', ))
+        self.assertEqual(catalog.variable_types('age_group'),
+                         {'string': ('hpv_m1_a', )})
+        self.assertEqual(catalog.variable_spellings('age-group'),
+                         {'AgeGroup': ('hpv_m2_b', ),
+                          'age_group': ('hpv_m1_a', )})
+
+    def test_only_changed_workbooks_are_read(self):
+        path = self.store(make_table('hpv_m1_a', [('iso', 'iso')]))
+        self.store(make_table('hpv_m2_b', [('iso', 'iso')]))
+        catalog = Catalog()
+        catalog.update_from_directory(self.directory)
+        self.assertEqual(catalog.update_from_directory(self.directory),
+                         (0, 0))
+        os.remove(path)
+        self.assertEqual(catalog.update_from_directory(self.directory),
+                         (0, 1))
+        self.assertEqual(catalog.table_names(), ['hpv_m2_b'])
+
+    def test_save_and_load(self):
+        self.store(make_table('hpv_m1_a', [('iso', 'iso')]))
+        path = os.path.join(self.directory, 'catalog', 'catalog.json')
+        catalog = Catalog(path)
+        catalog.update_from_directory(self.directory)
+        catalog.save()
+        loaded = Catalog(path)
+        self.assertEqual(loaded.table('hpv_m1_a'),
+                         catalog.table('hpv_m1_a'))
+        self.assertEqual(loaded.update_from_directory(self.directory),
+                         (0, 0))
+
+    def test_update_from_database(self):
+        database = FakeDatabase()
+        catalog = Catalog()
+        with mock.patch('infocentre_data_manager.catalog._connect'), \
+                mock.patch('pandas.read_sql', database.read_sql):
+            self.assertEqual(catalog.update_from_database(DB_PARAMS), (2, 0))
+            self.assertEqual(catalog.table('hpv_m1_a')['variables'],
+                             [['iso', 'iso'], ['age_group', 'string']])
+            self.assertEqual(catalog.table('hpv_m2_b')['data_manager'],
+                             'Bob')
+            self.assertEqual(catalog.update_from_database(DB_PARAMS), (0, 0))
+
+            # A new version of the versioned table
+            database.versions['version'] = 2
+            database.queried = []
+            self.assertEqual(catalog.update_from_database(DB_PARAMS), (1, 0))
+            self.assertEqual(database.queried, ['hpv_m1_a'] * 2)
+
+    def test_tables_without_version_use_the_update_time(self):
+        database = FakeDatabase()
+        catalog = Catalog()
+        with mock.patch('infocentre_data_manager.catalog._connect'), \
+                mock.patch('pandas.read_sql', database.read_sql):
+            catalog.update_from_database(DB_PARAMS)
+            database.update_times.loc[1, 'update_time'] = \
+                datetime.datetime(2024, 2, 1)
+            database.variables.loc[2, 'semantic_type'] = 'string'
+            database.queried = []
+            self.assertEqual(catalog.update_from_database(DB_PARAMS), (1, 0))
+            self.assertEqual(database.queried, ['hpv_m2_b'] * 2)
+            self.assertEqual(catalog.variable_types('iso'),
+                             {'iso': ('hpv_m1_a', ),
+                              'string': ('hpv_m2_b', )})
+
+
+if __name__ == '__main__':
+    unittest.main()
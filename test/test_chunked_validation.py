@@ -0,0 +1,117 @@
+""" test_chunked_validation.py
+
+This module includes the tests of the validation of DATA sheets read in
+chunks, which must give the same results as validating the whole sheet.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from infocentre_data_manager.plugins.codecs.base import Codec
+from infocentre_data_manager.plugins.data_validators.base import \
+    DataValidator
+from test.data import make_data, make_validators
+
+
+def invalid_data(invalid_ids=True):
+    data = make_data(100)
+    df = data['data']
+    df.loc[3, 'iso'] = 'XXX'
+    df.loc[50, 'iso'] = 'esp'
+    df.loc[[4, 60], 'value'] = ['abc', '1.5']
+    df.loc[[5, 99], 'sex'] = ''
+    df.loc[7, 'id'] = 3
+    if invalid_ids:
+        df['id'] = df['id'].astype(object)
+        df.loc[8, 'id'] = 'x'
+    df.loc[90, ['iso', 'sex', 'value']] = df.loc[10, ['iso', 'sex', 'value']]
+    return data
+
+
+def chunks(df, chunk_size):
+    return [df.iloc[i:i + chunk_size]
+            for i in range(0, len(df.index), chunk_size)]
+
+
+class ChunkedValidationTest(unittest.TestCase):
+
+    def assertSameResults(self, chunked, full):
+        self.assertEqual([result.to_dict() for result in chunked],
+                         [result.to_dict() for result in full])
+        for chunked_result, full_result in zip(chunked, full):
+            pd.testing.assert_frame_equal(
+                chunked_result.issues.astype(str),
+                full_result.issues.astype(str))
+
+    def test_same_results(self):
+        data = invalid_data()
+        validators = make_validators()
+        full = DataValidator.apply(data, validators, structured=True)
+        for chunk_size in [1, 7, 50, 1000]:
+            with self.subTest(chunk_size=chunk_size):
+                chunked = DataValidator.apply_chunked(
+                    data, chunks(data['data'], chunk_size), validators,
+                    structured=True)
+                self.assertSameResults(chunked, full)
+
+    def test_same_results_in_parallel(self):
+        data = invalid_data()
+        validators = make_validators()
+        full = DataValidator.apply(data, validators, structured=True)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            chunked = DataValidator.apply_chunked(
+                data, chunks(data['data'], 9), validators, structured=True,
+                executor=executor, max_pending=2)
+        self.assertSameResults(chunked, full)
+
+    def test_valid_data(self):
+        data = make_data(100)
+        validators = make_validators()
+        chunked = DataValidator.apply_chunked(data, chunks(data['data'], 30),
+                                              validators)
+        self.assertEqual(chunked, DataValidator.apply(data, validators))
+        self.assertEqual(sum(len(result['errors']) for result in chunked),
+                         0)
+
+    def test_chunk_dtypes(self):
+        # e.g. MySQL pages where a missing value turns an integer column
+        # into floats
+        data = make_data(10)
+        df = data['data']
+        df['value'] = '5'
+        df.loc[9, 'value'] = ''
+        typed = [df.iloc[:5].astype({'value': int}),
+                 df.iloc[5:].replace({'value': {'': np.nan}}).astype(
+                     {'value': float})]
+        validators = make_validators(['primary_key'])
+        full = DataValidator.apply(data, validators, structured=True)
+        chunked = DataValidator.apply_chunked(data, typed, validators,
+                                              structured=True)
+        self.assertSameResults(chunked, full)
+        self.assertIn('duplicate the values', full[0].to_dict()['warnings'][0])
+
+    def test_excel_chunks(self):
+        data = invalid_data()
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'test.xlsx')
+            codec = Codec.get('excel')
+            codec.store(data, file=path)
+            loaded = codec.load(file=path)
+            validators = make_validators()
+            full = DataValidator.apply(loaded, validators, structured=True)
+            chunked = DataValidator.apply_chunked(
+                loaded, codec.load_chunks(file=path, chunk_size=16),
+                validators, structured=True)
+        finally:
+            shutil.rmtree(directory)
+        self.assertSameResults(chunked, full)
+
+
+if __name__ == '__main__':
+    unittest.main()
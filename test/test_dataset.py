@@ -0,0 +1,106 @@
+""" test_dataset.py
+
+This module includes the tests of the lazy container returned by the
+codecs.
+
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from infocentre_data_manager.dataset import Dataset
+from infocentre_data_manager.plugins.codecs.base import Codec
+from test.data import make_data
+
+
+class DatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = make_data()
+        self.loaders = dict((key, mock.Mock(return_value=df))
+                            for key, df in self.data.items())
+
+    def test_values_are_loaded_once_when_accessed(self):
+        dataset = Dataset(self.loaders)
+        self.assertEqual(list(dataset), list(self.data))
+        self.assertFalse(any(loader.called
+                             for loader in self.loaders.values()))
+        self.assertIs(dataset['general'], self.data['general'])
+        self.assertIs(dataset['general'], self.data['general'])
+        self.assertEqual(self.loaders['general'].call_count, 1)
+        self.assertTrue(dataset.is_loaded('general'))
+        self.assertFalse(dataset.is_loaded('data'))
+        self.loaders['data'].assert_not_called()
+
+    def test_set_values_are_not_loaded(self):
+        dataset = Dataset(self.loaders)
+        dataset['data'] = self.data['data'].head(2)
+        self.assertEqual(len(dataset['data'].index), 2)
+        self.loaders['data'].assert_not_called()
+        del dataset['notes']
+        self.assertNotIn('notes', dataset)
+        self.assertEqual(len(dataset), len(self.data) - 1)
+
+    def test_load_all(self):
+        dataset = Dataset(self.loaders, extra=1)
+        self.assertIs(dataset.load_all(), dataset)
+        self.assertTrue(all(loader.call_count == 1
+                            for loader in self.loaders.values()))
+        self.assertEqual(list(dataset.to_dict()), list(self.data) + ['extra'])
+
+    def test_pickled_datasets_are_loaded(self):
+        close = mock.Mock()
+        dataset = Dataset(self.loaders, close=close)
+        copy = pickle.loads(pickle.dumps(dataset))
+        self.assertTrue(all(copy.is_loaded(key) for key in self.data))
+        self.assertEqual(list(copy['data']['id']),
+                         list(self.data['data']['id']))
+        copy.close()
+        close.assert_not_called()
+
+    def test_context_manager_closes_the_source(self):
+        close = mock.Mock()
+        with Dataset(self.loaders, close=close) as dataset:
+            dataset['general']
+            close.assert_not_called()
+        close.assert_called_once_with()
+
+
+class ExcelDatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.xlsx')
+        self.codec = Codec.get('excel')
+        self.codec.store(make_data(), file=self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def workbooks(self, dataset):
+        # Workbook shared by the loaders of the dataset
+        return dataset._loaders['data'].func.__self__
+
+    def test_metadata_only_loads_close_the_workbook(self):
+        with self.codec.load(file=self.path) as dataset:
+            self.assertEqual(dataset['general']['table_name'].iloc[0],
+                             'hpv_m1_test')
+            workbook = self.workbooks(dataset)
+            self.assertIsNotNone(workbook._workbook)
+        self.assertIsNone(workbook._workbook)
+        self.assertFalse(dataset.is_loaded('data'))
+        # Reading more sheets opens it again
+        self.assertEqual(len(dataset['data'].index), 20)
+
+    def test_workbook_is_closed_after_the_last_sheet(self):
+        dataset = self.codec.load(file=self.path)
+        workbook = self.workbooks(dataset)
+        dataset.load_all()
+        self.assertIsNone(workbook._workbook)
+
+
+if __name__ == '__main__':
+    unittest.main()
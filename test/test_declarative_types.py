@@ -0,0 +1,177 @@
+""" test_declarative_types.py
+
+This module includes the tests of the semantic types defined with rules in
+JSON or YAML files.
+
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from infocentre_data_manager.plugins.semantic_types import declarative
+from infocentre_data_manager.plugins.semantic_types.base import SemanticType
+from infocentre_data_manager.plugins.semantic_types.declarative import \
+    DeclarativeType, declarative_types, register_types
+
+
+def check(definition, values):
+    series = pd.Series(values, dtype=object)
+    return list(DeclarativeType(definition).check_series(series))
+
+
+class DeclarativeTypeTest(unittest.TestCase):
+
+    def test_pattern(self):
+        self.assertEqual(check({'pattern': '[A-Z]{3}'},
+                               ['ESP', 'esp', 'ESPA', '', np.nan]),
+                         [True, False, False, False, False])
+
+    def test_values(self):
+        self.assertEqual(check({'values': ['F', 'M', 1]},
+                               ['F', 'f', 1, '1', None]),
+                         [True, False, True, True, False])
+
+    def test_minimum_and_maximum(self):
+        self.assertEqual(check({'minimum': 0, 'maximum': 100},
+                               ['0', '100', '-1', '100.5', ' 5e1 ', 'abc',
+                                50, 1.5]),
+                         [True, True, False, False, True, False, True,
+                          True])
+
+    def test_integer(self):
+        self.assertEqual(check({'integer': True},
+                               ['1', '1.0', '1.5', '-3', 'inf', 2]),
+                         [True, True, False, True, False, True])
+
+    def test_numeric(self):
+        self.assertEqual(check({'numeric': True},
+                               ['1', '.5', '1e-3', '1,5', 'nan', '']),
+                         [True, True, True, False, False, False])
+
+    def test_nullable(self):
+        values = ['', np.nan, None, '1']
+        self.assertEqual(check({'integer': True}, values),
+                         [False, False, False, True])
+        self.assertEqual(check({'integer': True, 'nullable': True}, values),
+                         [True, True, True, True])
+
+    def test_missing_values(self):
+        definition = {'minimum': 1900, 'missing_values': ['-9999', -6666]}
+        self.assertEqual(check(definition, ['-9999', -6666, '-6666', '-1']),
+                         [True, True, True, False])
+
+    def test_single_values(self):
+        semantic_type = DeclarativeType({'pattern': '[0-9]{4}',
+                                         'minimum': 1900})
+        self.assertTrue(semantic_type.check('2018'))
+        self.assertFalse(semantic_type.check('1800'))
+
+    def test_suggestions(self):
+        semantic_type = DeclarativeType({'values': ['Female', 'Male']})
+        self.assertEqual(semantic_type.suggest('femal'), ['Female'])
+        self.assertEqual(DeclarativeType({'integer': True}).suggest('1'), [])
+
+    def test_help(self):
+        self.assertEqual(DeclarativeType({'minimum': 0, 'integer': True})
+                         .help_info(),
+                         'minimum: 0, integer: True')
+        self.assertEqual(DeclarativeType({'help': 'A year'}).help_info(),
+                         'A year')
+
+    def test_invalid_definitions(self):
+        for definition in [{'maximun': 1}, {'pattern': '[a-'},
+                           {'minimum': '1'}, {'values': 'F,M'}]:
+            with self.subTest(definition=definition):
+                with self.assertRaises(ValueError):
+                    DeclarativeType(definition)
+
+
+class DefinitionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # The definitions are loaded once per process
+        patchers = [mock.patch.object(declarative, '_definitions', None),
+                    mock.patch.object(declarative, '_classes', {})]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as definitions_file:
+            definitions_file.write(content)
+        return path
+
+    def test_default_definitions(self):
+        semantic_type = SemanticType.get('year')
+        self.assertIsInstance(semantic_type, DeclarativeType)
+        self.assertTrue(semantic_type.check('2018'))
+        # Shared missing value codes
+        self.assertTrue(semantic_type.check('-9999'))
+        self.assertIn('year', SemanticType.get_plugin_names())
+
+    def test_json_definitions(self):
+        path = self.write('types.json', json.dumps({
+            'defaults': {'missing_values': ['-9999']},
+            'types': {'hpv_age': {'integer': True, 'minimum': 0,
+                                  'maximum': 120, 'help': 'Age'}},
+        }))
+        register_types(path)
+        semantic_type = SemanticType.get('hpv_age')
+        self.assertEqual(type(semantic_type).__name__, 'HpvAgeType')
+        self.assertEqual(semantic_type.help_info(), 'Age')
+        self.assertEqual(list(semantic_type.check_series(
+            pd.Series(['30', '-9999', '130', '']))),
+            [True, True, False, False])
+
+    def test_yaml_definitions(self):
+        path = self.write('types.yaml',
+                          'types:\n'
+                          '  sex_code:\n'
+                          '    values: [F, M]\n'
+                          '    nullable: true\n')
+        register_types(path)
+        self.assertEqual(declarative_types()['sex_code'],
+                         {'values': ['F', 'M'], 'nullable': True})
+
+    def test_registered_types_replace_the_previous_ones(self):
+        register_types({'types': {'code': {'pattern': '[A-Z]+'}}})
+        self.assertTrue(SemanticType.get('code').check('ABC'))
+        register_types({'types': {'code': {'pattern': '[0-9]+'}}})
+        self.assertFalse(SemanticType.get('code').check('ABC'))
+
+    def test_environment_variable(self):
+        first = self.write('first.json', json.dumps(
+            {'types': {'code': {'pattern': '[A-Z]+'},
+                       'year': {'pattern': '[0-9]{2}'}}}))
+        second = self.write('second.yml',
+                            'types:\n  code:\n    integer: true\n')
+        with mock.patch.dict(os.environ, {
+                declarative.DEFINITIONS_ENV: os.pathsep.join([first,
+                                                              second])}):
+            definitions = declarative_types()
+        # Later files replace the types of the previous ones
+        self.assertEqual(definitions['code'], {'integer': True})
+        self.assertEqual(definitions['year'], {'pattern': '[0-9]{2}'})
+        self.assertIn('percentage', definitions)
+
+    def test_invalid_files_name_the_type(self):
+        path = self.write('types.json', json.dumps(
+            {'types': {'code': {'patern': '[A-Z]+'}}}))
+        with self.assertRaises(ValueError) as context:
+            register_types(path)
+        self.assertIn('types.json: Semantic type "code": Unknown rules '
+                      'patern', str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
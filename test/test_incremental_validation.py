@@ -0,0 +1,116 @@
+""" test_incremental_validation.py
+
+This module includes the tests of the incremental validation of new
+versions of a table, which must give the same results as validating the
+whole table.
+
+"""
+
+import unittest
+from unittest import mock
+import pandas as pd
+from infocentre_data_manager.plugins.data_validators.base import \
+    DataValidator
+from infocentre_data_manager.plugins.data_validators.snapshot import \
+    ValidationSnapshot
+from test.data import make_data, make_validators
+
+
+def previous_data():
+    data = make_data(200)
+    df = data['data']
+    df.loc[[3, 150], 'iso'] = ['XXX', 'esp']
+    df.loc[[4, 60], 'value'] = ['abc', '1.5']
+    df.loc[[5, 199], 'sex'] = ''
+    return data
+
+
+def new_version(data, df=None, **frames):
+    new_data = dict(data)
+    new_data['data'] = data['data'].copy() if df is None else df
+    new_data.update(frames)
+    return new_data
+
+
+class IncrementalValidationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.validators = make_validators()
+        self.data = previous_data()
+        results = DataValidator.apply(self.data, self.validators,
+                                      structured=True)
+        self.snapshot = ValidationSnapshot.from_data(self.data, results)
+
+    def assertSameResults(self, data):
+        incremental = DataValidator.apply_incremental(
+            data, self.snapshot, self.validators, structured=True)
+        full = DataValidator.apply(data, self.validators, structured=True)
+        self.assertEqual([result.to_dict() for result in incremental],
+                         [result.to_dict() for result in full])
+        for incremental_result, full_result in zip(incremental, full):
+            pd.testing.assert_frame_equal(
+                incremental_result.issues.astype(str),
+                full_result.issues.astype(str))
+
+    def test_unchanged(self):
+        self.assertSameResults(new_version(self.data))
+
+    def test_changed_values(self):
+        data = new_version(self.data)
+        df = data['data']
+        # Fixed, new and unchanged invalid values
+        df.loc[[3, 10, 77], ['iso', 'value', 'sex']] = \
+            [['ESP', '1', 'F'], ['QQQ', 'bad', 'M'], ['FRA', '2', '']]
+        df.loc[4, 'value'] = '4'
+        self.assertSameResults(data)
+
+    def test_reordered_deleted_and_added_rows(self):
+        df = self.data['data']
+        df = pd.concat([df.iloc[100:], df.iloc[:100]]).drop(
+            index=range(20, 40))
+        added = pd.DataFrame({'id': [201, 202], 'iso': ['QQQ', 'ESP'],
+                              'sex': ['F', 'M'], 'value': ['z', '3']})
+        df = pd.concat([df, added], ignore_index=True)
+        self.assertSameResults(new_version(self.data, df))
+
+    def test_duplicated_ids(self):
+        data = new_version(self.data)
+        data['data'].loc[0, 'id'] = 2
+        self.assertSameResults(data)
+
+    def test_renamed_variable(self):
+        df = self.data['data'].rename(columns={'value': 'n'})
+        variables = self.data['variables'].replace('value', 'n')
+        self.assertSameResults(new_version(self.data, df,
+                                           variables=variables))
+
+    def test_changed_type(self):
+        variables = self.data['variables'].copy()
+        variables.loc[3, 'type'] = 'string'
+        self.assertSameResults(new_version(self.data, variables=variables))
+
+    def test_only_changed_rows_are_validated(self):
+        data = new_version(self.data)
+        data['data'].loc[[10, 11], 'value'] = ['bad', '7']
+        type_validator = self.validators[1]
+        with mock.patch.object(type_validator, '_apply',
+                               wraps=type_validator._apply) as apply:
+            DataValidator.apply_incremental(data, self.snapshot,
+                                            self.validators)
+        self.assertEqual([len(call.args[0]['data'].index)
+                          for call in apply.call_args_list], [2])
+        self.assertSameResults(data)
+
+    def test_empty_previous_version(self):
+        data = make_data(0)
+        results = DataValidator.apply(data, self.validators, structured=True)
+        self.snapshot = ValidationSnapshot.from_data(data, results)
+        self.assertSameResults(previous_data())
+
+    def test_empty_new_version(self):
+        self.assertSameResults(new_version(self.data,
+                                           self.data['data'].iloc[:0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+""" test_missing_values.py
+
+This module includes the tests of the missing values validator.
+
+"""
+
+import unittest
+import numpy as np
+from infocentre_data_manager.plugins.data_validators.base import \
+    DataValidator
+from test.data import make_data
+
+
+class MissingValuesValidatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = make_data()
+        self.df = self.data['data']
+        self.df['value'] = self.df['value'].astype(object)
+
+    def validate(self, **kwargs):
+        return DataValidator.get('missing_values', **kwargs).validate(
+            self.data)
+
+    def test_no_missing_values(self):
+        result = self.validate()
+        self.assertEqual(result['warnings'], [])
+        self.assertEqual(result['info'],
+                         ['0 of 60 values (0.0%) are missing: 0 empty, 0 NaN '
+                          'and 0 with missing value codes.',
+                          'No problems found.'])
+
+    def test_kinds_of_missing_values(self):
+        self.df.loc[0, 'value'] = ''
+        self.df.loc[1, 'value'] = np.nan
+        self.df.loc[2, 'value'] = '-9999'
+        self.df.loc[3, 'value'] = -6666
+        self.df.loc[4, 'sex'] = ''
+        result = self.validate()
+        self.assertEqual(result['info'][0],
+                         '5 of 60 values (8.3%) are missing: 2 empty, 1 NaN '
+                         'and 2 with missing value codes.')
+
+    def test_variable_threshold(self):
+        self.df.loc[:10, 'value'] = ''
+        result = self.validate()
+        self.assertEqual(result['warnings'],
+                         ['Variable "value" has 55.0% missing values (11 of '
+                          '20).'])
+        self.assertEqual(self.validate(max_missing_rate=0.6)['warnings'], [])
+
+    def test_custom_missing_codes(self):
+        self.df.loc[:1, 'value'] = 'n/a'
+        self.assertTrue(self.validate()['info'][0].startswith('0 of 60'))
+        result = self.validate(missing_codes=['n/a'])
+        self.assertTrue(result['info'][0].startswith('2 of 60 values'))
+
+    def test_iso_missing_rates(self):
+        # ESP rows are the even ones: 2 of their 3 values are missing
+        esp = self.df['iso'] == 'ESP'
+        self.df.loc[esp, ['sex', 'value']] = ''
+        result = self.validate(max_missing_rate=1)
+        self.assertEqual(result['warnings'],
+                         ['1 region(s) have more than 50.0% missing values: '
+                          'ESP (66.7%).'])
+        result = self.validate(max_missing_rate=1, max_iso_missing_rate=0.7)
+        self.assertEqual(result['warnings'], [])
+
+    def test_isos_are_sorted_by_missing_rate(self):
+        self.df.loc[self.df['iso'] == 'ESP', 'value'] = ''
+        self.df.loc[self.df['iso'] == 'FRA', ['sex', 'value']] = ''
+        result = self.validate(max_missing_rate=1, max_iso_missing_rate=0.3)
+        self.assertEqual(result['warnings'],
+                         ['2 region(s) have more than 30.0% missing values: '
+                          'FRA (66.7%), ESP (33.3%).'])
+
+    def test_missing_isos_are_counted(self):
+        self.df.loc[:3, 'iso'] = ''
+        result = self.validate(max_missing_rate=1, max_iso_missing_rate=0.3)
+        self.assertEqual(result['warnings'],
+                         ['1 region(s) have more than 30.0% missing values: '
+                          ' (33.3%).'])
+
+    def test_other_iso_variable(self):
+        self.df.loc[self.df['sex'] == 'F', 'value'] = ''
+        result = self.validate(max_missing_rate=1, max_iso_missing_rate=0.3,
+                               iso_variable='sex')
+        self.assertEqual(result['warnings'],
+                         ['1 region(s) have more than 30.0% missing values: '
+                          'F (33.3%).'])
+
+    def test_chunks_give_the_same_rates(self):
+        self.df.loc[self.df['iso'] == 'ESP', 'value'] = ''
+        self.df.loc[[1, 3, 5], 'sex'] = '-9999'
+        validator = DataValidator.get('missing_values',
+                                      max_iso_missing_rate=0.2)
+        expected = validator.validate(self.data)
+        states = [validator.feed(validator.begin(self.data),
+                                 self.df.iloc[i:i + 3])
+                  for i in range(0, len(self.df.index), 3)]
+        state = validator.begin(self.data)
+        for other in states:
+            state = validator.merge(state, other)
+        result = validator.finish(state, self.data).to_dict()
+        self.assertEqual(result['warnings'], expected['warnings'])
+        self.assertEqual(result['info'], expected['info'])
+        self.assertEqual(len(result['warnings']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+""" test_mysql.py
+
+This module includes the tests of the MySQL codec that don't need a MySQL
+server.
+
+"""
+
+import unittest
+from unittest import mock
+from infocentre_data_manager.plugins.codecs.mysql import MySQLCodec
+from test.data import make_data
+
+
+class StoreTest(unittest.TestCase):
+
+    def test_temporal_tables_are_not_replaced(self):
+        codec = MySQLCodec()
+        for option in ['publish', 'fast_load', 'resumable']:
+            with self.subTest(option=option), \
+                    mock.patch.object(MySQLCodec, '_connect') as connect:
+                with self.assertRaises(ValueError):
+                    codec.store(make_data(), use_temporal_db=True,
+                                host='localhost', db='test', user='test',
+                                password='test', **{option: True})
+                connect.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
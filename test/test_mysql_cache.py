@@ -0,0 +1,123 @@
+""" test_mysql_cache.py
+
+This module includes the tests of the local cache of the MySQL codec and
+of its change markers.
+
+"""
+
+import unittest
+from unittest import mock
+from pymysql.constants import ER
+from pymysql.err import ProgrammingError
+from infocentre_data_manager.plugins.codecs.mysql_cache import \
+    LoadCache, bump_version, fetch_marker
+from test.data import make_data
+
+
+def data_size(data):
+    return sum(int(df.memory_usage(deep=True).sum())
+               for df in data.values())
+
+
+class LoadCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = dict((key, make_data()[key])
+                         for key in ['general', 'variables', 'data'])
+        self.size = data_size(self.data)
+
+    def test_least_recently_used_tables_are_evicted(self):
+        cache = LoadCache(max_bytes=2 * self.size)
+        cache.put('a', 1, self.data)
+        cache.put('b', 1, self.data)
+        self.assertIsNotNone(cache.get('a', 1))
+        cache.put('c', 1, self.data)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b', 1))
+        self.assertIsNotNone(cache.get('a', 1))
+        self.assertIsNotNone(cache.get('c', 1))
+
+    def test_tables_bigger_than_the_cache_are_not_stored(self):
+        cache = LoadCache(max_bytes=self.size - 1)
+        cache.put('a', 1, self.data)
+        self.assertEqual(len(cache), 0)
+        self.assertIsNone(cache.get('a', 1))
+
+    def test_changed_tables_are_not_returned(self):
+        cache = LoadCache()
+        cache.put('a', (1, None, None), self.data)
+        self.assertIsNone(cache.get('a', (2, None, None)))
+        self.assertIsNotNone(cache.get('a', (1, None, None)))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_invalidate(self):
+        cache = LoadCache()
+        cache.put('a', 1, self.data)
+        cache.put('b', 1, self.data)
+        cache.invalidate('a')
+        self.assertIsNone(cache.get('a', 1))
+        self.assertIsNotNone(cache.get('b', 1))
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+        # The freed memory can be used again
+        cache = LoadCache(max_bytes=self.size)
+        cache.put('a', 1, self.data)
+        cache.invalidate('a')
+        cache.put('b', 1, self.data)
+        self.assertIsNotNone(cache.get('b', 1))
+
+    def test_entries_are_copies(self):
+        cache = LoadCache()
+        cache.put('a', 1, self.data)
+        self.data['data']['value'] = 0
+        cached = cache.get('a', 1)
+        self.assertNotEqual(list(cached['data']['value']),
+                            list(self.data['data']['value']))
+        cached['data']['value'] = 0
+        self.assertNotEqual(list(cache.get('a', 1)['data']['value']),
+                            list(self.data['data']['value']))
+
+
+class MarkerTest(unittest.TestCase):
+
+    def connect(self, cursor):
+        conn = mock.MagicMock()
+        conn.cursor.return_value.__enter__.return_value = cursor
+        return conn
+
+    def test_marker_includes_the_metadata_tables(self):
+        cursor = mock.Mock()
+        cursor.fetchone.return_value = {
+            'version': None, 'update_time': None,
+            'metadata_update_time': '2024-01-01 00:00:00'}
+        marker = fetch_marker(self.connect(cursor), 'hpv_m1_test')
+        self.assertEqual(marker, (None, None, '2024-01-01 00:00:00'))
+        sql, params = cursor.execute.call_args[0]
+        self.assertIn('info_vars', params)
+        self.assertIn('ref_sources_by', params)
+
+    def test_untracked_tables_have_no_marker(self):
+        cursor = mock.Mock()
+        cursor.fetchone.return_value = {
+            'version': None, 'update_time': None,
+            'metadata_update_time': None}
+        self.assertIsNone(fetch_marker(self.connect(cursor), 'hpv_m1_test'))
+
+    def test_version_table_is_created_when_missing(self):
+        cursor = mock.Mock()
+        cursor.execute.side_effect = [
+            ProgrammingError(ER.NO_SUCH_TABLE, "Table doesn't exist"),
+            None, None]
+        bump_version(self.connect(cursor), 'hpv_m1_test')
+        statements = [call[0][0] for call in cursor.execute.call_args_list]
+        self.assertEqual([sql.split()[0] for sql in statements],
+                         ['INSERT', 'CREATE', 'INSERT'])
+
+    def test_version_table_is_not_created_again(self):
+        cursor = mock.Mock()
+        bump_version(self.connect(cursor), 'hpv_m1_test')
+        self.assertEqual(cursor.execute.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+""" test_mysql_loader.py
+
+This module includes the tests of the loaders used by the MySQL codec to
+insert big data tables, with SQLite standing in for the MySQL server.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from pymysql.constants import CR
+from pymysql.err import OperationalError
+from infocentre_data_manager.plugins.codecs.mysql import MySQLCodec
+from infocentre_data_manager.plugins.codecs.mysql_loader import \
+    ParallelLoader, ResumableLoader
+from test.test_async_mysql import CONN_PARAMS, SQLiteConnection
+
+CHECKPOINT_TABLE = ResumableLoader.CHECKPOINT_TABLE
+
+
+class LoaderCodec(object):
+    """ Codec with the methods used by the loaders, on SQLite. """
+
+    def __init__(self, path):
+        self.path = path
+        self.connections = []
+        # Number of commits that fail after committing, as if the
+        # connection was lost before the reply of the server
+        self.lost_commits = 0
+        # Number of batches inserted before the inserts fail for good
+        self.failing_batch = None
+
+    def _connect(self, **conn_params):
+        conn = SQLiteConnection(self.path)
+        codec = self
+        commit = conn._conn.commit
+
+        class Connection(object):
+            def __getattr__(self, name):
+                return getattr(conn, name)
+
+            def commit(self):
+                commit()
+                if codec.lost_commits > 0:
+                    codec.lost_commits -= 1
+                    raise OperationalError(CR.CR_SERVER_LOST,
+                                           'Lost connection')
+
+        self.connections.append(conn)
+        return Connection()
+
+    def _insert_rows(self, cursor, table_name, df, batch_size):
+        if self.failing_batch is not None:
+            if self.failing_batch == 0:
+                raise RuntimeError('Interrupted load')
+            self.failing_batch -= 1
+        MySQLCodec._insert_rows(self, cursor, table_name, df, batch_size)
+
+    def _create_staging_table(self, conn, table_name, staging_table):
+        with conn.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(staging_table))
+            cursor.execute('CREATE TABLE {} (id INTEGER PRIMARY KEY, '
+                           'value TEXT)'.format(staging_table))
+
+    def query(self, sql):
+        conn = SQLiteConnection(self.path)
+        try:
+            return conn.execute(sql)
+        finally:
+            conn.close()
+
+
+def make_rows(n_rows, value='v'):
+    # Unsorted, the loaders sort them by id
+    ids = list(range(n_rows, 0, -1))
+    return pd.DataFrame({'id': ids,
+                         'value': ['{}{}'.format(value, i) for i in ids]})
+
+
+class LoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.codec = LoaderCodec(os.path.join(self.directory, 'test.sqlite'))
+        conn = SQLiteConnection(self.codec.path)
+        self.codec._create_staging_table(conn, 'hpv_m1_test', 'staging')
+        conn._conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def stored_rows(self, table_name='staging'):
+        return self.codec.query(
+            'SELECT id, value FROM {} ORDER BY id'.format(table_name))
+
+
+class ParallelLoaderTest(LoaderTest):
+
+    def loader(self, **kwargs):
+        return ParallelLoader(self.codec, CONN_PARAMS, retry_delay=0,
+                              **kwargs)
+
+    def test_partitions(self):
+        partitions = self.loader(n_connections=3)._partition(make_rows(10))
+        self.assertEqual([list(partition['id']) for partition in partitions],
+                         [[1, 2, 3], [4, 5, 6], [7, 8, 9, 10]])
+
+    def test_no_empty_partitions(self):
+        partitions = self.loader(n_connections=4)._partition(make_rows(2))
+        self.assertEqual([list(partition['id']) for partition in partitions],
+                         [[1], [2]])
+        self.assertEqual(self.loader()._partition(make_rows(0)), [])
+
+    def test_load(self):
+        rows = make_rows(25)
+        self.assertEqual(self.loader(n_connections=3, batch_size=4).load(
+            'staging', rows), 25)
+        self.assertEqual(self.stored_rows(),
+                         [(i, 'v{}'.format(i)) for i in range(1, 26)])
+        self.assertEqual(len(self.codec.connections), 3)
+        self.assertFalse(any(conn.open for conn in self.codec.connections))
+
+    def test_partitions_of_lost_commits_are_replaced(self):
+        # The rows were committed, the retry must delete them first (the
+        # ids are the primary key)
+        self.codec.lost_commits = 2
+        self.assertEqual(self.loader(n_connections=2).load('staging',
+                                                           make_rows(10)),
+                         10)
+        self.assertEqual(len(self.stored_rows()), 10)
+        self.assertEqual(len(self.codec.connections), 4)
+
+    def test_retries_are_bounded(self):
+        self.codec.lost_commits = 10
+        with self.assertRaises(OperationalError):
+            self.loader(n_connections=1, max_retries=2).load('staging',
+                                                             make_rows(5))
+        self.assertEqual(len(self.codec.connections), 3)
+
+    def test_session_variables(self):
+        self.loader(n_connections=2,
+                    session={'foreign_key_checks': 0}).load('staging',
+                                                            make_rows(4))
+        self.assertEqual([conn.session for conn in self.codec.connections],
+                         [{'foreign_key_checks': 0}] * 2)
+
+
+class ResumableLoaderTest(LoaderTest):
+
+    def loader(self):
+        return ResumableLoader(self.codec, CONN_PARAMS, 'hpv_m1_test',
+                               batch_size=4, retry_delay=0)
+
+    def checkpoint(self):
+        return self.codec.query(
+            'SELECT content_hash, last_id FROM {}'.format(CHECKPOINT_TABLE))
+
+    def test_load(self):
+        self.assertEqual(self.loader().load('staging', make_rows(10)), 10)
+        self.assertEqual(len(self.stored_rows()), 10)
+        self.assertEqual(self.checkpoint()[0][1], 10)
+
+    def test_interrupted_loads_are_resumed(self):
+        rows = make_rows(10)
+        self.codec.failing_batch = 2
+        with self.assertRaises(RuntimeError):
+            self.loader().load('staging', rows)
+        self.assertEqual(len(self.stored_rows()), 8)
+        self.assertEqual(self.checkpoint()[0][1], 8)
+
+        self.codec.failing_batch = None
+        self.assertEqual(self.loader().load('staging', rows), 2)
+        self.assertEqual(self.stored_rows(),
+                         [(i, 'v{}'.format(i)) for i in range(1, 11)])
+
+    def test_changed_content_is_loaded_again(self):
+        self.codec.failing_batch = 1
+        with self.assertRaises(RuntimeError):
+            self.loader().load('staging', make_rows(10))
+        first_hash = self.checkpoint()[0][0]
+
+        self.codec.failing_batch = None
+        rows = make_rows(10, value='w')
+        self.assertEqual(self.loader().load('staging', rows), 10)
+        self.assertEqual(self.stored_rows(),
+                         [(i, 'w{}'.format(i)) for i in range(1, 11)])
+        self.assertNotEqual(self.checkpoint()[0][0], first_hash)
+
+    def test_lost_commits_are_not_inserted_twice(self):
+        self.codec.lost_commits = 2
+        self.assertEqual(self.loader().load('staging', make_rows(10)), 10)
+        self.assertEqual(len(self.stored_rows()), 10)
+
+    def test_clear_checkpoint(self):
+        loader = self.loader()
+        loader.load('staging', make_rows(3))
+        conn = self.codec._connect(**CONN_PARAMS)
+        loader.clear_checkpoint(conn)
+        conn.commit()
+        conn.close()
+        self.assertEqual(self.checkpoint(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
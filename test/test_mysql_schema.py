@@ -0,0 +1,120 @@
+""" test_mysql_schema.py
+
+This module includes the tests of the schema inference of the MySQL data
+tables.
+
+"""
+
+import unittest
+import numpy as np
+import pandas as pd
+from infocentre_data_manager.plugins.codecs.mysql_schema import \
+    MAX_IDENTIFIER_LENGTH, IndexSchema, _as_text, infer_schema, \
+    widen_columns
+from test.data import make_data
+
+EXISTING = {
+    'id': ('int', None),
+    'iso': ('char', 3),
+    'sex': ('varchar', 16),
+    'value': ('smallint', None),
+}
+
+
+class InferSchemaTest(unittest.TestCase):
+
+    def test_types(self):
+        schema = infer_schema(make_data())
+        self.assertEqual([(col.name, col.sql_type) for col in schema],
+                         [('id', 'INT'), ('iso', 'CHAR(3)'),
+                          ('sex', 'VARCHAR(16)'), ('value', 'SMALLINT')])
+
+    def test_integer_columns_can_be_numbers(self):
+        data = make_data()
+        data['data']['value'] = np.arange(20, dtype=float) * 10 ** 6
+        schema = infer_schema(data)
+        self.assertEqual(schema[3].sql_type, 'INT')
+
+    def test_integer_columns_with_missing_values(self):
+        data = make_data()
+        data['data']['value'] = np.arange(20, dtype=float) * 10 ** 6
+        data['data'].loc[[3, 5], 'value'] = np.nan
+        self.assertEqual(infer_schema(data)[3].sql_type, 'VARCHAR(16)')
+
+    def test_floats_as_text(self):
+        values = pd.Series([1.0, np.nan, -3.0, 1e6, 2.6, -0.2])
+        self.assertEqual(list(_as_text(values)),
+                         ['1', '', '-3', '1000000', '3', '0'])
+        # Out of the range of the integers
+        self.assertEqual(list(_as_text(pd.Series([1e20, np.inf, np.nan]))),
+                         ['100000000000000000000', 'inf', ''])
+
+    def test_non_text_columns(self):
+        data = make_data()
+        data['data']['sex'] = 1.5
+        with self.assertRaises(ValueError):
+            infer_schema(data)
+
+
+class WidenColumnsTest(unittest.TestCase):
+
+    def test_same_sizes(self):
+        self.assertEqual(widen_columns(infer_schema(make_data()), EXISTING),
+                         [])
+
+    def test_bigger_values(self):
+        data = make_data()
+        data['data']['sex'] = 'x' * 40
+        data['data']['value'] = [str(i * 10 ** 6) for i in range(20)]
+        columns = widen_columns(infer_schema(data), EXISTING)
+        self.assertEqual([(col.name, col.sql_type) for col in columns],
+                         [('sex', 'VARCHAR(64)'), ('value', 'INT')])
+
+    def test_smaller_values(self):
+        data = make_data()
+        data['data']['sex'] = 'x'
+        existing = dict(EXISTING, value=('bigint', None))
+        self.assertEqual(widen_columns(infer_schema(data), existing), [])
+
+    def test_integers_become_text(self):
+        data = make_data()
+        data['data']['value'] = 'a'
+        columns = widen_columns(infer_schema(data), EXISTING)
+        # Big enough for any stored integer
+        self.assertEqual([(col.name, col.sql_type) for col in columns],
+                         [('value', 'VARCHAR(32)')])
+
+    def test_text_is_kept_for_integers(self):
+        data = make_data()
+        data['data']['sex'] = [str(10 ** 17 + i) for i in range(20)]
+        data['variables'].loc[2, 'type'] = 'integer'
+        columns = widen_columns(infer_schema(data), EXISTING)
+        self.assertEqual([(col.name, col.sql_type) for col in columns],
+                         [('sex', 'VARCHAR(32)')])
+
+
+class IndexSchemaTest(unittest.TestCase):
+
+    def test_names(self):
+        index = IndexSchema('iso')
+        self.assertEqual(index.name, 'iso_IX')
+        self.assertEqual(index.clause(), 'INDEX `iso_IX` (`iso`)')
+        self.assertEqual(IndexSchema('iso', is_text=True).clause(),
+                         'INDEX `iso_IX` (`iso`(64))')
+
+    def test_long_names(self):
+        prefix = 'x' * MAX_IDENTIFIER_LENGTH
+        first = IndexSchema(prefix + '_region').name
+        second = IndexSchema(prefix + '_country').name
+        for name in [first, second]:
+            self.assertEqual(len(name), MAX_IDENTIFIER_LENGTH)
+            self.assertTrue(name.startswith('x' * 52 + '_'))
+            self.assertTrue(name.endswith('_IX'))
+        self.assertNotEqual(first, second)
+        # The same column always gets the same name
+        self.assertEqual(IndexSchema(prefix + '_region').name, first)
+        self.assertEqual(IndexSchema('x' * 61).name, 'x' * 61 + '_IX')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+""" test_naming.py
+
+This module includes the tests of the validator of the variable naming
+conventions.
+
+"""
+
+import unittest
+import numpy as np
+import pandas as pd
+from infocentre_data_manager.catalog import Catalog
+from infocentre_data_manager.plugins.data_validators.base import \
+    DataValidator
+from test.data import make_data
+
+
+def make_catalog(tables):
+    """ Catalog with the tables {table name: [(variable, type)]}. """
+    catalog = Catalog()
+    for table_name, variables in tables.items():
+        catalog._tables[table_name] = {
+            'table_name': table_name,
+            'module': 1,
+            'data_manager': 'Test',
+            'contents': '',
+            'variables': [list(variable) for variable in variables],
+            'last_date': None,
+            'source': 'test',
+        }
+    return catalog
+
+
+def make_table(variables, table_name='hpv_m1_test'):
+    data = make_data(table_name=table_name)
+    data['variables'] = pd.DataFrame({
+        'variable': [name for name, _ in variables],
+        'type': [var_type for _, var_type in variables],
+        'description': '',
+    })
+    return data
+
+
+class NamingValidatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = make_catalog({
+            'hpv_m1_a': [('iso', 'iso'), ('age_group', 'string')],
+            'hpv_m1_b': [('iso', 'iso'), ('age_group', 'string')],
+            'hpv_m1_c': [('iso', 'iso'), ('age_group', 'string')],
+            'hpv_m1_d': [('iso', 'iso'), ('AgeGroup', 'string')],
+        })
+
+    def validate(self, data, **kwargs):
+        validator = DataValidator.get('naming', catalog=self.catalog,
+                                      **kwargs)
+        return validator.validate_structured(data)
+
+    def issues(self, result, code):
+        issues = result.issues
+        return issues[issues['code'] == code]
+
+    def test_conventional_names(self):
+        result = self.validate(make_table([('iso', 'iso'),
+                                           ('age_group', 'string')]))
+        self.assertEqual(result.count('warning'), 0)
+        self.assertEqual(result.count('error'), 0)
+
+    def test_naming_variants(self):
+        result = self.validate(make_table([('iso', 'iso'),
+                                           ('agegroup', 'string')]))
+        variants = self.issues(result, 'naming_variant')
+        self.assertEqual(list(variants['value']), ['agegroup'])
+        self.assertEqual(list(variants['suggestion']), ['age_group'])
+        self.assertIn('hpv_m1_a, hpv_m1_b, hpv_m1_c',
+                      variants['message'].iloc[0])
+
+    def test_the_table_itself_is_not_counted(self):
+        # Only one other table uses AgeGroup, but three use age_group
+        result = self.validate(make_table([('AgeGroup', 'string')],
+                                          table_name='hpv_m1_d'))
+        self.assertEqual(list(self.issues(result,
+                                          'naming_variant')['suggestion']),
+                         ['age_group'])
+        self.catalog = make_catalog({
+            'hpv_m1_a': [('age_group', 'string')],
+            'hpv_m1_d': [('AgeGroup', 'string')],
+        })
+        # Below min_tables
+        result = self.validate(make_table([('AgeGroup', 'string')],
+                                          table_name='hpv_m1_d'))
+        self.assertEqual(result.count('warning'), 0)
+
+    def test_type_variants(self):
+        result = self.validate(make_table([('iso', 'string')]))
+        variants = self.issues(result, 'type_variant')
+        self.assertEqual(list(variants['value']), ['string'])
+        self.assertEqual(list(variants['suggestion']), ['iso'])
+
+    def test_missing_types_are_strings(self):
+        for missing in [np.nan, None, '']:
+            with self.subTest(missing=missing):
+                data = make_table([('iso', 'iso'), ('age_group', 'string')])
+                data['variables']['type'] = \
+                    data['variables']['type'].astype(object)
+                data['variables'].loc[1, 'type'] = missing
+                result = self.validate(data)
+                self.assertEqual(result.count('warning'), 0)
+
+    def test_missing_types_in_the_catalog_are_strings(self):
+        self.catalog = make_catalog({
+            'hpv_m1_a': [('age_group', '')],
+            'hpv_m1_b': [('age_group', '')],
+            'hpv_m1_c': [('age_group', 'integer')],
+        })
+        result = self.validate(make_table([('age_group', 'string')]))
+        self.assertEqual(result.count('warning'), 0)
+        result = self.validate(make_table([('age_group', 'integer')]))
+        self.assertEqual(list(self.issues(result,
+                                          'type_variant')['suggestion']),
+                         ['string'])
+
+    def test_pattern(self):
+        result = self.validate(make_table([('iso', 'iso'),
+                                           ('Age group', 'string')]),
+                               pattern='[a-z][a-z0-9_]*')
+        invalid = self.issues(result, 'invalid_name')
+        self.assertEqual(list(invalid['value']), ['Age group'])
+        self.assertTrue(result.has_errors)
+
+    def test_empty_catalog(self):
+        self.catalog = Catalog()
+        result = self.validate(make_table([('iso', 'iso')]))
+        self.assertEqual(list(self.issues(result, 'empty_catalog')['code']),
+                         ['empty_catalog'])
+
+
+if __name__ == '__main__':
+    unittest.main()
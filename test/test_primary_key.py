@@ -0,0 +1,154 @@
+""" test_primary_key.py
+
+This module includes the tests of the validator of the row ids and
+duplicated rows.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from infocentre_data_manager.plugins.codecs.base import Codec
+from infocentre_data_manager.plugins.data_validators.base import \
+    DataValidator
+from test.data import make_data
+
+
+class PrimaryKeyValidatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = make_data()
+        self.validator = DataValidator.get('primary_key')
+
+    def validate(self, data=None):
+        return self.validator.validate(self.data if data is None else data)
+
+    def set_ids(self, ids):
+        df = self.data['data']
+        df['id'] = df['id'].astype(object)
+        for position, value in ids.items():
+            df.loc[position, 'id'] = value
+
+    def test_valid_ids(self):
+        result = self.validate()
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['warnings'], [])
+        self.assertEqual(result['info'], ['No problems found.'])
+
+    def test_missing_id_column(self):
+        del self.data['data']['id']
+        self.assertEqual(self.validate()['errors'],
+                         ['The data has no "id" column.'])
+
+    def test_non_integer_ids(self):
+        self.set_ids({2: 'x', 5: '3.5', 8: '', 9: None})
+        errors = self.validate()['errors']
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith(
+            '4 row(s) have an id that is not an integer: "x", "3.5"'))
+
+    def test_infinite_ids(self):
+        self.set_ids({2: 'inf', 5: -np.inf})
+        errors = self.validate()['errors']
+        self.assertEqual(
+            errors,
+            ['2 row(s) have an id that is not an integer: "inf", "-inf".'])
+
+    def test_decimal_ids_with_integer_values(self):
+        self.data['data']['id'] = self.data['data']['id'].astype(float)
+        self.assertEqual(self.validate()['errors'], [])
+
+    def test_duplicated_ids(self):
+        self.set_ids({3: 1, 6: 1, 7: 2})
+        errors = self.validate()['errors']
+        self.assertEqual(
+            errors, ['5 row(s) share the same id, duplicated ids: 1, 2.'])
+
+    def test_non_monotonic_ids(self):
+        self.data['data']['id'] = self.data['data']['id'][::-1].values
+        result = self.validate()
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['warnings'],
+                         ['Row ids are not in increasing order.'])
+
+    def test_duplicated_rows(self):
+        df = self.data['data']
+        df.loc[5, ['iso', 'sex', 'value']] = df.loc[1, ['iso', 'sex',
+                                                         'value']]
+        df.loc[9, ['iso', 'sex', 'value']] = df.loc[1, ['iso', 'sex',
+                                                         'value']]
+        warnings = self.validate()['warnings']
+        self.assertEqual(
+            warnings,
+            ['2 row(s) duplicate the values of a previous row, ids: 6, 10.'])
+
+    def test_rows_are_compared_as_text(self):
+        # e.g. MySQL pages with missing values load integers as floats
+        df = self.data['data']
+        df['value'] = df['value'].astype(float)
+        first = df.iloc[:10].copy()
+        second = df.iloc[10:].copy()
+        second.loc[15, 'value'] = np.nan
+        second['value'] = second['value'].astype(object)
+        second.loc[12, ['iso', 'sex', 'value']] = ['ESP', 'F', '0']
+        state = self.validator.begin(self.data)
+        state = self.validator.feed(state, first)
+        state = self.validator.feed(state, second)
+        result = self.validator.finish(state, self.data).to_dict()
+        self.assertEqual(
+            result['warnings'],
+            ['1 row(s) duplicate the values of a previous row, ids: 13.'])
+
+    def test_merged_chunks(self):
+        df = self.data['data']
+        self.set_ids({2: 'x', 12: 'y', 15: 4})
+        df.loc[17, ['iso', 'sex', 'value']] = df.loc[1, ['iso', 'sex',
+                                                          'value']]
+        expected = self.validate()
+        states = [self.validator.feed(self.validator.begin(self.data),
+                                      df.iloc[i:i + 5])
+                  for i in range(0, len(df.index), 5)]
+        state = self.validator.begin(self.data)
+        for other in states:
+            state = self.validator.merge(state, other)
+        result = self.validator.finish(state, self.data).to_dict()
+        self.assertEqual(result['errors'], expected['errors'])
+        self.assertEqual(result['warnings'], expected['warnings'])
+        self.assertEqual(len(result['errors']), 2)
+
+    def test_merged_invalid_ids_are_capped(self):
+        df = self.data['data']
+        self.set_ids(dict((i, 'x{}'.format(i)) for i in range(20)))
+        states = [self.validator.feed(self.validator.begin(self.data),
+                                      df.iloc[i:i + 4])
+                  for i in range(0, len(df.index), 4)]
+        state = states[0]
+        for other in states[1:]:
+            state = self.validator.merge(state, other)
+        self.assertEqual(state['n_invalid_ids'], 20)
+        self.assertEqual(len(state['invalid_ids']),
+                         self.validator.MAX_N_ERRORS_DISPLAYED + 1)
+        error = self.validator.finish(state, self.data).to_dict()['errors']
+        self.assertTrue(error[0].endswith('"x9", ....'))
+
+    def test_invalid_ids_in_excel_files(self):
+        self.set_ids({2: 'x', 5: 2.5})
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'test.xlsx')
+            codec = Codec.get('excel')
+            codec.store(self.data, file=path)
+            loaded = codec.load(file=path)
+            errors = self.validate(loaded)['errors']
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(
+            errors,
+            ['2 row(s) have an id that is not an integer: "x", "2.5".'])
+        self.assertEqual(loaded['data']['id'].iloc[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
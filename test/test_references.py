@@ -0,0 +1,101 @@
+""" test_references.py
+
+This module includes the tests of the referential consistency validator.
+
+"""
+
+import unittest
+import numpy as np
+from infocentre_data_manager.plugins.data_validators.base import \
+    DataValidator
+from test.data import make_data
+
+
+class ReferenceValidatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = make_data()
+        self.validator = DataValidator.get('references')
+
+    def validate(self):
+        return self.validator.validate(self.data)
+
+    def test_consistent_references(self):
+        result = self.validate()
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['warnings'], [])
+        self.assertEqual(result['info'], ['No problems found.'])
+
+    def test_unknown_variables(self):
+        self.data['sources'].loc[1, 'strata_variable'] = 'age'
+        self.data['notes'].loc[1, 'applyto_variable'] = 'rate'
+        errors = self.validate()['errors']
+        self.assertEqual(errors, [
+            'SOURCES: 1 row(s) with a "strata_variable" that is not a '
+            'variable of the table: "age" (rows 3).',
+            'NOTES: 1 row(s) with a "applyto_variable" that is not a '
+            'variable of the table: "rate" (rows 3).',
+        ])
+
+    def test_strata_values_are_matched_with_their_variable(self):
+        # "ESP" is a value of the data, but not of the variable "sex"
+        self.data['methods'].loc[0, ['strata_variable', 'strata_value']] = \
+            ['sex', 'ESP']
+        self.data['years'].loc[0, ['strata_variable', 'strata_value']] = \
+            ['iso', 'ESP']
+        errors = self.validate()['errors']
+        self.assertEqual(errors, [
+            'METHODS: 1 row(s) with a strata value that does not occur in '
+            'the data: "sex=ESP" (rows 2).',
+        ])
+
+    def test_strata_values_are_compared_as_text(self):
+        self.data['data']['value'] = np.arange(20) * 1.0
+        self.data['sources'].loc[1, ['strata_variable', 'strata_value']] = \
+            ['value', ' 3.0 ']
+        self.data['notes'].loc[1, ['strata_variable', 'strata_value']] = \
+            ['value', '3']
+        errors = self.validate()['errors']
+        self.assertEqual(errors, [
+            'NOTES: 1 row(s) with a strata value that does not occur in '
+            'the data: "value=3" (rows 3).',
+        ])
+
+    def test_invalid_strata_variables_are_only_reported_once(self):
+        self.data['sources'].loc[1, ['strata_variable', 'strata_value']] = \
+            ['age', '1']
+        errors = self.validate()['errors']
+        self.assertEqual(len(errors), 1)
+        self.assertIn('"strata_variable"', errors[0])
+
+    def test_unknown_isos(self):
+        self.data['sources'].loc[0, 'iso'] = 'ITA'
+        self.data['sources'].loc[1, 'iso'] = 'ITA'
+        self.data['dates'].loc[0, 'iso'] = 'PRT'
+        result = self.validate()
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['warnings'], [
+            'SOURCES: 2 row(s) with an iso that does not occur in the data: '
+            '"ITA" (rows 2, 3).',
+            'DATES: 1 row(s) with an iso that does not occur in the data: '
+            '"PRT" (rows 2).',
+        ])
+
+    def test_isos_without_iso_variable(self):
+        self.validator = DataValidator.get('references',
+                                           iso_variable='country')
+        self.data['sources'].loc[0, 'iso'] = 'ITA'
+        self.assertEqual(self.validate()['warnings'], [])
+
+    def test_invalid_values_are_capped(self):
+        sources = self.data['sources']
+        sources = sources.loc[[1] * 15].reset_index(drop=True)
+        sources['strata_value'] = ['X{:02d}'.format(i) for i in range(15)]
+        self.data['sources'] = sources
+        error = self.validate()['errors'][0]
+        self.assertTrue(error.startswith('SOURCES: 15 row(s)'))
+        self.assertTrue(error.endswith('"sex=X09" (rows 11), ....'))
+
+
+if __name__ == '__main__':
+    unittest.main()
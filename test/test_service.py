@@ -0,0 +1,161 @@
+""" test_service.py
+
+This module includes the tests of the validation service and its HTTP
+interface.
+
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+from infocentre_data_manager.plugins.codecs.base import Codec
+from infocentre_data_manager.service import ServiceBusy, \
+    ValidationService, _HTTPServer, _RequestHandler
+from test.data import make_data
+
+VALIDATORS = [{'name': 'basic'}, {'name': 'missing_values'},
+              {'name': 'primary_key'}]
+
+
+class ValidationServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = ValidationService(VALIDATORS, workers=1, timeout=0.05)
+
+    def test_validate(self):
+        results = self.service.validate(make_data())
+        self.assertEqual([result['type'] for result in results],
+                         ['Basic validator', 'Missing values validator',
+                          'Primary key validator'])
+        self.assertEqual([result['errors'] for result in results],
+                         [[], [], []])
+
+    def test_selected_validators(self):
+        data = make_data()
+        data['data'].loc[1, 'id'] = 1
+        results = self.service.validate(data, ['primary_key'])
+        self.assertEqual(len(results), 1)
+        self.assertEqual(len(results[0]['errors']), 1)
+        with self.assertRaises(ValueError):
+            self.service.validate(data, ['primary_key', 'type'])
+
+    def test_workers_are_reused(self):
+        first = self.service.validate(make_data(), structured=True)
+        second = self.service.validate(make_data(), structured=True)
+        self.assertEqual([result.to_dict() for result in first],
+                         [result.to_dict() for result in second])
+        self.assertEqual(self.service._pool.qsize(), 1)
+
+    def test_busy_service(self):
+        started = threading.Event()
+        release = threading.Event()
+        validator = self.service._pool.queue[0][0]
+        validate = validator.validate_structured
+
+        def slow_validate(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return validate(*args, **kwargs)
+
+        with mock.patch.object(validator, 'validate_structured',
+                               slow_validate):
+            thread = threading.Thread(target=self.service.validate,
+                                      args=(make_data(),))
+            thread.start()
+            try:
+                started.wait(5)
+                with self.assertRaises(ServiceBusy):
+                    self.service.validate(make_data())
+            finally:
+                release.set()
+                thread.join()
+        # The worker is free again
+        self.assertEqual(len(self.service.validate(make_data())), 3)
+
+
+class HTTPInterfaceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.service = ValidationService(VALIDATORS, workers=1)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_directory = os.path.join(self.directory, 'files')
+        os.mkdir(self.file_directory)
+        self.path = os.path.join(self.file_directory, 'table.xlsx')
+        Codec.get('excel').store(make_data(), file=self.path)
+
+        self.server = _HTTPServer(('127.0.0.1', 0), _RequestHandler)
+        self.server.service = self.service
+        self.server.file_directory = self.file_directory
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def post(self, body, content_type, url='/validate'):
+        conn = HTTPConnection(*self.server.server_address)
+        try:
+            conn.request('POST', url, body, {'Content-Type': content_type})
+            response = conn.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            conn.close()
+
+    def post_file(self, path):
+        return self.post(json.dumps({'file': path}), 'application/json')
+
+    def test_upload(self):
+        with open(self.path, 'rb') as excel_file:
+            status, content = self.post(
+                excel_file.read(), 'application/octet-stream',
+                '/validate?validators=basic,primary_key')
+        self.assertEqual(status, 200)
+        self.assertEqual([result['type'] for result in content['results']],
+                         ['Basic validator', 'Primary key validator'])
+        self.assertEqual(content['errors'], 0)
+
+    def test_files_in_the_directory(self):
+        for path in ['table.xlsx', self.path]:
+            with self.subTest(path=path):
+                status, content = self.post_file(path)
+                self.assertEqual(status, 200)
+                self.assertEqual(len(content['results']), 3)
+
+    def test_files_outside_the_directory(self):
+        outside = os.path.join(self.directory, 'outside.xlsx')
+        shutil.copy(self.path, outside)
+        os.symlink(outside, os.path.join(self.file_directory, 'link.xlsx'))
+        for path in [outside, '../outside.xlsx', 'link.xlsx', '/etc/passwd']:
+            with self.subTest(path=path):
+                status, content = self.post_file(path)
+                self.assertEqual(status, 403)
+                self.assertEqual(content['error'], 'The file is not in the '
+                                                   'directory of the service')
+
+    def test_files_without_directory(self):
+        self.server.file_directory = None
+        status, content = self.post_file(self.path)
+        self.assertEqual(status, 403)
+        self.assertIn('upload the workbook', content['error'])
+
+    def test_invalid_requests(self):
+        status, _ = self.post(json.dumps({'path': 'table.xlsx'}),
+                              'application/json')
+        self.assertEqual(status, 400)
+        status, _ = self.post(b'', 'application/octet-stream', '/other')
+        self.assertEqual(status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+""" test_sqlite.py
+
+This module includes the round trip tests of the SQLite and DuckDB codecs.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from infocentre_data_manager.plugins.codecs.base import Codec
+from test.data import make_data
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+class SQLiteCodecTest(unittest.TestCase):
+
+    codec_name = 'sqlite'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.db')
+        self.codec = Codec.get(self.codec_name)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_data(self, n_rows=20, table_name='hpv_m1_test'):
+        data = make_data(n_rows, table_name)
+        # -9999 dates are stored as missing
+        data['dates']['date_published'] = ['2018-03-01']
+        return data
+
+    def assertSameData(self, loaded, data):
+        self.assertEqual(sorted(loaded), sorted(data))
+        for key, df in data.items():
+            loaded_df = loaded[key]
+            self.assertEqual(sorted(loaded_df.columns), sorted(df.columns),
+                             key)
+            # Values are compared as text, columns can be typed
+            self.assertEqual(
+                loaded_df[list(df.columns)].astype(str).values.tolist(),
+                df.astype(str).values.tolist(),
+                key)
+
+    def test_round_trip(self):
+        data = self.make_data()
+        self.codec.store(data, file=self.path)
+        self.assertSameData(self.codec.load(file=self.path,
+                                            table='hpv_m1_test'),
+                            data)
+
+    def test_store_twice(self):
+        data = self.make_data()
+        self.codec.store(data, file=self.path)
+        self.codec.store(data, file=self.path)
+        self.assertSameData(self.codec.load(file=self.path,
+                                            table='hpv_m1_test'),
+                            data)
+        for ref_type in ['sources', 'notes', 'methods', 'years']:
+            n_refs = self.codec.query(
+                'SELECT COUNT(*) AS n FROM ref_{}_by'.format(ref_type),
+                file=self.path)['n'].iloc[0]
+            self.assertEqual(n_refs, 2, ref_type)
+
+    def test_replace_table(self):
+        self.codec.store(self.make_data(20), file=self.path)
+        data = self.make_data(6)
+        data['general']['contents'] = ['New contents']
+        data['variables'].loc[2, 'description'] = 'Gender'
+        data['sources'] = data['sources'].iloc[:1]
+        self.codec.store(data, file=self.path)
+        self.assertSameData(self.codec.load(file=self.path,
+                                            table='hpv_m1_test'),
+                            data)
+
+    def test_several_tables(self):
+        first = self.make_data(20, 'hpv_m1_first')
+        second = self.make_data(10, 'hpv_m2_second')
+        self.codec.store(first, file=self.path)
+        self.codec.store(second, file=self.path)
+        self.codec.store(first, file=self.path)
+        self.assertSameData(self.codec.load(file=self.path,
+                                            table='hpv_m1_first'),
+                            first)
+        self.assertSameData(self.codec.load(file=self.path,
+                                            table='hpv_m2_second',
+                                            lazy=False),
+                            second)
+
+    def test_store_loaded_data(self):
+        data = self.make_data()
+        self.codec.store(data, file=self.path)
+        loaded = self.codec.load(file=self.path, table='hpv_m1_test')
+        loaded.load_all()
+        self.codec.store(dict(loaded), file=self.path)
+        self.assertSameData(self.codec.load(file=self.path,
+                                            table='hpv_m1_test'),
+                            data)
+
+
+@unittest.skipIf(duckdb is None, 'duckdb is not installed')
+class DuckDBCodecTest(SQLiteCodecTest):
+
+    codec_name = 'duckdb'
+
+
+if __name__ == '__main__':
+    unittest.main()
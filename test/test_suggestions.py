@@ -0,0 +1,82 @@
+""" test_suggestions.py
+
+This module includes the tests of the index that suggests valid values for
+invalid ones.
+
+"""
+
+import unittest
+from infocentre_data_manager.plugins.semantic_types.suggestions import \
+    SuggestionIndex, _edit_distance, normalize_key
+
+COUNTRIES = ['Spain', 'France', 'Italy', 'Portugal', 'Germany', 'Guinea',
+             'Guyana', 'Ghana', 'Gambia', 'Panama']
+
+
+class SuggestionIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SuggestionIndex(COUNTRIES)
+
+    def test_normalize_key(self):
+        self.assertEqual(normalize_key(' E.S.P. '), 'esp')
+        self.assertEqual(normalize_key('age_group'), 'agegroup')
+        self.assertEqual(normalize_key(15), '15')
+
+    def test_same_key_is_suggested_first(self):
+        index = SuggestionIndex(['ESP', 'esp.', 'ESQ'])
+        self.assertEqual(index.suggest('Esp', n=3), ['ESP', 'esp.'])
+        self.assertEqual(self.index.suggest('SPAIN'), ['Spain'])
+
+    def test_edit_distance_ranking(self):
+        # Guyana and Ghana are one edit away (Guyana shares more
+        # trigrams), Guinea two
+        self.assertEqual(self.index.suggest('Guana', n=5),
+                         ['Guyana', 'Ghana', 'Guinea'])
+        # Guinea is three edits away
+        self.assertEqual(self.index.suggest('Guyanna', n=2), ['Guyana'])
+
+    def test_transpositions_count_once(self):
+        self.assertEqual(_edit_distance('spian', 'spain', 2), 1)
+        self.assertEqual(_edit_distance('ca', 'abc', 3), 3)
+        self.assertEqual(self.index.suggest('Spian'), ['Spain'])
+        self.assertEqual(self.index.suggest('Fracne'), ['France'])
+
+    def test_ties_are_ranked_by_shared_trigrams(self):
+        index = SuggestionIndex(['abcdx', 'xbcde'])
+        # Both at distance 1, 'abcdx' shares the leading trigrams
+        self.assertEqual(index.suggest('abcde', n=2), ['abcdx', 'xbcde'])
+
+    def test_maximum_distance(self):
+        # Short keys allow a single edit by default
+        index = SuggestionIndex(['ESP', 'FRA'])
+        self.assertEqual(index.suggest('ESX'), ['ESP'])
+        self.assertEqual(index.suggest('EXX'), [])
+        self.assertEqual(self.index.suggest('Portugl'), ['Portugal'])
+        self.assertEqual(self.index.suggest('Prtgl'), [])
+        index = SuggestionIndex(COUNTRIES, max_distance=3)
+        self.assertEqual(index.suggest('Prtgl'), ['Portugal'])
+
+    def test_number_of_suggestions(self):
+        suggestions = self.index.suggest('Gana', n=3)
+        self.assertEqual(suggestions[0], 'Ghana')
+        self.assertLessEqual(len(suggestions), 3)
+        self.assertEqual(self.index.suggest('Gana', n=1), ['Ghana'])
+
+    def test_no_suggestions(self):
+        self.assertEqual(self.index.suggest('Zzzzzz'), [])
+        self.assertEqual(self.index.suggest(''), [])
+        self.assertEqual(self.index.suggest('...'), [])
+
+    def test_custom_normalization(self):
+        index = SuggestionIndex(['ESP', 'esp'], normalize=str)
+        self.assertEqual(index.suggest('esp'), ['esp'])
+        self.assertEqual(len(index), 2)
+
+    def test_values_without_key_are_ignored(self):
+        index = SuggestionIndex(['-', '', 'ESP'])
+        self.assertEqual(len(index), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
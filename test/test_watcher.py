@@ -0,0 +1,127 @@
+""" test_watcher.py
+
+This module includes the tests of the folder watcher.
+
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from infocentre_data_manager.plugins.codecs.base import Codec
+from infocentre_data_manager.watcher import FolderWatcher
+from test.data import make_data
+
+# The type validator loads the ISO codes from the database
+VALIDATORS = [{'name': 'basic'}, {'name': 'missing_values'},
+              {'name': 'primary_key'}]
+
+
+class FolderWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal = os.path.join(self.directory, 'journal.jsonl')
+        self.path = os.path.join(self.directory, 'hpv_m1_test.xlsx')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def watcher(self, **kwargs):
+        return FolderWatcher(self.directory, VALIDATORS, journal=self.journal,
+                             workers=1, **kwargs)
+
+    def journal_entries(self):
+        with open(self.journal) as journal:
+            return [json.loads(line) for line in journal]
+
+    def test_process(self):
+        Codec.get('excel').store(make_data(), file=self.path)
+        watcher = self.watcher()
+        entry = watcher.process(self.path)
+        self.assertEqual(entry['status'], 'valid')
+        self.assertEqual(entry['table_name'], 'hpv_m1_test')
+        self.assertEqual(entry['errors'], 0)
+        self.assertEqual(sorted(entry['timings']), ['load', 'validate'])
+        self.assertEqual(self.journal_entries()[0]['status'], 'valid')
+        # Kept for the incremental validation of the next submission
+        self.assertIsNotNone(watcher._get_snapshot('hpv_m1_test'))
+
+    def test_process_invalid_file(self):
+        data = make_data()
+        data['data'].loc[3, 'id'] = 2
+        Codec.get('excel').store(data, file=self.path)
+        entry = self.watcher().process(self.path)
+        self.assertEqual(entry['status'], 'invalid')
+        self.assertGreater(entry['errors'], 0)
+
+    def test_process_unreadable_file(self):
+        with open(self.path, 'w') as f:
+            f.write('Not a workbook')
+        entry = self.watcher().process(self.path)
+        self.assertEqual(entry['status'], 'failed')
+        self.assertIn('(load)', entry['error'])
+        self.assertEqual(self.journal_entries()[0]['status'], 'failed')
+
+    def test_files_are_queued_once_they_settle(self):
+        watcher = self.watcher(settle_seconds=0)
+        with open(self.path, 'w') as f:
+            f.write('1')
+        watcher._pending[self.path] = (None, None)
+        watcher._check_pending()
+        self.assertTrue(watcher._queue.empty())
+        watcher._check_pending()
+        self.assertEqual(watcher._queue.get_nowait(), self.path)
+        self.assertEqual(watcher._pending, {})
+        # Unchanged files are not queued again
+        watcher._pending[self.path] = (None, None)
+        watcher._check_pending()
+        watcher._check_pending()
+        self.assertTrue(watcher._queue.empty())
+
+    def test_changing_files_are_not_queued(self):
+        watcher = self.watcher(settle_seconds=60)
+        with open(self.path, 'w') as f:
+            f.write('1')
+        watcher._pending[self.path] = (None, None)
+        watcher._check_pending()
+        watcher._check_pending()
+        self.assertTrue(watcher._queue.empty())
+        self.assertIn(self.path, watcher._pending)
+
+    def test_deleted_files_are_forgotten(self):
+        watcher = self.watcher(settle_seconds=0)
+        with open(self.path, 'w') as f:
+            f.write('1')
+        watcher._pending[self.path] = (None, None)
+        watcher._check_pending()
+        watcher._check_pending()
+        self.assertIn(self.path, watcher._processed)
+        signature = watcher._processed[self.path]
+        os.remove(self.path)
+        watcher._pending[self.path] = (None, None)
+        watcher._check_pending()
+        self.assertEqual(watcher._processed, {})
+        self.assertEqual(watcher._pending, {})
+        # A file with the same name and signature is processed again
+        with open(self.path, 'w') as f:
+            f.write('1')
+        os.utime(self.path, (signature[1], signature[1]))
+        watcher._pending[self.path] = (None, None)
+        watcher._check_pending()
+        watcher._check_pending()
+        self.assertEqual(watcher._queue.qsize(), 2)
+
+    def test_existing_files_can_be_skipped(self):
+        with open(self.path, 'w') as f:
+            f.write('1')
+        watcher = self.watcher(settle_seconds=0, process_existing=False)
+        watcher._pending[self.path] = (None, None)
+        watcher._check_pending()
+        watcher._check_pending()
+        self.assertTrue(watcher._queue.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()